@@ -0,0 +1,25 @@
+import os
+
+
+def setup_django(database_name=None):
+    """Configure Django and create a throwaway test database; returns a teardown callable
+
+    database_name puts the test database in that file instead of the backend's default
+    (in memory for SQLite), for benchmarks where connection setup and disk I/O matter.
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'expense_splitter.settings')
+    import django
+    django.setup()
+
+    if database_name:
+        from django.db import connections
+        connections['default'].settings_dict['TEST']['NAME'] = database_name
+
+    from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+
+    def teardown():
+        teardown_databases(old_config, verbosity=0)
+        teardown_test_environment()
+    return teardown
@@ -0,0 +1,305 @@
+"""Latency, query-count and memory benchmarks for every split_expense endpoint.
+
+    python -m benchmarks.api run --users 500 --groups 50 --expenses 20000 --output bench.json
+    python -m benchmarks.api compare baseline.json bench.json --threshold 0.2
+
+`run` builds a synthetic dataset in a throwaway test database, drives each URL in
+split_expense/urls.py through the Django test client and writes per-scenario
+p50/p95/p99 latency, queries per request and peak traced memory as JSON.
+`compare` exits non-zero when a scenario's p95 grows by more than the threshold
+or it issues more queries than before.
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from benchmarks import setup_django
+from benchmarks.datagen import BENCH_PASSWORD, DISTRIBUTIONS, generate
+
+# Scenarios that hash passwords are orders of magnitude slower; run them less often
+SLOW_SCENARIO_ITERATIONS = 5
+MEMORY_ITERATIONS = 3
+
+
+@dataclass
+class Scenario:
+    name: str
+    prepare: object  # callable(iteration) -> callable() that performs exactly one request
+    iterations: int = None
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def build_scenarios(dataset):
+    from django.contrib.auth.models import User
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+    from rest_framework_simplejwt.tokens import RefreshToken
+    from split_expense.models import ExpenseGroup
+    from split_expense.views import _add_expense
+
+    user = dataset.primary_user
+    refresh = RefreshToken.for_user(user)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+    anonymous = APIClient()
+    admin = User.objects.create_user(username='bench-admin', password=BENCH_PASSWORD, is_staff=True)
+    admin_client = APIClient()
+    admin_client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(admin).access_token}')
+
+    group_id = dataset.largest_group_id
+    members = list(User.objects.filter(id__in=dataset.members[group_id]).values_list('username', flat=True))
+    outsider = User.objects.create_user(username='bench-outsider', password=BENCH_PASSWORD)
+
+    def url(name, **kwargs):
+        return reverse(name, kwargs=kwargs)
+
+    def scratch_group(i):
+        group = ExpenseGroup.objects.create(name=f'Scratch {i}-{time.perf_counter_ns()}')
+        group.members.add(user)
+        return group
+
+    def scratch_expense(i):
+        # Through the views' helper, so the ledger and change log stay consistent
+        data = {'description': f'Scratch {i}', 'amount': '10.00', 'split_type': 'custom', 'contributions': [{'username': user.username, 'amount': '10.00'}]}
+        new_expense, _ = _add_expense(ExpenseGroup.objects.get(id=group_id), user, data)
+        return new_expense
+
+    def join(i):
+        group = scratch_group(i)
+        return lambda: client.post(url('join_group', group_id=group.id), {'usernames': [outsider.username]}, format='json')
+
+    def remove_member(i):
+        group = scratch_group(i)
+        group.members.add(outsider)
+        return lambda: client.patch(url('edit_group_members', group_id=group.id), {'action': 'remove', 'usernames': [outsider.username]}, format='json')
+
+    def delete_group(i):
+        group = scratch_group(i)
+        return lambda: client.delete(url('edit_or_delete_group', group_id=group.id))
+
+    def edit_expense(i):
+        target = scratch_expense(i)
+        data = {'description': 'Edited', 'amount': '12.00', 'split_type': 'equal'}
+        return lambda: client.patch(url('edit_or_delete_expense', group_id=group_id, expense_id=target.id), data, format='json')
+
+    def delete_expense(i):
+        target = scratch_expense(i)
+        return lambda: client.delete(url('edit_or_delete_expense', group_id=group_id, expense_id=target.id))
+
+    def bulk_import(i):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        rows = '\n'.join(['description,amount,split_type,paid_by,contributions'] + [f'Imported {n},10.00,equal,,' for n in range(100)])
+        upload = SimpleUploadedFile('expenses.csv', rows.encode(), content_type='text/csv')
+        return lambda: client.post(url('bulk_import_expenses', group_id=group_id), {'file': upload}, format='multipart')
+
+    def export(file_format):
+        def request():
+            response = client.get(url('export_expenses', group_id=group_id), {'file_format': file_format})
+            # The export streams; the request isn't done until its content has been read
+            b''.join(response.streaming_content)
+            return response
+        return lambda i: request
+
+    def sync(i):
+        cursor = client.get(url('sync_changes')).data['cursor']
+        for n in range(10):
+            scratch_expense(f'{i}-{n}')
+        return lambda: client.get(url('sync_changes'), {'since': cursor})
+
+    batch_operations = [{'op': 'create_group', 'name': 'Batch', 'ref': 'group'}] + [
+        {'op': 'add_expense', 'group': 'group', 'description': f'Batch {n}', 'amount': '12.00', 'split_type': 'equal'} for n in range(50)
+    ]
+
+    def batch(i):
+        operations = [{**batch_operations[0], 'name': f'Batch {i}-{time.perf_counter_ns()}'}, *batch_operations[1:]]
+        return lambda: client.post(url('batch'), {'operations': operations}, format='json')
+
+    custom_split = {
+        'description': 'Bench custom',
+        'amount': f'{len(members)}.00',
+        'split_type': 'custom',
+        'contributions': [{'username': username, 'amount': '1.00'} for username in members],
+    }
+
+    return [
+        Scenario('register', lambda i: lambda: anonymous.post(url('register'), {'username': f'bench-new-{i}-{time.perf_counter_ns()}', 'email': 'new@example.com', 'password': BENCH_PASSWORD}, format='json'), SLOW_SCENARIO_ITERATIONS),
+        Scenario('login', lambda i: lambda: anonymous.post(url('token_obtain_pair'), {'username': user.username, 'password': BENCH_PASSWORD}, format='json'), SLOW_SCENARIO_ITERATIONS),
+        Scenario('token_refresh', lambda i: lambda: anonymous.post(url('token_refresh'), {'refresh': str(RefreshToken.for_user(user))}, format='json')),
+        Scenario('groups_list', lambda i: lambda: client.get(url('groups'))),
+        Scenario('groups_create', lambda i: lambda: client.post(url('groups'), {'name': f'Created {i}-{time.perf_counter_ns()}'}, format='json')),
+        Scenario('join_group', join),
+        Scenario('expenses_list', lambda i: lambda: client.get(url('manage_expenses', group_id=group_id))),
+        Scenario('expenses_create_equal', lambda i: lambda: client.post(url('manage_expenses', group_id=group_id), {'description': 'Bench equal', 'amount': '30.00', 'split_type': 'equal'}, format='json')),
+        Scenario('expenses_create_custom', lambda i: lambda: client.post(url('manage_expenses', group_id=group_id), custom_split, format='json')),
+        Scenario('expenses_bulk_import_100', bulk_import, SLOW_SCENARIO_ITERATIONS),
+        Scenario('group_summary', lambda i: lambda: client.get(url('group_summary', group_id=group_id))),
+        Scenario('settle_plan', lambda i: lambda: client.get(url('settle_plan', group_id=group_id))),
+        Scenario('group_stats', lambda i: lambda: client.get(url('group_stats', group_id=group_id))),
+        Scenario('export_csv', export('csv'), SLOW_SCENARIO_ITERATIONS),
+        Scenario('export_ndjson', export('ndjson'), SLOW_SCENARIO_ITERATIONS),
+        Scenario('fetch_users', lambda i: lambda: client.get(url('fetch_users'))),
+        # A different prefix each time, so pages aren't served from the in-process LRU
+        Scenario('search_users', lambda i: lambda: client.get(url('fetch_users'), {'q': f'BENCH{i}'})),
+        Scenario('group_members', lambda i: lambda: client.get(url('group_members', group_id=group_id))),
+        Scenario('edit_group_members', remove_member),
+        Scenario('edit_group', lambda i: lambda: client.patch(url('edit_or_delete_group', group_id=group_id), {'name': f'Renamed {i}'}, format='json')),
+        Scenario('delete_group', delete_group),
+        Scenario('edit_expense', edit_expense),
+        Scenario('delete_expense', delete_expense),
+        Scenario('overall_balance_summary', lambda i: lambda: client.get(url('overall_balance_summary'))),
+        Scenario('batch_50_expenses', batch),
+        Scenario('sync_10_changes', sync),
+        Scenario('cache_statistics', lambda i: lambda: admin_client.get(url('cache_statistics'))),
+        Scenario('metrics', lambda i: lambda: admin_client.get(url('metrics'))),
+    ]
+
+
+def measure(scenario, iterations):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    timings = []
+    queries = []
+    statuses = set()
+    for i in range(scenario.iterations or iterations):
+        request = scenario.prepare(i)
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            response = request()
+            timings.append(time.perf_counter() - start)
+        queries.append(len(captured))
+        statuses.add(response.status_code)
+
+    # Memory is traced in a separate pass because tracemalloc distorts timings
+    tracemalloc.start()
+    peak = 0
+    for i in range(MEMORY_ITERATIONS):
+        request = scenario.prepare(len(timings) + i)
+        tracemalloc.reset_peak()
+        request()
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+    tracemalloc.stop()
+
+    timings.sort()
+    return {
+        'iterations': len(timings),
+        'status_codes': sorted(statuses),
+        'p50_ms': round(percentile(timings, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(timings, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(timings, 0.99) * 1000, 3),
+        'mean_ms': round(sum(timings) / len(timings) * 1000, 3),
+        'queries': max(queries),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    teardown = setup_django()
+    try:
+        from django.db import connection
+
+        start = time.perf_counter()
+        dataset = generate(args.users, args.groups, args.expenses, args.min_members, args.max_members, args.distribution, args.seed)
+        print(f'generated dataset in {time.perf_counter() - start:.1f} s', file=sys.stderr)
+
+        results = {}
+        for scenario in build_scenarios(dataset):
+            if args.only and scenario.name not in args.only:
+                continue
+            results[scenario.name] = measure(scenario, args.iterations)
+            r = results[scenario.name]
+            print(f"{scenario.name:<26} p50={r['p50_ms']:8.2f} ms  p95={r['p95_ms']:8.2f} ms  p99={r['p99_ms']:8.2f} ms  "
+                  f"queries={r['queries']:>3}  peak={r['peak_kb']:9.1f} KiB  status={r['status_codes']}", file=sys.stderr)
+
+        report = {
+            'meta': {
+                'commit': current_commit(),
+                'timestamp': datetime.now(timezone.utc).isoformat(),
+                'database': connection.vendor,
+                'dataset': {key: getattr(args, key) for key in ['users', 'groups', 'expenses', 'min_members', 'max_members', 'distribution', 'seed']},
+                'iterations': args.iterations,
+            },
+            'scenarios': results,
+        }
+    finally:
+        teardown()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)['scenarios']
+    with open(args.candidate) as f:
+        candidate = json.load(f)['scenarios']
+
+    regressions = []
+    for name in sorted(set(baseline) & set(candidate)):
+        old, new = baseline[name], candidate[name]
+        change = (new['p95_ms'] - old['p95_ms']) / old['p95_ms'] if old['p95_ms'] else 0
+        flags = []
+        if change > args.threshold:
+            flags.append(f'p95 +{change:.0%}')
+        if new['queries'] > old['queries']:
+            flags.append(f"queries {old['queries']} -> {new['queries']}")
+        print(f"{name:<26} p95 {old['p95_ms']:8.2f} -> {new['p95_ms']:8.2f} ms ({change:+.0%})  "
+              f"queries {old['queries']:>3} -> {new['queries']:>3}  {'REGRESSION: ' + ', '.join(flags) if flags else ''}")
+        if flags:
+            regressions.append(name)
+
+    if regressions:
+        print(f'\n{len(regressions)} scenario(s) regressed beyond {args.threshold:.0%}: {", ".join(regressions)}')
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='Run the scenarios and write JSON results')
+    run_parser.add_argument('--users', type=int, default=200)
+    run_parser.add_argument('--groups', type=int, default=20)
+    run_parser.add_argument('--expenses', type=int, default=5000)
+    run_parser.add_argument('--min-members', type=int, default=2)
+    run_parser.add_argument('--max-members', type=int, default=50)
+    run_parser.add_argument('--distribution', choices=DISTRIBUTIONS, default='uniform')
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--iterations', type=int, default=50)
+    run_parser.add_argument('--only', nargs='+', help='Only run these scenarios')
+    run_parser.add_argument('--output', help='Write results to this file instead of stdout')
+    run_parser.set_defaults(handler=run)
+
+    compare_parser = commands.add_parser('compare', help='Compare two result files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('candidate')
+    compare_parser.add_argument('--threshold', type=float, default=0.2, help='Allowed relative p95 increase (default 0.2)')
+    compare_parser.set_defaults(handler=compare)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""Concurrency benchmark of the read endpoints under uvicorn, sync views vs their async variants.
+
+    pip install uvicorn
+    python -m benchmarks.asgi --concurrency 1 16 64 --requests 400 --db-latency-ms 2
+
+Starts uvicorn in-process on the ASGI application twice, once routing the read
+endpoints to the sync views (expense_splitter.urls) and once to the async views
+(expense_splitter.asgi_urls), and drives each with keep-alive clients at the
+given concurrency levels. SQLite answers from memory, so --db-latency-ms adds a
+simulated network round trip to every query to approximate a database server.
+"""
+import argparse
+import asyncio
+import json
+import socket
+import sys
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.locmem import LocMemCache
+
+from benchmarks import setup_django
+from benchmarks.api import percentile
+from benchmarks.datagen import DISTRIBUTIONS, generate
+
+MODES = {
+    'sync': 'expense_splitter.urls',
+    'async': 'expense_splitter.asgi_urls',
+}
+
+
+class VersionsOnlyCache(LocMemCache):
+    """Keeps the group version counters but never stores responses, so every request does its database work"""
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        if key.startswith('group-version:'):
+            super().set(key, value, timeout, version)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port):
+    import uvicorn
+    from django.core.asgi import get_asgi_application
+
+    config = uvicorn.Config(get_asgi_application(), host='127.0.0.1', port=port, log_level='warning', lifespan='off')
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, thread
+
+
+async def fetch(reader, writer, path, token, method='GET', body=b''):
+    writer.write(
+        f'{method} {path} HTTP/1.1\r\nHost: testserver\r\nAuthorization: Bearer {token}\r\n'
+        f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n'.encode() + body
+    )
+    await writer.drain()
+    head = await reader.readuntil(b'\r\n\r\n')
+    status_code = int(head.split(b' ', 2)[1])
+    headers = dict(line.split(b':', 1) for line in head.lower().split(b'\r\n')[1:] if b':' in line)
+    if b'content-length' in headers:
+        await reader.readexactly(int(headers[b'content-length']))
+    else:
+        # Chunked transfer encoding
+        while size := int((await reader.readuntil(b'\r\n')).strip(), 16):
+            await reader.readexactly(size + 2)
+        await reader.readuntil(b'\r\n')
+    return status_code
+
+
+async def load(port, path, token, concurrency, requests):
+    timings = []
+    statuses = set()
+    remaining = iter(range(requests))
+
+    async def client():
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        try:
+            for _ in remaining:
+                start = time.perf_counter()
+                statuses.add(await fetch(reader, writer, path, token))
+                timings.append(time.perf_counter() - start)
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    timings.sort()
+    return {
+        'requests_per_second': round(requests / elapsed, 1),
+        'p50_ms': round(percentile(timings, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(timings, 0.95) * 1000, 3),
+        'status_codes': sorted(statuses),
+    }
+
+
+def add_db_latency(seconds):
+    """Delay every query on every connection opened from now on by `seconds`"""
+    from django.db.backends.signals import connection_created
+
+    def delay(execute, sql, params, many, context):
+        time.sleep(seconds)
+        return execute(sql, params, many, context)
+
+    def install(sender, connection, **kwargs):
+        connection.execute_wrappers.append(delay)
+
+    connection_created.connect(install, weak=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--groups', type=int, default=20)
+    parser.add_argument('--expenses', type=int, default=5000)
+    parser.add_argument('--max-members', type=int, default=50)
+    parser.add_argument('--distribution', choices=DISTRIBUTIONS, default='uniform')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 16, 64])
+    parser.add_argument('--requests', type=int, default=400, help='Requests per endpoint and concurrency level')
+    parser.add_argument('--db-latency-ms', type=float, default=2.0)
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    args = parser.parse_args()
+
+    teardown = setup_django()
+    try:
+        from django.test.utils import override_settings
+        from django.urls import reverse
+        from rest_framework_simplejwt.tokens import RefreshToken
+
+        dataset = generate(args.users, args.groups, args.expenses, max_members=args.max_members, distribution=args.distribution)
+        token = str(RefreshToken.for_user(dataset.primary_user).access_token)
+        group_id = dataset.largest_group_id
+        paths = {
+            'groups': reverse('groups'),
+            'group_summary': reverse('group_summary', kwargs={'group_id': group_id}),
+            'group_members': reverse('group_members', kwargs={'group_id': group_id}),
+            'overall_balance_summary': reverse('overall_balance_summary'),
+        }
+        add_db_latency(args.db_latency_ms / 1000)
+
+        results = {}
+        for mode, urlconf in MODES.items():
+            with override_settings(ROOT_URLCONF=urlconf, CACHES={'default': {'BACKEND': 'benchmarks.asgi.VersionsOnlyCache'}}):
+                port = free_port()
+                server, thread = start_server(port)
+                try:
+                    for name, path in paths.items():
+                        for concurrency in args.concurrency:
+                            result = asyncio.run(load(port, path, token, concurrency, args.requests))
+                            results.setdefault(name, {}).setdefault(str(concurrency), {})[mode] = result
+                            print(f"{mode:<6} {name:<24} c={concurrency:<4} {result['requests_per_second']:8.1f} req/s  "
+                                  f"p50={result['p50_ms']:8.2f} ms  p95={result['p95_ms']:8.2f} ms  status={result['status_codes']}", file=sys.stderr)
+                finally:
+                    server.should_exit = True
+                    thread.join()
+    finally:
+        teardown()
+
+    print(f"\n{'endpoint':<24} {'conc':>5} {'sync req/s':>11} {'async req/s':>12} {'gain':>7}")
+    for name, levels in results.items():
+        for concurrency, modes in levels.items():
+            sync_rps, async_rps = modes['sync']['requests_per_second'], modes['async']['requests_per_second']
+            print(f'{name:<24} {concurrency:>5} {sync_rps:>11.1f} {async_rps:>12.1f} {async_rps / sync_rps:>6.2f}x')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'parameters': vars(args), 'results': results}, f, indent=2)
+            f.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Time a bulk CSV import through the bulk expenses endpoint.
+
+    python -m benchmarks.bulk_import --rows 100000
+"""
+import argparse
+import random
+import time
+
+from benchmarks import setup_django
+
+
+def build_csv(rows, usernames, seed=0):
+    rng = random.Random(seed)
+    lines = ['description,amount,split_type,paid_by,contributions']
+    for i in range(rows):
+        if i % 2:
+            lines.append(f'Expense {i},{rng.randint(1, 10_000) / 100:.2f},equal,{rng.choice(usernames)},')
+        else:
+            first, second = rng.sample(usernames, 2)
+            lines.append(f'Expense {i},30.00,custom,,{first}:10.00;{second}:20.00')
+    return '\n'.join(lines).encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--members', type=int, default=10)
+    args = parser.parse_args()
+
+    teardown = setup_django()
+    try:
+        from django.contrib.auth.models import User
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from django.urls import reverse
+        from rest_framework.test import APIClient
+        from split_expense.models import ExpenseGroup
+
+        users = [User.objects.create(username=f'member{i}') for i in range(args.members)]
+        group = ExpenseGroup.objects.create(name='Bulk import')
+        group.members.add(*users)
+
+        client = APIClient()
+        client.force_authenticate(users[0])
+        upload = SimpleUploadedFile('expenses.csv', build_csv(args.rows, [u.username for u in users]), content_type='text/csv')
+
+        start = time.perf_counter()
+        response = client.post(reverse('bulk_import_expenses', kwargs={'group_id': group.id}), {'file': upload})
+        elapsed = time.perf_counter() - start
+        print(f'rows={args.rows} status={response.status_code} created={response.data["created"]} '
+              f'errors={len(response.data["errors"])} elapsed={elapsed:.2f} s ({args.rows / elapsed:,.0f} rows/s)')
+    finally:
+        teardown()
+
+
+if __name__ == '__main__':
+    main()
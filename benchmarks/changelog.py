@@ -0,0 +1,105 @@
+"""Expense write throughput of concurrent writers in separate groups, with and without the change log.
+
+    python -m benchmarks.changelog --writers 1 8 32 --writes 100 --db-latency-ms 2
+
+Every writer thread adds expenses to its own group through the API, so the only
+row they share is the change log's counter (ChangeSequence), which each write
+locks until it commits. Running the same load with the log switched off shows
+what that lock costs. SQLite takes one database-wide write lock per transaction,
+so the writers queue either way; run it against MySQL (MYSQL_DATABASE etc.) to
+measure the counter itself. --db-latency-ms adds a simulated network round trip
+to every query, which the lock holder pays while the other writers wait.
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from benchmarks import setup_django
+from benchmarks.api import percentile
+from benchmarks.asgi import add_db_latency
+
+
+def write(group, user, writes, timings, start):
+    from django.db import connection
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+
+    client = APIClient()
+    client.force_authenticate(user)
+    url = reverse('manage_expenses', kwargs={'group_id': group.id})
+    start.wait()
+    try:
+        for i in range(writes):
+            began = time.perf_counter()
+            response = client.post(url, {'description': f'Expense {i}', 'amount': '30.00', 'split_type': 'equal'}, format='json')
+            timings.append(time.perf_counter() - began)
+            assert response.status_code == 201, response.content
+    finally:
+        connection.close()
+
+
+def run(writers, writes):
+    """Time `writers` threads each adding `writes` expenses to its own group; returns (writes/s, p50, p95)"""
+    from django.contrib.auth.models import User
+    from split_expense.models import ExpenseGroup
+
+    timings = []
+    start = threading.Barrier(writers + 1)
+    threads = []
+    for i in range(writers):
+        user, _ = User.objects.get_or_create(username=f'writer{i}')
+        group = ExpenseGroup.objects.create(name=f'Writer {i}')
+        group.members.add(user)
+        threads.append(threading.Thread(target=write, args=(group, user, writes, timings, start)))
+    for thread in threads:
+        thread.start()
+    start.wait()
+    began = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - began
+    timings.sort()
+    return writers * writes / elapsed, percentile(timings, 0.5), percentile(timings, 0.95)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--writers', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--writes', type=int, default=100, help='Expenses added by each writer')
+    parser.add_argument('--db-latency-ms', type=float, default=2.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Threads need a shared database, which SQLite keeps in memory only per connection
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'expense_splitter.settings')
+        from django.conf import settings
+        sqlite = settings.DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3'
+        teardown = setup_django(os.path.join(directory, 'changelog.sqlite3') if sqlite else None)
+        try:
+            from django.db import connections
+            from split_expense.models import ChangeManager
+            if sqlite:
+                # Queue writers on the busy timeout instead of failing, as the production profile does
+                connections['default'].settings_dict['OPTIONS'].update({'timeout': 60, 'transaction_mode': 'IMMEDIATE'})
+                connections['default'].close()
+            if args.db_latency_ms:
+                add_db_latency(args.db_latency_ms / 1000)
+
+            print(f'{"writers":>8} {"change log":>11} {"writes/s":>9} {"p50 ms":>8} {"p95 ms":>8}')
+            for writers in args.writers:
+                for logged in (True, False):
+                    if logged:
+                        throughput, p50, p95 = run(writers, args.writes)
+                    else:
+                        with mock.patch.object(ChangeManager, '_append'):
+                            throughput, p50, p95 = run(writers, args.writes)
+                    print(f'{writers:>8} {"on" if logged else "off":>11} {throughput:>9,.0f} {p50 * 1000:>8.1f} {p95 * 1000:>8.1f}')
+        finally:
+            teardown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Time ledger drift checks and rebuilds for one long-lived group, reading the whole history versus starting from a checkpoint.
+
+    python -m benchmarks.checkpoints --contributions 1000000 --recent 4000
+
+Builds a single group with the given number of contributions in a throwaway
+test database, checkpoints it, adds --recent newer contributions and then
+times what rebuild_balances does for the group both ways.
+"""
+import argparse
+import random
+import time
+
+from benchmarks import setup_django
+from benchmarks.indexes import generate
+
+
+def add_recent(group_id, count, per_expense, seed=1):
+    from split_expense.models import ExpenseGroup, Expense, Contribution
+
+    rng = random.Random(seed)
+    member_ids = list(ExpenseGroup.objects.get(id=group_id).members.values_list('id', flat=True))
+    expenses = Expense.objects.bulk_create([
+        Expense(group_id=group_id, description='Recent', amount=per_expense * 10, split_type='custom') for _ in range(count // per_expense)
+    ])
+    Contribution.objects.bulk_create([
+        Contribution(expense=expense, group_id=group_id, user_id=user_id, amount=10)
+        for expense in expenses
+        for user_id in rng.sample(member_ids, per_expense)
+    ], batch_size=5000)
+
+
+def best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--contributions', type=int, default=1_000_000)
+    parser.add_argument('--recent', type=int, default=4000, help='Contributions added after the checkpoint')
+    parser.add_argument('--members', type=int, default=50)
+    parser.add_argument('--per-expense', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    teardown = setup_django()
+    try:
+        from django.db import connection
+        from split_expense.models import BalanceCheckpoint, MemberBalance
+
+        start = time.perf_counter()
+        group_id = generate(args.contributions, 1, args.members, args.per_expense)
+        print(f'{connection.vendor}: generated {args.contributions:,} contributions in {time.perf_counter() - start:.1f} s')
+
+        MemberBalance.objects.rebuild([group_id], from_checkpoints=False)
+        first = best_of(1, lambda: BalanceCheckpoint.objects.create_for(group_id))
+        add_recent(group_id, args.recent, args.per_expense)
+        MemberBalance.objects.rebuild([group_id])
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute('ANALYZE')
+
+        def check(from_checkpoints):
+            assert MemberBalance.objects.find_drift([group_id], from_checkpoints) == []
+
+        rows = [
+            ('drift check, whole history', best_of(args.repeat, lambda: check(False))),
+            ('drift check, from checkpoint', best_of(args.repeat, lambda: check(True))),
+            ('rebuild, whole history', best_of(args.repeat, lambda: MemberBalance.objects.rebuild([group_id], from_checkpoints=False))),
+            ('rebuild, from checkpoint', best_of(args.repeat, lambda: MemberBalance.objects.rebuild([group_id]))),
+            ('first checkpoint', first),
+            ('next checkpoint', best_of(1, lambda: BalanceCheckpoint.objects.create_for(group_id))),
+        ]
+        print(f'{args.recent:,} contributions after the checkpoint')
+        for name, seconds in rows:
+            print(f'{name:<30} {seconds * 1000:10.2f} ms')
+        print(f'drift check speedup: {rows[0][1] / rows[1][1]:.1f}x')
+    finally:
+        teardown()
+
+
+if __name__ == '__main__':
+    main()
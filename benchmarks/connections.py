@@ -0,0 +1,146 @@
+"""Throughput at 50 concurrent clients with the development and production settings profiles.
+
+    pip install uvicorn
+    python -m benchmarks.connections --clients 50 --requests 3000
+
+Each profile runs in its own process (DJANGO_SETTINGS_PROFILE is read when the
+settings are imported) against a file-backed SQLite database, behind uvicorn's
+WSGI interface, whose fixed thread pool lets persistent connections be reused
+the way gunicorn's threaded workers would. The load mixes reads of every hot
+read endpoint with expense writes; responses are never served from the cache,
+so each request does its database work.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from benchmarks import setup_django
+from benchmarks.api import percentile
+from benchmarks.asgi import fetch, free_port
+from benchmarks.datagen import generate
+
+PROFILES = ['development', 'production']
+
+
+async def drive(port, plan, clients, token):
+    """Send the planned (method, path, body) requests over `clients` keep-alive connections"""
+    timings = []
+    statuses = []
+    remaining = iter(plan)
+
+    async def client():
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        try:
+            for method, path, body in remaining:
+                start = time.perf_counter()
+                statuses.append(await fetch(reader, writer, path, token, method, body))
+                timings.append(time.perf_counter() - start)
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+    timings.sort()
+    return {
+        'requests_per_second': round(len(plan) / elapsed, 1),
+        'p50_ms': round(percentile(timings, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(timings, 0.95) * 1000, 3),
+        'status_codes': dict(Counter(statuses)),
+    }
+
+
+def run_profile(args):
+    """Child process: build the dataset, serve it and measure"""
+    import threading
+    database = os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+    teardown = setup_django(database_name=database)
+    try:
+        import uvicorn
+        from django.conf import settings
+        from django.core.wsgi import get_wsgi_application
+        from django.test.utils import override_settings
+        from django.urls import reverse
+        from rest_framework_simplejwt.tokens import RefreshToken
+
+        dataset = generate(args.users, args.groups, args.expenses)
+        token = str(RefreshToken.for_user(dataset.primary_user).access_token)
+        rng = random.Random(0)
+        reads = []
+        for group_id in dataset.group_ids:
+            reads += [
+                reverse('manage_expenses', kwargs={'group_id': group_id}),
+                reverse('group_summary', kwargs={'group_id': group_id}),
+                reverse('group_members', kwargs={'group_id': group_id}),
+            ]
+        reads += [reverse('groups'), reverse('overall_balance_summary')]
+        body = json.dumps({'description': 'Bench', 'amount': '12.00', 'split_type': 'equal'}).encode()
+        plan = []
+        for _ in range(args.requests):
+            if rng.random() < args.write_ratio:
+                plan.append(('POST', reverse('manage_expenses', kwargs={'group_id': rng.choice(dataset.group_ids)}), body))
+            else:
+                plan.append(('GET', rng.choice(reads), b''))
+
+        with override_settings(CACHES={'default': {'BACKEND': 'benchmarks.asgi.VersionsOnlyCache'}}):
+            port = free_port()
+            server = uvicorn.Server(uvicorn.Config(get_wsgi_application(), host='127.0.0.1', port=port, interface='wsgi', log_level='error'))
+            thread = threading.Thread(target=server.run, daemon=True)
+            thread.start()
+            while not server.started:
+                time.sleep(0.01)
+            try:
+                result = asyncio.run(drive(port, plan, args.clients, token))
+            finally:
+                server.should_exit = True
+                thread.join()
+        result['conn_max_age'] = settings.DATABASES['default'].get('CONN_MAX_AGE', 0)
+        result['pragmas'] = getattr(settings, 'SQLITE_PRAGMAS', {})
+    finally:
+        teardown()
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=3000)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--groups', type=int, default=20)
+    parser.add_argument('--expenses', type=int, default=5000)
+    parser.add_argument('--profile', choices=PROFILES, help=argparse.SUPPRESS)
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    args = parser.parse_args()
+
+    if args.profile:
+        run_profile(args)
+        return
+
+    results = {}
+    for profile in PROFILES:
+        command = [sys.executable, '-m', 'benchmarks.connections', '--profile', profile] + sys.argv[1:]
+        env = {**os.environ, 'DJANGO_SETTINGS_PROFILE': profile}
+        completed = subprocess.run(command, env=env, capture_output=True, text=True, check=True)
+        results[profile] = json.loads(completed.stdout.strip().splitlines()[-1])
+        r = results[profile]
+        print(f"{profile:<12} {r['requests_per_second']:8.1f} req/s  p50={r['p50_ms']:8.2f} ms  p95={r['p95_ms']:8.2f} ms  "
+              f"statuses={r['status_codes']}  CONN_MAX_AGE={r['conn_max_age']}", file=sys.stderr)
+
+    before, after = results['development']['requests_per_second'], results['production']['requests_per_second']
+    print(f'production profile: {after / before:.2f}x the throughput of development at {args.clients} clients')
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'parameters': vars(args), 'results': results}, f, indent=2)
+            f.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Synthetic data for the API benchmarks: users, groups with a configurable size distribution, and expenses with their
+contributions and shares."""
+import random
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+BENCH_PASSWORD = 'bench-password'
+DISTRIBUTIONS = ['uniform', 'zipf']
+
+
+@dataclass
+class Dataset:
+    users: list
+    group_ids: list
+    members: dict = field(default_factory=dict)  # group_id -> [user ids]
+
+    @property
+    def primary_user(self):
+        """The user every scenario authenticates as; a member of every group"""
+        return self.users[0]
+
+    @property
+    def largest_group_id(self):
+        return max(self.group_ids, key=lambda group_id: len(self.members[group_id]))
+
+
+def group_sizes(groups, min_members, max_members, distribution, rng):
+    if distribution == 'uniform':
+        return [rng.randint(min_members, max_members) for _ in range(groups)]
+    # Zipf-like: a few very large groups and a long tail of small ones
+    return [max(min_members, int(max_members / rank)) for rank in range(1, groups + 1)]
+
+
+def generate(users=200, groups=20, expenses=2000, min_members=2, max_members=50, distribution='uniform', seed=0):
+    from django.contrib.auth.hashers import make_password
+    from django.contrib.auth.models import User
+    from django.db import connection
+    from split_expense.models import ExpenseGroup, Expense, Contribution, Share, MemberBalance, DailySpend, UserDirectoryEntry
+    from split_expense.money import to_cents, to_decimal
+    from split_expense.splitter import split
+
+    rng = random.Random(seed)
+    password = make_password(BENCH_PASSWORD)
+    User.objects.bulk_create([
+        User(username=f'bench{i}', email=f'bench{i}@example.com', password=password) for i in range(users)
+    ])
+    ExpenseGroup.objects.bulk_create([ExpenseGroup(name=f'Bench group {i}') for i in range(groups)])
+    # Re-read rather than rely on bulk_create returning primary keys, which MySQL doesn't
+    user_objects = list(User.objects.filter(username__startswith='bench').order_by('id'))
+    user_ids = [user.id for user in user_objects]
+    # bulk_create skips the signal that maintains the user directory
+    UserDirectoryEntry.objects.bulk_create([
+        UserDirectoryEntry(user_id=user.id, **UserDirectoryEntry.values_for(user)) for user in user_objects
+    ], batch_size=5000)
+    group_objects = list(ExpenseGroup.objects.filter(name__startswith='Bench group ').order_by('id'))
+
+    dataset = Dataset(users=user_objects, group_ids=[group.id for group in group_objects])
+    memberships = []
+    for group, size in zip(group_objects, group_sizes(groups, min_members, max_members, distribution, rng)):
+        size = min(size, users)
+        member_ids = [user_ids[0]] + rng.sample(user_ids[1:], size - 1)
+        dataset.members[group.id] = member_ids
+        memberships += [ExpenseGroup.members.through(expensegroup_id=group.id, user_id=user_id) for user_id in member_ids]
+    ExpenseGroup.members.through.objects.bulk_create(memberships, batch_size=5000)
+
+    # In user id order, as equal splits give any remainder cents to the first members
+    ordered_members = {group_id: sorted(member_ids) for group_id, member_ids in dataset.members.items()}
+
+    # Larger groups get proportionally more expenses
+    weights = [len(dataset.members[group_id]) for group_id in dataset.group_ids]
+    for start in range(0, expenses, 5000):
+        batch = []
+        payers = []
+        for _ in range(min(5000, expenses - start)):
+            group_id = rng.choices(dataset.group_ids, weights)[0]
+            amount = Decimal(rng.randint(100, 50_000)) / 100
+            if rng.random() < 0.5:
+                batch.append(Expense(group_id=group_id, description='Bench expense', amount=amount, split_type='equal'))
+                payers.append([(rng.choice(dataset.members[group_id]), amount)])
+            else:
+                first, second = rng.sample(dataset.members[group_id], 2)
+                half = (amount / 2).quantize(Decimal('0.01'))
+                batch.append(Expense(group_id=group_id, description='Bench expense', amount=amount, split_type='custom'))
+                payers.append([(first, half), (second, amount - half)])
+        if connection.features.can_return_rows_from_bulk_insert:
+            Expense.objects.bulk_create(batch)
+        else:
+            for expense in batch:
+                expense.save()
+        Contribution.objects.bulk_create([
+            Contribution(expense=expense, group_id=expense.group_id, user_id=user_id, amount=amount)
+            for expense, paid in zip(batch, payers)
+            for user_id, amount in paid
+        ], batch_size=5000)
+        # Both split types are owed evenly by every member, as when they are posted to manage_expenses
+        Share.objects.bulk_create([
+            Share(expense=expense, group_id=expense.group_id, user_id=user_id, amount=to_decimal(cents))
+            for expense in batch
+            for user_id, cents in zip(ordered_members[expense.group_id], split('equal', to_cents(expense.amount), ordered_members[expense.group_id]))
+        ], batch_size=5000)
+
+    MemberBalance.objects.rebuild()
+    DailySpend.objects.rebuild()
+    return dataset
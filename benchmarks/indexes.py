@@ -0,0 +1,111 @@
+"""Compare query plans and latency of the hot balance/listing queries with and without the secondary indexes.
+
+    python -m benchmarks.indexes --contributions 1000000
+
+Runs against a throwaway test database built from the configured DATABASES,
+so point the settings at MySQL to get the MySQL numbers.
+"""
+import argparse
+import random
+import time
+
+from benchmarks import setup_django
+
+INDEXES = [
+    ('Expense', 'expense_group_created_idx'),
+    ('Contribution', 'contribution_expense_user_idx'),
+    ('Contribution', 'contribution_group_user_idx'),
+]
+
+
+def generate(contributions, groups, members, per_expense, seed=0):
+    from django.contrib.auth.models import User
+    from split_expense.models import ExpenseGroup, Expense, Contribution
+
+    rng = random.Random(seed)
+    users = User.objects.bulk_create([User(username=f'bench{i}') for i in range(groups * members)])
+    group_objects = ExpenseGroup.objects.bulk_create([ExpenseGroup(name=f'Group {i}') for i in range(groups)])
+    memberships = []
+    group_members = {}
+    for i, group in enumerate(group_objects):
+        group_members[group.id] = [user.id for user in users[i * members:(i + 1) * members]]
+        memberships += [ExpenseGroup.members.through(expensegroup_id=group.id, user_id=user_id) for user_id in group_members[group.id]]
+    ExpenseGroup.members.through.objects.bulk_create(memberships)
+
+    remaining = contributions
+    while remaining > 0:
+        batch = min(remaining, 50_000)
+        expenses = Expense.objects.bulk_create([
+            Expense(group=rng.choice(group_objects), description='Bench', amount=per_expense * 10, split_type='custom')
+            for _ in range(batch // per_expense)
+        ])
+        Contribution.objects.bulk_create([
+            Contribution(expense=expense, group_id=expense.group_id, user_id=user_id, amount=10)
+            for expense in expenses
+            for user_id in rng.sample(group_members[expense.group_id], per_expense)
+        ], batch_size=5000)
+        remaining -= batch
+    return group_objects[0].id
+
+
+def scenarios(group_id):
+    from django.db.models import Sum
+    from split_expense.models import Expense, Contribution
+
+    page = list(Expense.objects.filter(group_id=group_id).order_by('created_at', 'id').values_list('id', flat=True)[:100])
+    return {
+        'totals via expense join': Contribution.objects.filter(expense__group_id=group_id).values('user_id').annotate(total=Sum('amount')),
+        'totals via contribution.group': Contribution.objects.filter(group_id=group_id).values('user_id').annotate(total=Sum('amount')),
+        'expense listing page': Expense.objects.filter(group_id=group_id).order_by('created_at', 'id')[:100],
+        'contributions for page': Contribution.objects.filter(expense_id__in=page).order_by('expense_id', 'user_id'),
+    }
+
+
+def run(group_id, repeat, label):
+    print(f'\n== {label} ==')
+    for name, queryset in scenarios(group_id).items():
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            list(queryset.all())
+            timings.append(time.perf_counter() - start)
+        print(f'{name:<32} best={min(timings) * 1000:8.2f} ms')
+        for line in queryset.explain().splitlines():
+            print(f'    {line}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--contributions', type=int, default=1_000_000)
+    parser.add_argument('--groups', type=int, default=20)
+    parser.add_argument('--members', type=int, default=50)
+    parser.add_argument('--per-expense', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    teardown = setup_django()
+    try:
+        from django.apps import apps
+        from django.db import connection
+
+        start = time.perf_counter()
+        group_id = generate(args.contributions, args.groups, args.members, args.per_expense)
+        print(f'{connection.vendor}: generated {args.contributions:,} contributions in {time.perf_counter() - start:.1f} s')
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute('ANALYZE')
+
+        run(group_id, args.repeat, 'with indexes')
+
+        with connection.schema_editor() as editor:
+            for model_name, index_name in INDEXES:
+                model = apps.get_model('split_expense', model_name)
+                index = next(index for index in model._meta.indexes if index.name == index_name)
+                editor.remove_index(model, index)
+        run(group_id, args.repeat, 'without secondary indexes')
+    finally:
+        teardown()
+
+
+if __name__ == '__main__':
+    main()
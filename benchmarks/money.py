@@ -0,0 +1,94 @@
+"""Time the balance aggregation on integer cents against the previous Decimal implementation.
+
+    python -m benchmarks.money --groups 200 --members 50 --repeat 20
+
+Runs the pure-Python part of the overall summary (per-group balances, then
+spreading the user's balance over the other members) on the same synthetic
+ledger, once in integer cents as the API does and once with the Decimal
+division and rounding it used before.
+"""
+import argparse
+import random
+import time
+from collections import defaultdict
+from decimal import Decimal
+
+from split_expense.money import to_decimal
+
+
+def random_ledger(groups, members, seed=0):
+    """(memberships, totals) rows shaped like balances._memberships and _totals_by_member, in cents"""
+    rng = random.Random(seed)
+    memberships = []
+    totals = []
+    for group_id in range(groups):
+        names = ['user'] + [f'member{group_id}-{i}' for i in range(members - 1)]
+        for name in names:
+            memberships.append((group_id, name))
+            totals.append({'group_id': group_id, 'user__username': name, 'paid': rng.randint(0, 500_000), 'owed': 0})
+    return memberships, totals
+
+
+def decimal_summary(username, memberships, totals):
+    """The previous implementation: Decimal paid totals, Decimal division and round(..., 2)"""
+    paid_by_group = defaultdict(dict)
+    for group_id, name in memberships:
+        paid_by_group[group_id][name] = Decimal(0)
+    group_totals = defaultdict(Decimal)
+    for row in totals:
+        paid = to_decimal(row['paid'])
+        group_totals[row['group_id']] += paid
+        paid_by_group[row['group_id']][row['user__username']] = paid
+
+    owed_by = defaultdict(Decimal)
+    owes = defaultdict(Decimal)
+    for group_id, paid_by_member in paid_by_group.items():
+        equal_share = group_totals[group_id] / len(paid_by_member)
+        balances = {name: paid - equal_share for name, paid in paid_by_member.items()}
+        user_balance = balances[username]
+        positive = user_balance > 0
+        counterparts = {name: balance for name, balance in balances.items() if name != username and (balance < 0 if positive else balance > 0)}
+        weight = abs(sum(counterparts.values()))
+        if not weight:
+            continue
+        for name, balance in counterparts.items():
+            (owed_by if positive else owes)[name] += (abs(balance) / weight) * abs(user_balance)
+    return {name: round(amount, 2) for name, amount in owed_by.items()}, {name: round(amount, 2) for name, amount in owes.items()}
+
+
+def cents_summary(username, memberships, totals):
+    from split_expense.balances import _balances_by_group
+    from split_expense.views import _summarise_overall
+    return _summarise_overall(username, _balances_by_group(memberships, totals))
+
+
+def best_of(repeat, func, *args):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--groups', type=int, default=200)
+    parser.add_argument('--members', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    import os
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'expense_splitter.settings')
+    import django
+    django.setup()
+
+    memberships, totals = random_ledger(args.groups, args.members)
+    decimal_time = best_of(args.repeat, decimal_summary, 'user', memberships, totals)
+    cents_time = best_of(args.repeat, cents_summary, 'user', memberships, totals)
+    print(f'groups={args.groups} members={args.members}  Decimal={decimal_time * 1000:7.2f} ms  cents={cents_time * 1000:7.2f} ms  '
+          f'speedup={decimal_time / cents_time:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
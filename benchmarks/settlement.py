@@ -0,0 +1,57 @@
+"""Time the settlement planner on large synthetic groups.
+
+    python -m benchmarks.settlement --members 5000 --repeat 20
+    python -m benchmarks.settlement --members 5000 --max-ms 100
+
+With --max-ms it exits non-zero when the best greedy run for any group size takes longer.
+"""
+import argparse
+import random
+import sys
+import time
+from decimal import Decimal
+
+from split_expense.settlement import settle_up
+
+
+def random_balances(members, seed=0):
+    """Balances for `members` people that net to zero, in cents"""
+    rng = random.Random(seed)
+    cents = [rng.randint(-50_000, 50_000) for _ in range(members - 1)]
+    cents.append(-sum(cents))
+    return {f'user{i}': Decimal(amount) / 100 for i, amount in enumerate(cents)}
+
+
+def time_plan(balances, repeat, exact=False):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        transfers = settle_up(balances, exact=exact)
+        timings.append(time.perf_counter() - start)
+    return min(timings), sorted(timings)[len(timings) // 2], len(transfers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--members', type=int, nargs='+', default=[100, 1000, 5000, 10000])
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--max-ms', type=float, help='Fail when a best greedy run takes longer than this')
+    args = parser.parse_args()
+
+    too_slow = []
+    for members in args.members:
+        best, median, count = time_plan(random_balances(members), args.repeat)
+        print(f'greedy  members={members:>6}  transfers={count:>6}  best={best * 1000:7.2f} ms  median={median * 1000:7.2f} ms')
+        if args.max_ms is not None and best * 1000 > args.max_ms:
+            too_slow.append(members)
+
+    best, median, count = time_plan(random_balances(12), args.repeat, exact=True)
+    print(f'exact   members={12:>6}  transfers={count:>6}  best={best * 1000:7.2f} ms  median={median * 1000:7.2f} ms')
+
+    if too_slow:
+        print(f'greedy plan slower than {args.max_ms} ms for {", ".join(map(str, too_slow))} members')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
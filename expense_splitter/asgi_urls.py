@@ -0,0 +1,14 @@
+"""
+URL configuration for ASGI deployments that opt in to the async read views, with
+DJANGO_ROOT_URLCONF=expense_splitter.asgi_urls (see settings.py).
+
+Identical to urls.py except that the API is served from split_expense.async_urls,
+which routes the read-heavy endpoints to async views.
+"""
+from django.contrib import admin
+from django.urls import path,include
+
+urlpatterns = [
+    path('admin/', admin.site.urls),
+    path('api/',include('split_expense.async_urls')),
+]
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 from datetime import timedelta
+import os
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -28,6 +29,9 @@ DEBUG = True
 
 ALLOWED_HOSTS = []
 
+# 'development' (default) or 'production'; the production profile is applied after DATABASES below
+SETTINGS_PROFILE = os.environ.get('DJANGO_SETTINGS_PROFILE', 'development')
+
 
 # Application definition
 
@@ -45,6 +49,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'split_expense.metrics.QueryMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -53,15 +58,19 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'split_expense.routers.ReplicaPinningMiddleware',
 ]
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'split_expense.authentication.CachedJWTAuthentication',
     ],
 }
 
-ROOT_URLCONF = 'expense_splitter.urls'
+# Set DJANGO_ROOT_URLCONF=expense_splitter.asgi_urls to serve the read-heavy endpoints from async views
+# under ASGI. It is opt-in: Django's async ORM still runs each query on one thread through sync_to_async,
+# and benchmarks/asgi.py hasn't shown them to be faster than the sync views.
+ROOT_URLCONF = os.environ.get('DJANGO_ROOT_URLCONF', 'expense_splitter.urls')
 
 TEMPLATES = [
     {
@@ -92,6 +101,95 @@ DATABASES = {
     }
 }
 
+if os.environ.get('MYSQL_DATABASE'):
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.mysql',
+        'NAME': os.environ['MYSQL_DATABASE'],
+        'USER': os.environ.get('MYSQL_USER', ''),
+        'PASSWORD': os.environ.get('MYSQL_PASSWORD', ''),
+        'HOST': os.environ.get('MYSQL_HOST', '127.0.0.1'),
+        'PORT': os.environ.get('MYSQL_PORT', '3306'),
+        'OPTIONS': {'charset': 'utf8mb4', 'isolation_level': 'read committed'},
+    }
+
+# Read replicas for the read-only views (see split_expense/routers.py): MySQL hosts listed in
+# MYSQL_REPLICA_HOSTS, or locally SQLite files listed in SQLITE_REPLICAS standing in for them
+# (nothing replicates into those, so migrate and fill them yourself). MySQL replicas copy the
+# default database's settings, so they are only used when it is MySQL too.
+replica_hosts = os.environ.get('MYSQL_REPLICA_HOSTS', '') if DATABASES['default']['ENGINE'] == 'django.db.backends.mysql' else ''
+for number, host in enumerate(filter(None, replica_hosts.split(',')), start=1):
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'OPTIONS': dict(DATABASES['default'].get('OPTIONS', {})),
+        'TEST': {'MIRROR': 'default'},
+    }
+for number, path in enumerate(filter(None, os.environ.get('SQLITE_REPLICAS', '').split(',')), start=1):
+    DATABASES[f'replica{number}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': path,
+        'TEST': {'MIRROR': 'default'},
+    }
+
+if SETTINGS_PROFILE == 'production':
+    DEBUG = False
+    ALLOWED_HOSTS = os.environ.get('DJANGO_ALLOWED_HOSTS', 'localhost').split(',')
+
+    for database in DATABASES.values():
+        # Reuse each worker thread's connection across requests, checking it is still alive first
+        database['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', '600'))
+        database['CONN_HEALTH_CHECKS'] = True
+        options = database.setdefault('OPTIONS', {})
+        if database['ENGINE'] == 'django.db.backends.mysql':
+            # mysqlclient has no client-side pool; persistent connections are the pool. Keep the
+            # server from dropping them before CONN_MAX_AGE, and fail fast on a dead server.
+            options.update({
+                'connect_timeout': 5,
+                'read_timeout': 30,
+                'write_timeout': 30,
+                'init_command': f"SET SESSION wait_timeout = {database['CONN_MAX_AGE'] + 300}",
+            })
+        elif database['ENGINE'] == 'django.db.backends.sqlite3':
+            # Take the write lock at BEGIN so concurrent writers queue on the busy timeout instead of failing
+            options.update({'timeout': 20, 'transaction_mode': 'IMMEDIATE'})
+
+    # Applied to every new SQLite connection by split_expense.signals
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',       # Readers no longer block on the writer
+        'synchronous': 'NORMAL',     # Safe with WAL; fsync at checkpoints rather than every commit
+        'cache_size': -64000,        # 64 MB page cache per connection
+        'mmap_size': 268435456,      # Read through a 256 MB memory map
+        'temp_store': 'MEMORY',
+    }
+
+REPLICA_DATABASES = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['split_expense.routers.ReplicaRouter']
+REPLICA_PIN_SECONDS = 10  # How long a user's reads stay on the primary after they write
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Local memory by default, which only suits a single worker process. With more than one, a shared
+# cache is required: set CACHE_REDIS_URL (e.g. redis://127.0.0.1:6379/1). Cached users (see
+# split_expense/authentication.py) are invalidated through version counters kept in the cache, so with
+# a cache per process a password change or deactivation only reaches the worker that saved the user.
+# Cached responses are keyed by group versions stored in the database and are safe either way.
+
+if os.environ.get('CACHE_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['CACHE_REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -135,6 +233,9 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 CORS_ORIGIN_WHITELIST = ('http://localhost:3020',)
+CORS_EXPOSE_HEADERS = ['ETag', 'Link', 'X-Next-Cursor']  # Let browser clients revalidate and follow pages
+
+METRICS_REPEATED_QUERY_THRESHOLD = 10  # Same SQL run more often than this in one request is logged as a likely N+1
 
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=7),  # Increase access token lifetime
@@ -145,3 +246,13 @@ SIMPLE_JWT = {
     'SIGNING_KEY': SECRET_KEY,
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
+
+JWT_USER_CACHE_TIMEOUT = 60  # Seconds an authenticated user is served from the cache; saving the user invalidates it, and
+                             # changes that skip the save signal (QuerySet.update()) wait at most this long
+
+# In-process LRU of user directory search pages (see split_expense/directory.py)
+USER_SEARCH_CACHE_SIZE = 1024
+USER_SEARCH_CACHE_SECONDS = 30
+
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60  # Seconds a stored Idempotency-Key response is kept; run purge_idempotency_keys periodically
+CHANGE_LOG_RETENTION_DAYS = 30  # Days the sync change log is kept; run purge_changes periodically
@@ -1,7 +1,10 @@
 from django.contrib import admin
-from .models import ExpenseGroup, Expense, Contribution
+from .models import ExpenseGroup, Expense, Contribution, Share, MemberBalance, Change
 # Register your models here.
 
 admin.site.register(ExpenseGroup)
 admin.site.register(Expense)
-admin.site.register(Contribution)
\ No newline at end of file
+admin.site.register(Contribution)
+admin.site.register(Share)
+admin.site.register(MemberBalance)
+admin.site.register(Change)
@@ -0,0 +1,51 @@
+from collections import defaultdict
+from decimal import Decimal
+from django.db.models import F, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+from .models import DailySpend
+
+# Spending over time for dashboards, read from the DailySpend rollup instead of
+# the expense history. The database groups the daily rows into buckets; the
+# result is columnar: parallel arrays with one entry per bucket that has any
+# spending, oldest first.
+
+INTERVALS = {
+    'day': F,
+    'week': TruncWeek,  # Weeks start on Monday
+    'month': TruncMonth,
+}
+
+
+def spend_series(group, interval, start=None, end=None):
+    """Group total and per-member amounts paid per bucket between start and end (inclusive days)"""
+    rows = DailySpend.objects.filter(group=group).exclude(paid=0)
+    if start is not None:
+        rows = rows.filter(day__gte=start)
+    if end is not None:
+        rows = rows.filter(day__lte=end)
+    rows = (
+        rows.annotate(bucket=INTERVALS[interval]('day'))
+        .values('bucket', 'user__username')
+        .annotate(total=Sum('paid'))
+        .order_by('bucket')
+    )
+
+    buckets = []
+    totals = []
+    by_member = defaultdict(dict)  # username -> {bucket index: amount}
+    for row in rows:
+        if not buckets or buckets[-1] != row['bucket']:
+            buckets.append(row['bucket'])
+            totals.append(Decimal(0))
+        totals[-1] += row['total']
+        by_member[row['user__username']][len(buckets) - 1] = row['total']
+
+    return {
+        'interval': interval,
+        'buckets': [bucket.isoformat() for bucket in buckets],
+        'totals': totals,
+        'members': {
+            username: [amounts.get(i, Decimal(0)) for i in range(len(buckets))]
+            for username, amounts in sorted(by_member.items())
+        },
+    }
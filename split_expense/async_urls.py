@@ -0,0 +1,13 @@
+from django.urls import path
+from .async_views import groups, group_summary, group_members, overall_balance_summary
+from .urls import urlpatterns as sync_urlpatterns
+
+# Routes for ASGI deployments using expense_splitter.asgi_urls. The read-heavy endpoints are served by their
+# async variants; patterns match in order, so these shadow the sync routes with
+# the same path and everything else falls through to the views used under WSGI.
+urlpatterns = [
+    path('groups/', groups, name='groups'),
+    path('groups/<int:group_id>/summary/', group_summary, name='group_summary'),
+    path('groups/<int:group_id>/members/', group_members, name='group_members'),
+    path('summary/', overall_balance_summary, name='overall_balance_summary'),
+] + sync_urlpatterns
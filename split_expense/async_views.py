@@ -0,0 +1,123 @@
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import APIException, AuthenticationFailed, MethodNotAllowed, NotAuthenticated
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.views import exception_handler
+from .authentication import CachedJWTAuthentication
+from .balances import amember_balances, amember_balances_for_user
+from .caching import acached, user_groups_key, versions_digest, etag, not_modified
+from .models import ExpenseGroup
+from .routers import replica_reads
+from .serializers import UserSerializer, ExpenseGroupSerializer
+from . import views
+
+# Async variants of the read-heavy views, served by the ASGI application
+# (see expense_splitter/asgi_urls.py). Under WSGI the sync views in views.py
+# are used instead, so both must return the same responses.
+#
+# DRF's @api_view can't wrap coroutines, so async_api_view does the parts of it
+# these views need: JWT authentication, IsAuthenticated, the method check and
+# rendering the Response as JSON.
+
+authentication = CachedJWTAuthentication()
+
+
+def async_api_view(http_method_names):
+    def decorator(view):
+        @csrf_exempt
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            try:
+                # Same order as DRF: authentication and permissions before the method check
+                user_auth = await authentication.aauthenticate(request)
+                if user_auth is None:
+                    raise NotAuthenticated()
+                request.user, request.auth = user_auth
+                if request.method not in http_method_names:
+                    raise MethodNotAllowed(request.method)
+                response = await view(request, *args, **kwargs)
+            except APIException as exc:
+                response = exception_handler(exc, {'request': request})
+                if isinstance(exc, (NotAuthenticated, AuthenticationFailed)):
+                    response['WWW-Authenticate'] = authentication.authenticate_header(request)
+            response.accepted_renderer = JSONRenderer()
+            response.accepted_media_type = JSONRenderer.media_type
+            response.renderer_context = {'request': request, 'response': response}
+            return response
+        return wrapper
+    return decorator
+
+
+#Expense Groups Management
+@csrf_exempt
+async def groups(request):
+    if request.method != 'GET':
+        # Creating a group is a write; it stays on the sync view
+        return await sync_to_async(views.groups)(request)
+    return await _list_groups(request)
+
+@async_api_view(['GET'])
+@replica_reads
+async def _list_groups(request):
+    #Get all groups the user belongs to
+    versions = {group_id: version async for group_id, version in request.user.expense_groups.values_list('id', 'version')}
+    current_etag = etag('groups', request.user.id, versions_digest(versions))
+    if not_modified(request, current_etag):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': current_etag})
+
+    user_groups = [group async for group in ExpenseGroup.objects.filter(id__in=versions).prefetch_related('members')]
+    serializer = ExpenseGroupSerializer(user_groups, many=True)
+    return Response(serializer.data, headers={'ETag': current_etag})
+
+#Fetching group summary
+@async_api_view(['GET'])
+@replica_reads
+async def group_summary(request, group_id):
+    """Get a summary of balances for a group"""
+    group = await ExpenseGroup.objects.filter(id=group_id, members__in=[request.user]).afirst()
+    if not group:
+        return Response({'error': 'Group not found or access denied'}, status=status.HTTP_404_NOT_FOUND)
+
+    current_etag = etag('group_summary', group.id, group.version)
+    if not_modified(request, current_etag):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': current_etag})
+
+    async def compute():
+        return views._owes(await amember_balances(group))
+
+    owes = await acached('group_summary', f'group_summary:{group.id}:{group.version}', compute)
+    return Response({'balances': owes}, status=status.HTTP_200_OK, headers={'ETag': current_etag})
+
+@async_api_view(['GET'])
+@replica_reads
+async def group_members(request, group_id):
+    """Fetch members of a group"""
+    group = await ExpenseGroup.objects.filter(id=group_id, members__in=[request.user]).afirst()
+    if not group:
+        return Response({'error': 'Group not found or access denied'}, status=status.HTTP_404_NOT_FOUND)
+
+    current_etag = etag('group_members', group.id, group.version)
+    if not_modified(request, current_etag):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': current_etag})
+
+    async def compute():
+        return UserSerializer([member async for member in group.members.all()], many=True).data
+
+    members = await acached('group_members', f'group_members:{group.id}:{group.version}', compute)
+    return Response({'members': members}, status=status.HTTP_200_OK, headers={'ETag': current_etag})
+
+@async_api_view(['GET'])
+@replica_reads
+async def overall_balance_summary(request):
+    """Get a summary of balances for the user across all groups"""
+    user = request.user
+    versions = {group_id: version async for group_id, version in user.expense_groups.values_list('id', 'version')}
+    key = user_groups_key('overall_balance_summary', user.id, versions)
+
+    async def compute():
+        return views._summarise_overall(user.username, await amember_balances_for_user(user))
+
+    return Response(await acached('overall_balance_summary', key, compute))
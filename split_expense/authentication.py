@@ -0,0 +1,96 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+from .caching import user_auth_version, auser_auth_version
+
+# JWT authentication without a database round trip per request.
+#
+# The validated user is cached as a partial User row keyed by user id, the
+# user's auth version and the token's jti. The version is bumped whenever the
+# user is saved or deleted (see signals.py), so a password change or
+# deactivation takes effect on the next request instead of after the TTL.
+# The version lives in the cache, so this only holds across worker processes
+# when they share it (see checks.py). Changes that send no signal, such as
+# QuerySet.update(), take effect once JWT_USER_CACHE_TIMEOUT passes, which is
+# the worst-case delay.
+
+DEFAULT_USER_CACHE_TIMEOUT = 60
+
+#Fields loaded for request.user; anything else is deferred and fetched on first access
+USER_FIELDS = ('id', 'username', 'email', 'is_active', 'is_staff', 'is_superuser')
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that caches the user lookup and has an async entry point for async views"""
+
+    def get_user(self, validated_token):
+        user_id = self._user_id(validated_token)
+        key = self._cache_key(user_id, user_auth_version(user_id), validated_token)
+        row = cache.get(key)
+        if row is None:
+            user = self._check(self.user_model.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).first(), validated_token)
+            row = self._row(user)
+            cache.set(key, row, self._timeout())
+        return self._from_row(row)
+
+    async def aauthenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        user_id = self._user_id(validated_token)
+        key = self._cache_key(user_id, await auser_auth_version(user_id), validated_token)
+        row = await cache.aget(key)
+        if row is None:
+            user = self._check(await self.user_model.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).afirst(), validated_token)
+            row = self._row(user)
+            await cache.aset(key, row, self._timeout())
+        return self._from_row(row)
+
+    def _user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+    def _cache_key(self, user_id, version, validated_token):
+        return f'jwt-user:{user_id}:{version}:{validated_token.get(api_settings.JTI_CLAIM)}'
+
+    def _timeout(self):
+        return getattr(settings, 'JWT_USER_CACHE_TIMEOUT', DEFAULT_USER_CACHE_TIMEOUT)
+
+    def _check(self, user, validated_token):
+        # Same checks as JWTAuthentication.get_user; only successful lookups are cached
+        if user is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+        return user
+
+    def _row(self, user):
+        # from_db expects values in the model's field order
+        fields = [field.attname for field in self.user_model._meta.concrete_fields if field.attname in USER_FIELDS]
+        return user._state.db, fields, [getattr(user, field) for field in fields]
+
+    def _from_row(self, row):
+        # The missing fields are deferred, so saving the instance only writes the loaded ones
+        db, fields, values = row
+        return self.user_model.from_db(db, fields, values)
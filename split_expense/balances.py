@@ -0,0 +1,114 @@
+from collections import defaultdict
+from django.contrib.auth.models import User
+from django.db.models import Q
+from .models import ExpenseGroup, MemberBalance
+from .money import split_evenly, sum_cents
+
+# Balance engine: every member's position in a group is computed from the
+# balance ledger with a fixed number of queries, independent of group size.
+# Amounts are integer cents throughout (see money.py); the database returns
+# the sums as cents and equal shares are split to the cent, so a group's
+# balances always add up to exactly zero.
+#
+# A member's balance is what they paid minus what they owe. What they owe is
+# the sum of their shares (see splitter.py), plus an equal part of whatever the
+# group paid that was never split into shares: custom splits, and expenses
+# recorded before shares existed, are shared by all current members.
+
+
+def member_totals(group):
+    """Return {username: (cents paid, cents owed)} for every current member of the group, including members who paid nothing"""
+    return {row['username']: (row['paid'] or 0, row['owed'] or 0) for row in _member_totals(group)}
+
+
+def _member_totals(group):
+    in_group = Q(member_balances__group=group)
+    return (
+        User.objects.filter(expense_groups=group)
+        .values('username')
+        .annotate(paid=sum_cents('member_balances__paid', filter=in_group), owed=sum_cents('member_balances__owed', filter=in_group))
+        .order_by('id')
+    )
+
+
+def _unshared(totals):
+    return (totals['paid'] or 0) - (totals['owed'] or 0)
+
+
+def unshared_total(group):
+    """Cents paid into the group but not split into shares, including contributions from former members"""
+    return _unshared(MemberBalance.objects.filter(group=group).aggregate(paid=sum_cents('paid'), owed=sum_cents('owed')))
+
+
+def member_balances(group):
+    """Return {username: cents paid - cents owed} for every current member of the group"""
+    totals_by_member = member_totals(group)
+    if not totals_by_member:
+        return {}
+    return _balances(totals_by_member, unshared_total(group))
+
+
+async def amember_balances(group):
+    """Async member_balances()"""
+    rows = await _alist(_member_totals(group))
+    totals = await MemberBalance.objects.filter(group=group).aaggregate(paid=sum_cents('paid'), owed=sum_cents('owed'))
+    totals_by_member = {row['username']: (row['paid'] or 0, row['owed'] or 0) for row in rows}
+    if not totals_by_member:
+        return {}
+    return _balances(totals_by_member, _unshared(totals))
+
+
+def member_balances_for_user(user):
+    """Return {group_id: {username: balance in cents}} for every group the user belongs to, using two queries"""
+    return _balances_by_group(_memberships(user), _totals_by_member(user))
+
+
+async def amember_balances_for_user(user):
+    """Async member_balances_for_user()"""
+    return _balances_by_group(await _alist(_memberships(user)), await _alist(_totals_by_member(user)))
+
+
+def _memberships(user):
+    # Current members of each of the user's groups
+    return (
+        ExpenseGroup.members.through.objects
+        .filter(expensegroup__members=user)
+        .values_list('expensegroup_id', 'user__username')
+        .order_by('expensegroup_id', 'user_id')
+    )
+
+
+def _totals_by_member(user):
+    # Paid and owed totals keyed by (group, user), including former members who still count towards the group total
+    return (
+        MemberBalance.objects.filter(group__members=user)
+        .values('group_id', 'user__username')
+        .annotate(paid=sum_cents('paid'), owed=sum_cents('owed'))
+    )
+
+
+def _balances_by_group(memberships, totals):
+    totals_by_group = defaultdict(dict)
+    for group_id, username in memberships:
+        totals_by_group[group_id][username] = (0, 0)
+
+    unshared = defaultdict(int)
+    for row in totals:
+        unshared[row['group_id']] += row['paid'] - row['owed']
+        if row['user__username'] in totals_by_group[row['group_id']]:
+            totals_by_group[row['group_id']][row['user__username']] = (row['paid'], row['owed'])
+
+    return {
+        group_id: _balances(totals_by_member, unshared[group_id])
+        for group_id, totals_by_member in totals_by_group.items()
+    }
+
+
+def _balances(totals_by_member, unshared):
+    # The first members in the (user id) order take the leftover cents of the unshared amount
+    parts = split_evenly(unshared, len(totals_by_member))
+    return {username: paid - owed - part for (username, (paid, owed)), part in zip(totals_by_member.items(), parts)}
+
+
+async def _alist(queryset):
+    return [row async for row in queryset]
@@ -0,0 +1,265 @@
+from collections import defaultdict, namedtuple
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Prefetch
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from .idempotency import idempotent
+from .models import ExpenseGroup, Expense, Contribution, Share, Change
+from .serializers import ExpenseGroupSerializer, ExpenseListSerializer
+from . import views
+
+# Running an ordered list of write operations in one request.
+#
+# Each operation maps to one of the write views in views.py and takes the same
+# fields as that view's request body, plus the ids it would get from the URL:
+#
+#   create_group        name                                       groups (POST)
+#   edit_group_members  group, action, usernames                   edit_group_members
+#   add_expense         group, description, amount, split_type...  manage_expenses (POST)
+#   edit_expense        group, expense, fields to change           edit_or_delete_expense (PATCH)
+#   delete_expense      group, expense                             edit_or_delete_expense (DELETE)
+#
+# create_group and add_expense can name what they create with "ref", and later
+# operations can pass that name instead of an id as their group or expense.
+#
+# Everything runs in one transaction, and the first failing operation rolls the
+# whole batch back. The groups, their member maps and the users being added or
+# removed are looked up once for the batch rather than once per operation, and
+# the changes it makes are appended to the change log together at the end.
+# The lookups are made inside the transaction with the existing groups locked,
+# so concurrent writes to them can't change their members or expenses under
+# the batch.
+# Created and edited groups and expenses are serialized together at the end,
+# so their results show them as the whole batch left them.
+
+MAX_OPERATIONS = 500
+
+Pending = namedtuple('Pending', 'kind id')  # A result that is serialized once every operation has run
+
+
+class BatchContext:
+    """Lookups shared by the operations of one batch, kept up to date as they run; built inside the batch's transaction"""
+
+    def __init__(self, user, operations):
+        self.user = user
+        self.refs = {}  # ref -> (kind, id)
+        self.touched = set()
+
+        group_ids = {op.get('group') for op in operations if type(op.get('group')) is int}
+        # Locked in id order, so batches touching the same groups wait for each other rather than deadlock
+        self.groups = ExpenseGroup.objects.filter(id__in=group_ids, members=user).select_for_update().order_by('id').in_bulk()
+        self.members = defaultdict(dict)  # Group id -> views._member_ids() of the group
+        memberships = ExpenseGroup.members.through.objects.filter(expensegroup_id__in=self.groups).order_by('user_id')
+        for group_id, username, user_id in memberships.values_list('expensegroup_id', 'user__username', 'user_id'):
+            self.members[group_id][username] = user_id
+
+        expense_ids = {op.get('expense') for op in operations if type(op.get('expense')) is int}
+        self.expenses = Expense.objects.filter(id__in=expense_ids, group_id__in=self.groups).in_bulk()
+
+        usernames = {
+            username for op in operations if op.get('op') == 'edit_group_members' and isinstance(op.get('usernames'), list)
+            for username in op['usernames'] if isinstance(username, str)
+        }
+        self.user_ids = dict(User.objects.filter(username__in=usernames).values_list('username', 'id'))
+
+    def _id(self, value, kind):
+        """The id an operation refers to, either directly or by the ref of an earlier operation"""
+        if isinstance(value, str):
+            ref_kind, ref_id = self.refs.get(value, (None, None))
+            return ref_id if ref_kind == kind else None
+        return value if type(value) is int else None
+
+    def group(self, operation):
+        """The operation's group, if the user is currently a member of it"""
+        group = self.groups.get(self._id(operation.get('group'), 'group'))
+        if group is None or self.user.username not in self.members[group.id]:
+            return None
+        return group
+
+    def expense(self, operation, group):
+        expense = self.expenses.get(self._id(operation.get('expense'), 'expense'))
+        return expense if expense is not None and expense.group_id == group.id else None
+
+    def created(self, operation, kind, obj_id):
+        if operation.get('ref') is not None:
+            self.refs[operation['ref']] = (kind, obj_id)
+
+    def serialize(self, results):
+        """Replace the Pending results with the serialized groups and expenses, a few queries for the whole batch"""
+        pending = [result['data'] for result in results if isinstance(result['data'], Pending)]
+        groups = ExpenseGroup.objects.filter(id__in=[p.id for p in pending if p.kind == 'group']).prefetch_related('members').in_bulk()
+        expenses = Expense.objects.filter(id__in=[p.id for p in pending if p.kind == 'expense']).prefetch_related(
+            Prefetch('contributions', queryset=Contribution.objects.select_related('user')),
+            Prefetch('shares', queryset=Share.objects.select_related('user')),
+        ).in_bulk()
+        for result in results:
+            data = result['data']
+            if isinstance(data, Pending):
+                if data.kind == 'group':
+                    obj, serializer = groups.get(data.id), ExpenseGroupSerializer
+                else:
+                    obj, serializer = expenses.get(data.id), ExpenseListSerializer
+                # Deleted by a later operation
+                result['data'] = serializer(obj).data if obj is not None else {'id': data.id}
+
+
+def _group_not_found():
+    return Response({'error': 'Group not found or access denied'}, status=status.HTTP_404_NOT_FOUND)
+
+
+def create_group(context, operation):
+    name = operation.get('name')
+    if not name:
+        return Response({'error': 'Group name is required'}, status=status.HTTP_400_BAD_REQUEST)
+    # Groups created earlier in the batch are visible here, inside the same transaction
+    if ExpenseGroup.objects.filter(name=name, members=context.user).exists():
+        return Response({'error': 'Group name must be unique to your account'}, status=status.HTTP_400_BAD_REQUEST)
+
+    group = ExpenseGroup.objects.create(name=name)
+    group.members.add(context.user)
+    Change.objects.record(group.id, 'group', [group.id])
+    context.groups[group.id] = group
+    context.members[group.id] = {context.user.username: context.user.id}
+    context.created(operation, 'group', group.id)
+    context.touched.add(group.id)
+    return Response(Pending('group', group.id), status=status.HTTP_201_CREATED)
+
+
+def edit_group_members(context, operation):
+    group = context.group(operation)
+    if group is None:
+        return _group_not_found()
+
+    action = operation.get('action')
+    usernames = operation.get('usernames', [])
+    if action not in ['add', 'remove']:
+        return Response({'error': 'Invalid action. Use "add" or "remove"'}, status=status.HTTP_400_BAD_REQUEST)
+    if not usernames or not isinstance(usernames, list) or not all(isinstance(username, str) for username in usernames):
+        return Response({'error': 'At least one username is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+    members = context.members[group.id]
+    errors = []
+    for username in usernames:
+        if username not in context.user_ids:
+            errors.append(f'User {username} not found')
+        elif action == 'add' and username in members:
+            errors.append(f'{username} is already a member of the group')
+        elif action == 'remove' and username not in members:
+            errors.append(f'{username} is not a member of the group')
+    if errors:
+        return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+
+    user_ids = [context.user_ids[username] for username in usernames]
+    if action == 'add':
+        group.members.add(*user_ids)
+        views._record_members_changed(group.id, added_ids=user_ids)
+        members.update((username, context.user_ids[username]) for username in usernames)
+        # Keep the member map in user id order, as equal splits rely on it
+        context.members[group.id] = dict(sorted(members.items(), key=lambda item: item[1]))
+        message = f'Successfully added {len(user_ids)} user(s) to the group'
+    else:
+        group.members.remove(*user_ids)
+        views._record_members_changed(group.id, removed_ids=user_ids)
+        for username in usernames:
+            members.pop(username, None)
+        message = f'Successfully removed {len(user_ids)} user(s) from the group'
+    context.touched.add(group.id)
+    return Response({'message': message, 'modified_users': usernames}, status=status.HTTP_200_OK)
+
+
+def add_expense(context, operation):
+    group = context.group(operation)
+    if group is None:
+        return _group_not_found()
+
+    expense, error = views._add_expense(group, context.user, operation, context.members[group.id])
+    if error:
+        return error
+    context.expenses[expense.id] = expense
+    context.created(operation, 'expense', expense.id)
+    context.touched.add(group.id)
+    return Response(Pending('expense', expense.id), status=status.HTTP_201_CREATED)
+
+
+def edit_expense(context, operation):
+    group = context.group(operation)
+    if group is None:
+        return _group_not_found()
+    expense = context.expense(operation, group)
+    if expense is None:
+        return Response({'error': 'Expense not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    error = views._edit_expense(group, expense, context.user, operation, context.members[group.id])
+    if error:
+        return error
+    context.touched.add(group.id)
+    return Response(Pending('expense', expense.id), status=status.HTTP_200_OK)
+
+
+def delete_expense(context, operation):
+    group = context.group(operation)
+    if group is None:
+        return _group_not_found()
+    expense = context.expense(operation, group)
+    if expense is None:
+        return Response({'error': 'Expense not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    context.expenses.pop(expense.id)
+    views._delete_expense(expense)
+    context.touched.add(group.id)
+    return Response({'message': 'Expense deleted successfully'}, status=status.HTTP_200_OK)
+
+
+OPERATIONS = {
+    'create_group': create_group,
+    'edit_group_members': edit_group_members,
+    'add_expense': add_expense,
+    'edit_expense': edit_expense,
+    'delete_expense': delete_expense,
+}
+
+
+def run(user, operations):
+    """Run the operations in order in one transaction, returning (results, whether every operation succeeded)"""
+    results = []
+    with transaction.atomic(), Change.objects.deferred():
+        context = BatchContext(user, operations)
+        for operation in operations:
+            handler = OPERATIONS.get(operation.get('op'))
+            ref = operation.get('ref')
+            if handler is None:
+                response = Response({'error': f'Unknown operation. Use one of: {", ".join(OPERATIONS)}'}, status=status.HTTP_400_BAD_REQUEST)
+            elif ref is not None and (not isinstance(ref, str) or ref in context.refs):
+                response = Response({'error': 'ref must be a name not used by an earlier operation'}, status=status.HTTP_400_BAD_REQUEST)
+            else:
+                response = handler(context, operation)
+            results.append({'op': operation.get('op'), 'status': response.status_code, 'data': response.data})
+            if not status.is_success(response.status_code):
+                transaction.set_rollback(True)
+                return results, False
+
+        context.serialize(results)
+        ExpenseGroup.objects.bump(*context.touched)
+    return results, True
+
+
+#Running many operations in one request
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@idempotent
+def batch(request):
+    """Run an ordered list of group and expense operations in one transaction"""
+    operations = request.data.get('operations') if isinstance(request.data, dict) else None
+    if not isinstance(operations, list) or not operations or not all(isinstance(op, dict) for op in operations):
+        return Response({'error': 'operations must be a non-empty list of objects'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(operations) > MAX_OPERATIONS:
+        return Response({'error': f'A batch can have at most {MAX_OPERATIONS} operations'}, status=status.HTTP_400_BAD_REQUEST)
+
+    results, succeeded = run(request.user, operations)
+    if not succeeded:
+        # Nothing was written; the failing operation is the last result
+        return Response({'error': f'Operation {len(results) - 1} failed, so no changes were made', 'results': results}, status=results[-1]['status'])
+    return Response({'results': results}, status=status.HTTP_200_OK)
@@ -0,0 +1,125 @@
+import hashlib
+import threading
+import time
+from collections import defaultdict
+from django.core.cache import cache
+from django.db import transaction
+
+# Response caching for the read-heavy group endpoints.
+#
+# Cached entries embed their group's version (ExpenseGroup.version, see
+# ExpenseGroup.objects.bump) in their key, so any write to the group makes the
+# old entries unreachable without having to find and delete them. The version
+# lives in the database rather than the cache, so this holds in every worker
+# even when each has its own local memory cache.
+
+SUMMARY_TIMEOUT = 300
+
+_stats = defaultdict(lambda: {'hits': 0, 'misses': 0})
+_stats_lock = threading.Lock()
+
+
+def _user_version_key(user_id):
+    return f'user-auth-version:{user_id}'
+
+
+def _fresh_version():
+    # Start from the clock rather than 1 so an evicted counter never reuses an old version
+    return time.time_ns()
+
+
+def user_auth_version(user_id):
+    """Version counter for a user's authentication state, initialised on first use"""
+    key = _user_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _fresh_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+async def auser_auth_version(user_id):
+    key = _user_version_key(user_id)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, _fresh_version(), timeout=None)
+        version = await cache.aget(key)
+    return version
+
+
+def bump_user(user_id):
+    """Invalidate cached authentication data for a user, e.g. after a password change or deactivation"""
+    key = _user_version_key(user_id)
+
+    def bump():
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _fresh_version(), timeout=None)
+
+    bump()
+    # A request that loaded the user from pre-commit data in between would have cached it under the new version
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(bump)
+
+
+def cached(name, key, compute, timeout=SUMMARY_TIMEOUT):
+    """Return the cached value for key, computing and storing it on a miss"""
+    value = cache.get(key)
+    count_lookup(name, value)
+    if value is None:
+        value = compute()
+        cache.set(key, value, timeout)
+    return value
+
+
+async def acached(name, key, compute, timeout=SUMMARY_TIMEOUT):
+    """Async cached(); compute returns an awaitable"""
+    value = await cache.aget(key)
+    count_lookup(name, value)
+    if value is None:
+        value = await compute()
+        await cache.aset(key, value, timeout)
+    return value
+
+
+def count_lookup(name, value):
+    """Record a hit (value is not None) or a miss for an endpoint's cache statistics"""
+    with _stats_lock:
+        _stats[name]['hits' if value is not None else 'misses'] += 1
+
+
+def user_groups_key(name, user_id, versions):
+    """Key covering every group a user belongs to, from their {group_id: version}; changes when any of them changes or the set itself does"""
+    return f'{name}:{user_id}:{versions_digest(versions)}'
+
+
+def versions_digest(versions):
+    """Digest of {group_id: version}; changes when any of the groups does or the set of groups does"""
+    return hashlib.sha1(','.join(f'{group_id}.{versions[group_id]}' for group_id in sorted(versions)).encode()).hexdigest()
+
+
+def etag(*parts):
+    """Strong ETag built from version information, such as ExpenseGroup.version, rather than the response body"""
+    return '"%s"' % hashlib.sha1(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def not_modified(request, current_etag):
+    """True when the request's If-None-Match already names current_etag"""
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    candidates = [tag.strip() for tag in header.split(',')]
+    # If-None-Match uses the weak comparison, so W/ prefixes are ignored
+    return '*' in candidates or current_etag in [tag.removeprefix('W/') for tag in candidates]
+
+
+def stats():
+    """Hit/miss counters per cached endpoint for this process"""
+    with _stats_lock:
+        return {name: dict(counts) for name, counts in _stats.items()}
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+# System checks for settings the app can't run correctly with (manage.py check, and on
+# startup of runserver).
+
+PROCESS_LOCAL_CACHES = ('django.core.cache.backends.locmem.LocMemCache',)
+
+
+@register()
+def shared_cache_check(app_configs, **kwargs):
+    """Production runs several worker processes, and they have to share the cache that invalidates cached users"""
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if getattr(settings, 'SETTINGS_PROFILE', None) != 'production' or backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Error(
+        'The production profile needs a cache shared between worker processes.',
+        hint='Set CACHE_REDIS_URL. Cached users are invalidated through the cache (see split_expense/authentication.py), '
+             'so with a cache per process a password change or deactivation only reaches the worker that saved the user. '
+             'When serving from a single process, add split_expense.E001 to SILENCED_SYSTEM_CHECKS.',
+        id='split_expense.E001',
+    )]
@@ -0,0 +1,14 @@
+import pytest
+from django.core.cache import cache
+from .caching import reset_stats
+from .directory import hot_prefixes
+from .metrics import reset as reset_metrics
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    # Cached responses are keyed by group id, and ids are reused between tests
+    cache.clear()
+    reset_stats()
+    reset_metrics()
+    hot_prefixes.clear()
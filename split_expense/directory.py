@@ -0,0 +1,88 @@
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.db.models import Q
+from .models import UserDirectoryEntry
+
+# User directory search for the "add member" typeahead.
+#
+# Every user has a UserDirectoryEntry holding their lowercased username and email,
+# kept in sync by signals.py. A prefix search is a range scan over one of those
+# indexed columns (q <= value < q with its last character incremented), which
+# uses the index on every backend, unlike a case-insensitive LIKE. Queries
+# containing an @ search emails, everything else searches usernames; searching
+# both at once would need every match sorted before the first page could be
+# returned. Pages of hot prefixes are kept in a small in-process LRU for a few
+# seconds.
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 50
+MAX_QUERY_LENGTH = 150
+
+DEFAULT_CACHE_SIZE = 1024
+DEFAULT_CACHE_SECONDS = 30
+
+
+def normalise(query):
+    return query.strip().lower()[:MAX_QUERY_LENGTH]
+
+
+def prefix_filter(field, prefix):
+    """Filter for values of field starting with prefix, as an index-friendly range"""
+    if not prefix:
+        return Q()
+    last = ord(prefix[-1])
+    if last == 0x10FFFF:
+        return Q(**{f'{field}__startswith': prefix})
+    return Q(**{f'{field}__gte': prefix, f'{field}__lt': prefix[:-1] + chr(last + 1)})
+
+
+def search_field(prefix):
+    return 'email_lower' if '@' in prefix else 'username_lower'
+
+
+def entries_matching(prefix):
+    """Directory entries matching the (normalised) prefix and the ordering to page through them by"""
+    field = search_field(prefix)
+    entries = UserDirectoryEntry.objects.select_related('user').only('username_lower', 'email_lower', 'user__username', 'user__email')
+    return entries.filter(prefix_filter(field, prefix)), [field, 'user_id']
+
+
+class PrefixCache:
+    """Thread-safe LRU of search result pages that expire after a few seconds"""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        size = getattr(settings, 'USER_SEARCH_CACHE_SIZE', DEFAULT_CACHE_SIZE)
+        if size <= 0:
+            return
+        expires = time.monotonic() + getattr(settings, 'USER_SEARCH_CACHE_SECONDS', DEFAULT_CACHE_SECONDS)
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+#Cleared in this process whenever a user changes; other workers see the change once their entries expire
+hot_prefixes = PrefixCache()
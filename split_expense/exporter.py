@@ -0,0 +1,152 @@
+import csv
+import io
+import json
+from itertools import groupby
+from django.db import connections, models
+from django.db.models import F, Value
+from .models import Expense, Contribution, Share
+
+# Streaming export of a group's expenses as CSV or NDJSON.
+#
+# The columns are the importer's (see importer.py) plus id, so an export can be
+# imported into another group, keeping its dates. Expenses, contributions and
+# shares are read by a single UNION ALL query ordered by expense, grouped back
+# into expenses as the rows arrive and written out row by row. Nothing holds
+# more than one chunk of rows, so memory use doesn't grow with the size of the
+# group. It has to be one query: on MySQL the rows are streamed through a
+# server-side cursor, which keeps the connection busy until it is read to the
+# end (mysqlclient's default cursor would buffer the whole result instead).
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+CSV_COLUMNS = ['id', 'created_at', 'description', 'amount', 'split_type', 'paid_by', 'contributions', 'shares']
+CHUNK_SIZE = 2000
+FLUSH_BYTES = 64 * 1024  # Rows are buffered up to this size so the server isn't handed one tiny chunk per row
+EXPENSE, CONTRIBUTION, SHARE = range(3)  # The parts of _rows(), in the order each expense's rows come in
+ROW_COLUMNS = ['row_created_at', 'row_expense_id', 'row_part', 'row_username', 'row_amount', 'row_description', 'row_split_type', 'row_id']
+
+
+def iter_expenses(group, using=None, chunk_size=CHUNK_SIZE):
+    """Yield one dict per expense of the group, oldest first, with its non-zero contributions and its shares"""
+    rows = _stream(_rows(group, using), chunk_size)
+    for (created_at, expense_id), parts in groupby(rows, key=lambda row: row[:2]):
+        expense = None
+        paid = []
+        owed = []
+        for _, _, part, username, amount, description, split_type in parts:
+            if part == EXPENSE:
+                expense = (description, amount, split_type)
+            elif part == CONTRIBUTION:
+                if amount:
+                    paid.append({'username': username, 'amount': str(amount)})
+            else:
+                owed.append({'username': username, 'amount': str(amount)})
+        description, amount, split_type = expense
+        yield {
+            'id': expense_id,
+            'created_at': created_at.isoformat(),
+            'description': description,
+            'amount': str(amount),
+            'split_type': split_type,
+            'paid_by': paid[0]['username'] if len(paid) == 1 else None,
+            'contributions': paid,
+            'shares': owed,
+        }
+
+
+def _rows(group, using):
+    # The expenses, their contributions and their shares as one query, with a row for each: (created_at, expense id,
+    # part, username, amount, description, split_type, row id), ordered so that each expense's rows come together
+    none = Value(None, output_field=models.CharField())
+
+    def part(queryset, number, **columns):
+        return queryset.using(using).filter(group=group).annotate(row_part=Value(number), row_id=F('id'), **columns).values_list(*ROW_COLUMNS)
+
+    expenses = part(
+        Expense.objects, EXPENSE, row_created_at=F('created_at'), row_expense_id=F('id'), row_username=none,
+        row_amount=F('amount'), row_description=F('description'), row_split_type=F('split_type'),
+    )
+    paid, owed = (
+        part(
+            model.objects, number, row_created_at=F('expense__created_at'), row_expense_id=F('expense_id'), row_username=F('user__username'),
+            row_amount=F('amount'), row_description=none, row_split_type=none,
+        )
+        for model, number in [(Contribution, CONTRIBUTION), (Share, SHARE)]
+    )
+    return expenses.union(paid, owed, all=True).order_by('row_created_at', 'row_expense_id', 'row_part', 'row_id')
+
+
+def _stream(queryset, chunk_size):
+    """queryset.iterator(), except that on MySQL the rows are read through a server-side cursor: mysqlclient's
+    default cursor holds the whole result in memory, whatever the chunk size"""
+    connection = connections[queryset.db]
+    if connection.vendor != 'mysql':
+        for row in queryset.iterator(chunk_size=chunk_size):
+            yield row[:-1]
+        return
+
+    from MySQLdb.cursors import SSCursor
+    compiler = queryset.query.get_compiler(queryset.db)
+    sql, params = compiler.as_sql()
+    connection.ensure_connection()
+    # Wrapped the way connection.cursor() wraps its cursors, so execute wrappers (e.g. the query metrics)
+    # and query logging see the export too. Nothing else may use the connection until the cursor has been
+    # read to the end or closed
+    with connection._prepare_cursor(connection.connection.cursor(SSCursor)) as cursor:
+        cursor.execute(sql, params)
+
+        def chunks():
+            while rows := cursor.fetchmany(chunk_size):
+                yield rows
+
+        # The compiler converts the raw rows as iterator() would, e.g. cents to Decimal and datetimes to aware ones
+        for row in compiler.results_iter(chunks(), tuple_expected=True):
+            yield row[:-1]
+
+
+def _buffered(lines):
+    buffer = []
+    size = 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= FLUSH_BYTES:
+            yield ''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def _csv_lines(expenses):
+    out = io.StringIO()
+    writer = csv.writer(out)
+
+    def line(values):
+        writer.writerow(values)
+        value = out.getvalue()
+        out.seek(0)
+        out.truncate()
+        return value
+
+    yield line(CSV_COLUMNS)
+    for expense in expenses:
+        yield line([expense[column] or '' for column in CSV_COLUMNS[:-2]] + [_pairs(expense['contributions']), _pairs(expense['shares'])])
+
+
+def _pairs(amounts):
+    # The importer's "user:amount;user:amount" form
+    return ';'.join(f"{a['username']}:{a['amount']}" for a in amounts)
+
+
+def _ndjson_lines(expenses):
+    for expense in expenses:
+        yield json.dumps(expense) + '\n'
+
+
+def render(expenses, file_format):
+    """Encode expenses as chunks of CSV or NDJSON text"""
+    lines = _csv_lines(expenses) if file_format == 'csv' else _ndjson_lines(expenses)
+    return _buffered(lines)
@@ -0,0 +1,74 @@
+import hashlib
+import json
+from functools import wraps
+from django.db import IntegrityError, transaction
+from rest_framework import status
+from rest_framework.response import Response
+from .models import IdempotencyKey, Change
+
+# Idempotency-Key support for POST endpoints.
+#
+# The key row is inserted in the same transaction as the write it protects and
+# only committed with a successful response, which it stores. A retry with the
+# same key finds that row and gets the stored response back without running the
+# view. A concurrent duplicate that gets past the lookup blocks on the (user, key)
+# unique constraint until the first request commits or rolls back, then replays
+# or runs, so no explicit locking is needed. Failed requests leave no row behind
+# and can be retried with the same key. The view's changes are appended to the
+# change log after the key is stored, so the log stays locked only for the commit.
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+DEFAULT_TTL = 24 * 60 * 60  # Seconds; see the purge_idempotency_keys command
+
+
+def fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f'{request.method} {request.path}\n{body}'.encode()).hexdigest()
+
+
+def idempotent(view):
+    """Replay the stored response for POSTs repeating an Idempotency-Key header"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if request.method != 'POST' or not key:
+            return view(request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response({'error': f'{HEADER} must be at most {MAX_KEY_LENGTH} characters'}, status=status.HTTP_400_BAD_REQUEST)
+
+        request_fingerprint = fingerprint(request)
+        # Plain retries find the committed row with one read
+        record = IdempotencyKey.objects.filter(user=request.user, key=key).first()
+        if record is not None:
+            return _replay(record, request_fingerprint)
+
+        with transaction.atomic(), Change.objects.deferred():
+            try:
+                with transaction.atomic():
+                    record = IdempotencyKey.objects.create(
+                        user=request.user, key=key, fingerprint=request_fingerprint, status_code=0, response={},
+                    )
+            except IntegrityError:
+                # A concurrent duplicate committed first
+                return _replay(IdempotencyKey.objects.filter(user=request.user, key=key).first(), request_fingerprint)
+
+            response = view(request, *args, **kwargs)
+            if not status.is_success(response.status_code):
+                # Nothing was written, so the key stays free for a corrected retry
+                transaction.set_rollback(True)
+                return response
+            record.status_code = response.status_code
+            record.response = response.data
+            record.save(update_fields=['status_code', 'response'])
+            return response
+    return wrapper
+
+
+def _replay(record, request_fingerprint):
+    if record is None:
+        # Purged between the insert and this read
+        return Response({'error': 'Please retry the request'}, status=status.HTTP_409_CONFLICT)
+    if record.fingerprint != request_fingerprint:
+        return Response({'error': f'{HEADER} was already used for a different request'}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    return Response(record.response, status=record.status_code, headers={'Idempotent-Replayed': 'true'})
@@ -0,0 +1,247 @@
+import csv
+import io
+import json
+from collections import defaultdict, deque
+from datetime import datetime, time
+from decimal import Decimal, InvalidOperation
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from .models import Expense, Contribution, Share, MemberBalance, Change, spend_day
+from .money import to_cents, to_decimal
+from .splitter import SplitError, split
+
+# Bulk import of historical expenses from CSV or NDJSON uploads.
+#
+# CSV columns: description, amount, split_type, paid_by, contributions, shares, created_at
+#   contributions is only used for custom splits, as "alice:60.00;bob:40.00"
+#   shares is what each participant owes in other splits, in the same form
+#   created_at (or date) is optional, an ISO 8601 date or date and time
+# NDJSON lines: {"description": ..., "amount": ..., "split_type": ...,
+#                "paid_by": ..., "contributions": [{"username": ..., "amount": ...}],
+#                "shares": [{"username": ..., "amount": ...}], "created_at": ...}
+#
+# Rows without a date are stamped with the time of the import. Dated rows count
+# towards their own day in the daily rollup and keep their place in the history.
+#
+# Splits other than custom are paid in full by paid_by (or the uploader) and
+# owed as listed in shares. Without shares, an equal split is owed evenly by
+# every member, as when it is posted to manage_expenses; the other split types
+# need their shares, since percentages and weights are not stored.
+
+FORMATS = ['csv', 'ndjson']
+CHUNK_SIZE = 1000
+MAX_AMOUNT = Decimal('99999999.99')
+
+
+class RowError(Exception):
+    pass
+
+
+def detect_format(upload):
+    """Guess the upload format from its content type or file extension"""
+    name = (upload.name or '').lower()
+    content_type = (upload.content_type or '').lower()
+    if name.endswith('.csv') or 'csv' in content_type:
+        return 'csv'
+    if name.endswith(('.ndjson', '.jsonl')) or 'ndjson' in content_type or 'jsonl' in content_type:
+        return 'ndjson'
+    return None
+
+
+def iter_rows(fileobj, file_format):
+    """Yield (row number, row dict) pairs without reading the whole upload into memory"""
+    text = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+    if file_format == 'csv':
+        for row_number, row in enumerate(csv.DictReader(text), start=1):
+            yield row_number, row
+        return
+
+    for row_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield row_number, row if isinstance(row, dict) else {'__invalid__': line.strip()}
+
+
+def parse_amount(value):
+    try:
+        amount = Decimal(str(value).strip())
+    except (InvalidOperation, ValueError):
+        raise RowError(f'Invalid amount {value!r}')
+    if not amount.is_finite() or amount.as_tuple().exponent < -2 or abs(amount) > MAX_AMOUNT:
+        raise RowError(f'Invalid amount {value!r}')
+    return amount
+
+
+def parse_created_at(value):
+    """An ISO 8601 date or date and time; without a time zone it is taken in the current one"""
+    text = str(value).strip()
+    try:
+        created_at = parse_datetime(text)
+        if created_at is None:
+            day = parse_date(text)
+            created_at = datetime.combine(day, time()) if day else None
+    except ValueError:
+        created_at = None
+    if created_at is None:
+        raise RowError(f'Invalid date {value!r}')
+    return timezone.make_aware(created_at) if timezone.is_naive(created_at) else created_at
+
+
+def parse_contributions(value):
+    """Accept either a list of {username, amount} dicts or the CSV "user:amount;user:amount" form"""
+    if isinstance(value, list):
+        return [(c.get('username'), c.get('amount')) for c in value if isinstance(c, dict)]
+    contributions = []
+    for part in str(value or '').split(';'):
+        if not part.strip():
+            continue
+        username, _, amount = part.partition(':')
+        contributions.append((username.strip(), amount))
+    return contributions
+
+
+def validate_row(row, member_ids, default_payer):
+    """Turn a raw row into (expense fields, {user_id: amount paid}, {user_id: amount owed}) or raise RowError;
+    member_ids maps usernames to ids in user id order"""
+    if '__invalid__' in row:
+        raise RowError('Row is not a JSON object')
+
+    description = str(row.get('description') or '').strip()
+    split_type = str(row.get('split_type') or '').strip()
+    if not description or not row.get('amount') or not split_type:
+        raise RowError('Description, amount, and split type are required')
+    if len(description) > Expense._meta.get_field('description').max_length:
+        raise RowError('Description is too long')
+    if split_type not in dict(Expense.SPLIT_TYPE_CHOICES):
+        raise RowError('Invalid split type')
+
+    amount = parse_amount(row['amount'])
+    if amount <= 0:
+        raise RowError('Expense amount must be greater than zero')
+
+    paid = defaultdict(Decimal)
+    owed = {}
+    if split_type != 'custom':
+        payer = str(row.get('paid_by') or default_payer).strip()
+        if payer not in member_ids:
+            raise RowError(f'User {payer} is not a member of the group')
+        paid[member_ids[payer]] = amount
+        owed = _owed(split_type, amount, parse_contributions(row.get('shares')), member_ids)
+    else:
+        contributions = parse_contributions(row.get('contributions'))
+        if not contributions:
+            raise RowError('Contributions are required for custom split')
+        for username, value in contributions:
+            if not isinstance(username, str) or username not in member_ids:
+                raise RowError(f'User {username} is not a member of the group')
+            contribution = parse_amount(value)
+            if contribution < 0:
+                raise RowError('Contribution amount must not be negative')
+            paid[member_ids[username]] += contribution
+        if sum(paid.values()) != amount:
+            raise RowError('Contributions do not match the total amount')
+
+    expense = {'description': description, 'amount': amount, 'split_type': split_type}
+    created_at = row.get('created_at') or row.get('date')
+    if created_at:
+        expense['created_at'] = parse_created_at(created_at)
+    return expense, paid, owed
+
+
+def _owed(split_type, amount, shares, member_ids):
+    """{user_id: amount owed} from a row's shares, or an even split between all members for equal rows without any"""
+    if not shares:
+        if split_type != 'equal':
+            raise RowError(f'Shares are required for {split_type} split')
+        user_ids = list(member_ids.values())
+        return dict(zip(user_ids, map(to_decimal, split('equal', to_cents(amount), user_ids))))
+
+    owed = {}
+    for username, value in shares:
+        if not isinstance(username, str) or username not in member_ids:
+            raise RowError(f'User {username} is not a member of the group')
+        if member_ids[username] in owed:
+            raise RowError(f'User {username} appears more than once in shares')
+        owed[member_ids[username]] = parse_amount(value)
+    try:
+        split('exact', to_cents(amount), list(owed.values()))
+    except SplitError as e:
+        raise RowError(str(e))
+    return owed
+
+
+def import_expenses(group, rows, default_payer, chunk_size=CHUNK_SIZE):
+    """Validate and store rows in chunks inside one transaction; returns (created count, row errors)"""
+    # Resolve the group's members once for every row
+    member_ids = dict(group.members.order_by('id').values_list('username', 'id'))
+    ledger_deltas = defaultdict(lambda: defaultdict(Decimal))  # day -> user id -> amount paid
+    owed_deltas = defaultdict(Decimal)  # user id -> amount owed
+    created_ids = []
+    errors = []
+
+    with transaction.atomic():
+        chunk = []
+        for row_number, row in rows:
+            try:
+                chunk.append(validate_row(row, member_ids, default_payer))
+            except RowError as e:
+                errors.append({'row': row_number, 'error': str(e)})
+                continue
+            if len(chunk) >= chunk_size:
+                created_ids += _write_chunk(group, chunk, ledger_deltas, owed_deltas)
+                chunk = []
+        if chunk:
+            created_ids += _write_chunk(group, chunk, ledger_deltas, owed_deltas)
+
+        for day, deltas in ledger_deltas.items():
+            MemberBalance.objects.apply_deltas(group.id, deltas, day)
+        MemberBalance.objects.apply_deltas(group.id, {}, owed=owed_deltas)
+        # Logged last, as the change log is locked from here until the import commits
+        Change.objects.record(group.id, 'expense', created_ids)
+
+    return len(created_ids), errors
+
+
+def _write_chunk(group, chunk, ledger_deltas, owed_deltas):
+    expenses = [Expense(group=group, **fields) for fields, _, _ in chunk]
+    if connection.features.can_return_rows_from_bulk_insert:
+        Expense.objects.bulk_create(expenses)
+    else:
+        _bulk_create_without_returning(group, expenses)
+
+    contributions = []
+    shares = []
+    for expense, (_, paid, owed) in zip(expenses, chunk):
+        day = spend_day(expense.created_at)
+        for user_id, amount in paid.items():
+            contributions.append(Contribution(expense=expense, group_id=expense.group_id, user_id=user_id, amount=amount))
+            ledger_deltas[day][user_id] += amount
+        for user_id, amount in owed.items():
+            shares.append(Share(expense=expense, group_id=expense.group_id, user_id=user_id, amount=amount))
+            owed_deltas[user_id] += amount
+    Contribution.objects.bulk_create(contributions)
+    Share.objects.bulk_create(shares)
+    return [expense.id for expense in expenses]
+
+
+def _bulk_create_without_returning(group, expenses):
+    """bulk_create for backends such as MySQL that don't return primary keys from bulk inserts: the new rows are
+    read back and matched to the expenses by their fields, in id order as they were inserted"""
+    last_id = Expense.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+    Expense.objects.bulk_create(expenses)
+
+    created = defaultdict(deque)
+    rows = Expense.objects.filter(
+        group=group, id__gt=last_id,
+        created_at__range=(min(e.created_at for e in expenses), max(e.created_at for e in expenses)),
+    ).order_by('id').values_list('id', 'description', 'amount', 'created_at')
+    for expense_id, *fields in rows:
+        created[tuple(fields)].append(expense_id)
+    for expense in expenses:
+        expense.id = created[(expense.description, expense.amount, expense.created_at)].popleft()
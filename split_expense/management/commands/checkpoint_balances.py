@@ -0,0 +1,38 @@
+from datetime import date, datetime, time
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+from django.utils import timezone
+from split_expense.models import BalanceCheckpoint, Expense
+
+
+class Command(BaseCommand):
+    help = 'Checkpoint the balance ledger of each group so drift checks and rebuilds only read newer history, then compact old checkpoints'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--group', type=int, action='append', dest='groups', help='Only process this group id (repeatable)')
+        parser.add_argument('--before', help='Checkpoint as of the last expense created before this date (YYYY-MM-DD) instead of the latest one')
+        parser.add_argument('--keep', type=int, default=1, help='Checkpoints to keep per group when compacting (default 1)')
+
+    def handle(self, *args, **options):
+        group_ids = options['groups']
+        if options['keep'] < 1:
+            raise CommandError('--keep must be at least 1')
+
+        expenses = Expense.objects.all()
+        if group_ids is not None:
+            expenses = expenses.filter(group_id__in=group_ids)
+        if options['before']:
+            try:
+                before = date.fromisoformat(options['before'])
+            except ValueError:
+                raise CommandError('Invalid date for --before. Use YYYY-MM-DD')
+            expenses = expenses.filter(created_at__lt=timezone.make_aware(datetime.combine(before, time.min)))
+
+        # The last expense of every group in one query; each checkpoint then starts from the group's previous one
+        last_expenses = expenses.values_list('group_id').annotate(last=Max('id')).order_by('group_id')
+        for group_id, last_expense_id in last_expenses:
+            BalanceCheckpoint.objects.create_for(group_id, last_expense_id)
+        self.stdout.write(self.style.SUCCESS(f'Checkpointed {len(last_expenses)} group(s)'))
+
+        compacted = BalanceCheckpoint.objects.compact(group_ids, keep=options['keep'])
+        self.stdout.write(self.style.SUCCESS(f'Removed {compacted} old checkpoint(s)'))
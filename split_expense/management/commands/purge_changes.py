@@ -0,0 +1,33 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+from django.utils import timezone
+from split_expense.models import Change, ChangeSequence
+
+DEFAULT_RETENTION_DAYS = 30
+
+
+class Command(BaseCommand):
+    help = 'Delete change log entries older than CHANGE_LOG_RETENTION_DAYS days; clients with older sync cursors must reload in full'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, help='Age in days (default: CHANGE_LOG_RETENTION_DAYS)')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Rows deleted per statement, to keep locks short')
+
+    def handle(self, *args, **options):
+        days = options['older_than'] if options['older_than'] is not None else getattr(settings, 'CHANGE_LOG_RETENTION_DAYS', DEFAULT_RETENTION_DAYS)
+        cutoff = Change.objects.filter(created_at__lt=timezone.now() - timedelta(days=days)).aggregate(last=Max('id'))['last']
+        if cutoff is None:
+            self.stdout.write(self.style.SUCCESS('Deleted 0 change(s)'))
+            return
+
+        # Turn away cursors before the cutoff first, so no sync reads a partly purged log
+        ChangeSequence.objects.filter(pk=1, purged_through__lt=cutoff).update(purged_through=cutoff)
+        deleted = 0
+        while True:
+            ids = list(Change.objects.filter(id__lte=cutoff).values_list('pk', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            deleted += Change.objects.filter(pk__in=ids).delete()[0]
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} change(s)'))
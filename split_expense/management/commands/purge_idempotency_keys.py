@@ -0,0 +1,26 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from split_expense.idempotency import DEFAULT_TTL
+from split_expense.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = 'Delete stored Idempotency-Key responses older than IDEMPOTENCY_KEY_TTL seconds'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, help='Age in seconds (default: IDEMPOTENCY_KEY_TTL)')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Rows deleted per statement, to keep locks short')
+
+    def handle(self, *args, **options):
+        ttl = options['older_than'] if options['older_than'] is not None else getattr(settings, 'IDEMPOTENCY_KEY_TTL', DEFAULT_TTL)
+        expired = IdempotencyKey.objects.filter(created_at__lt=timezone.now() - timedelta(seconds=ttl))
+
+        deleted = 0
+        while True:
+            ids = list(expired.values_list('pk', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            deleted += IdempotencyKey.objects.filter(pk__in=ids).delete()[0]
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} idempotency key(s)'))
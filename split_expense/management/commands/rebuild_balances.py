@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from split_expense.models import BalanceCheckpoint, MemberBalance, DailySpend
+
+#Tables derived from the contribution and share history, with what to call them in the output
+LEDGERS = [('ledger', MemberBalance), ('daily spend', DailySpend)]
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-member balance ledger and daily spend rollup from contributions and shares, or check them for drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--group', type=int, action='append', dest='groups', help='Only process this group id (repeatable)')
+        parser.add_argument('--check', action='store_true', help='Report drift without modifying anything')
+        parser.add_argument('--ignore-checkpoints', action='store_true', help='Read the whole history instead of starting from balance checkpoints')
+
+    def handle(self, *args, **options):
+        group_ids = options['groups']
+        from_checkpoints = not options['ignore_checkpoints']
+
+        if options['check']:
+            drifted = 0
+            for name, model in LEDGERS:
+                drift = model.objects.find_drift(group_ids, from_checkpoints)
+                for *key, field, stored, actual in drift:
+                    where = ' '.join(f"{key_field.removesuffix('_id')} {value}" for key_field, value in zip(model.objects.key_fields, key))
+                    self.stdout.write(f'{where}: {name} {field} {stored} != history {actual}')
+                drifted += len(drift)
+            if drifted:
+                raise CommandError(f'{drifted} row(s) have drifted')
+            self.stdout.write(self.style.SUCCESS('Balance ledger and daily spend match contributions and shares'))
+            return
+
+        if not from_checkpoints:
+            # The checkpoints may be what drifted, so a full rebuild drops them; checkpoint_balances makes new ones
+            checkpoints = BalanceCheckpoint.objects.all()
+            if group_ids is not None:
+                checkpoints = checkpoints.filter(group_id__in=group_ids)
+            checkpoints.delete()
+
+        for name, model in LEDGERS:
+            count = model.objects.rebuild(group_ids, from_checkpoints)
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} {name} row(s)'))
@@ -0,0 +1,188 @@
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+# Per-endpoint request instrumentation.
+#
+# The middleware wraps every database connection with an execute wrapper for the
+# duration of a request, so it sees each query's SQL and timing without DEBUG
+# query logging. Aggregates are kept per worker process and rendered in the
+# Prometheus text exposition format by the metrics view.
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+#How many times the same SQL may run in one request before it is reported as an N+1 pattern
+DEFAULT_REPEATED_QUERY_THRESHOLD = 10
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield bound, total
+
+
+class EndpointMetrics:
+    __slots__ = ('wall', 'db', 'queries', 'responses', 'repeated_queries')
+
+    def __init__(self):
+        self.wall = Histogram(LATENCY_BUCKETS)
+        self.db = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.responses = Counter()
+        self.repeated_queries = 0
+
+
+_endpoints = defaultdict(EndpointMetrics)
+_lock = threading.Lock()
+
+
+class QueryRecorder:
+    """execute_wrapper that counts queries, sums their time and tallies repeated SQL"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            #Parameters are passed separately, so N+1 lookups share the same SQL text
+            self.statements[sql] += 1
+
+    def repeated(self, threshold):
+        return [(sql, count) for sql, count in self.statements.items() if count > threshold]
+
+
+def endpoint_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else 'unmatched'
+
+
+def record(endpoint, status_code, wall, recorder, repeated):
+    with _lock:
+        metrics = _endpoints[endpoint]
+        metrics.wall.observe(wall)
+        metrics.db.observe(recorder.duration)
+        metrics.queries.observe(recorder.count)
+        metrics.responses[status_code] += 1
+        metrics.repeated_queries += len(repeated)
+
+
+class QueryMetricsMiddleware:
+    """Record wall time, database time and query count per view and flag repeated queries"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.threshold = getattr(settings, 'METRICS_REPEATED_QUERY_THRESHOLD', DEFAULT_REPEATED_QUERY_THRESHOLD)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            _wrap_connections(stack, recorder)
+            response = self.get_response(request)
+        self.finish(request, response, time.perf_counter() - start, recorder)
+        return response
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        # The async ORM runs queries in the request's thread-sensitive executor and
+        # connections are per thread, so the wrappers are installed from that thread
+        stack = ExitStack()
+        await sync_to_async(_wrap_connections)(stack, recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        self.finish(request, response, time.perf_counter() - start, recorder)
+        return response
+
+    def finish(self, request, response, wall, recorder):
+        endpoint = endpoint_name(request)
+        repeated = recorder.repeated(self.threshold)
+        for sql, count in repeated:
+            logger.warning('Possible N+1 in %s: query ran %d times: %s', endpoint, count, sql[:500])
+        record(endpoint, response.status_code, wall, recorder, repeated)
+
+
+def _wrap_connections(stack, recorder):
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(recorder))
+
+
+def _format_histogram(lines, name, endpoint, histogram):
+    for bound, count in histogram.cumulative():
+        lines.append(f'{name}_bucket{{endpoint="{endpoint}",le="{bound}"}} {count}')
+    lines.append(f'{name}_bucket{{endpoint="{endpoint}",le="+Inf"}} {histogram.count}')
+    lines.append(f'{name}_sum{{endpoint="{endpoint}"}} {histogram.sum}')
+    lines.append(f'{name}_count{{endpoint="{endpoint}"}} {histogram.count}')
+
+
+def render_prometheus():
+    """Current aggregates in the Prometheus text exposition format (version 0.0.4)"""
+    histograms = [
+        ('http_request_duration_seconds', 'Wall time spent handling the request', 'wall'),
+        ('http_request_db_duration_seconds', 'Time spent executing database queries', 'db'),
+        ('http_request_db_queries', 'Database queries issued per request', 'queries'),
+    ]
+    with _lock:
+        endpoints = sorted(_endpoints.items())
+        lines = []
+        for name, help_text, attribute in histograms:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+            for endpoint, metrics in endpoints:
+                _format_histogram(lines, name, endpoint, getattr(metrics, attribute))
+
+        lines += ['# HELP http_responses_total Responses by endpoint and status code', '# TYPE http_responses_total counter']
+        for endpoint, metrics in endpoints:
+            for status_code, count in sorted(metrics.responses.items()):
+                lines.append(f'http_responses_total{{endpoint="{endpoint}",status="{status_code}"}} {count}')
+
+        lines += ['# HELP http_repeated_queries_total SQL statements repeated past the N+1 threshold within one request', '# TYPE http_repeated_queries_total counter']
+        for endpoint, metrics in endpoints:
+            lines.append(f'http_repeated_queries_total{{endpoint="{endpoint}"}} {metrics.repeated_queries}')
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    with _lock:
+        _endpoints.clear()
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.3 on 2026-10-18 02:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_balances(apps, schema_editor):
+    Contribution = apps.get_model('split_expense', 'Contribution')
+    MemberBalance = apps.get_model('split_expense', 'MemberBalance')
+    totals = Contribution.objects.values('expense__group_id', 'user_id').annotate(total=Sum('amount'))
+    MemberBalance.objects.bulk_create([
+        MemberBalance(group_id=row['expense__group_id'], user_id=row['user_id'], paid=row['total'])
+        for row in totals
+        if row['total']
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('split_expense', '0003_alter_expensegroup_name'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MemberBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('paid', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balances', to='split_expense.expensegroup')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='member_balances', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('group', 'user'), name='unique_member_balance')],
+            },
+        ),
+        migrations.RunPython(backfill_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_expense_group(apps, schema_editor):
+    Contribution = apps.get_model('split_expense', 'Contribution')
+    Expense = apps.get_model('split_expense', 'Expense')
+    Contribution.objects.update(
+        group_id=Subquery(Expense.objects.filter(pk=OuterRef('expense_id')).values('group_id')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('split_expense', '0004_memberbalance'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contribution',
+            name='group',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='contributions', to='split_expense.expensegroup'),
+        ),
+        migrations.RunPython(copy_expense_group, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='contribution',
+            name='group',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='contributions', to='split_expense.expensegroup'),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['group', 'created_at'], name='expense_group_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contribution',
+            index=models.Index(fields=['expense', 'user'], name='contribution_expense_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contribution',
+            index=models.Index(fields=['group', 'user'], name='contribution_group_user_idx'),
+        ),
+    ]
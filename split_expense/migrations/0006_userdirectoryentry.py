@@ -0,0 +1,45 @@
+# Generated by Django 5.1.3 on 2026-10-18 03:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Coalesce, Lower
+from django.db.models import Value
+
+
+def fill_directory(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    UserDirectoryEntry = apps.get_model('split_expense', 'UserDirectoryEntry')
+    users = User.objects.annotate(
+        username_lower=Lower('username'), email_lower=Lower(Coalesce('email', Value(''))),
+    ).values_list('id', 'username_lower', 'email_lower').iterator(chunk_size=5000)
+    batch = []
+    for user_id, username_lower, email_lower in users:
+        batch.append(UserDirectoryEntry(user_id=user_id, username_lower=username_lower, email_lower=email_lower))
+        if len(batch) >= 5000:
+            UserDirectoryEntry.objects.bulk_create(batch)
+            batch = []
+    UserDirectoryEntry.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('split_expense', '0005_contribution_group_and_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserDirectoryEntry',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='directory_entry', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('username_lower', models.CharField(max_length=150)),
+                ('email_lower', models.CharField(blank=True, max_length=254)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['username_lower'], name='directory_username_idx'), models.Index(fields=['email_lower'], name='directory_email_idx')],
+            },
+        ),
+        migrations.RunPython(fill_directory, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.3 on 2026-10-18 03:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+
+
+def fill_daily_spend(apps, schema_editor):
+    Contribution = apps.get_model('split_expense', 'Contribution')
+    DailySpend = apps.get_model('split_expense', 'DailySpend')
+    totals = Contribution.objects.values('group_id', 'user_id', day=TruncDate('expense__created_at')).annotate(paid=Sum('amount'))
+    DailySpend.objects.bulk_create([DailySpend(**row) for row in totals if row['paid']], batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('split_expense', '0006_userdirectoryentry'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySpend',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('paid', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_spend', to='split_expense.expensegroup')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_spend', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('group', 'day', 'user'), name='unique_daily_spend')],
+            },
+        ),
+        migrations.RunPython(fill_daily_spend, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+from django.db import migrations, models
+from django.db.models import ExpressionWrapper, F, Value
+from django.db.models.functions import Round
+import split_expense.money
+
+# Amount columns switch from DECIMAL to integer cents (see split_expense/money.py).
+# Each column is copied into a new BIGINT column as amount * 100, then replaces it.
+# Migrating back copies the cents into the re-created DECIMAL column as cents / 100;
+# the old column is made nullable first so it can be re-created on a non-empty table.
+
+AMOUNT_FIELDS = [
+    ('expense', 'amount', {'max_digits': 10}, {'max_digits': 10}),
+    ('contribution', 'amount', {'max_digits': 10}, {'max_digits': 10}),
+    ('memberbalance', 'paid', {'default': 0}, {'default': 0, 'max_digits': 14}),
+    ('dailyspend', 'paid', {'default': 0}, {'default': 0, 'max_digits': 14}),
+]
+
+
+def copy_to_cents(model_name, field_name):
+    def copy(apps, schema_editor):
+        model = apps.get_model('split_expense', model_name)
+        # Round: SQLite keeps decimals as floating point, so 12.34 * 100 may be 1233.99...
+        model.objects.update(**{f'{field_name}_cents': Round(F(field_name) * 100, output_field=models.BigIntegerField())})
+    return copy
+
+
+def copy_from_cents(model_name, field_name):
+    def copy(apps, schema_editor):
+        model = apps.get_model('split_expense', model_name)
+        # Divide by 100.0: SQLite would otherwise divide the integers and drop the cents
+        amount = ExpressionWrapper(F(f'{field_name}_cents') / Value(100.0), output_field=models.DecimalField(max_digits=14, decimal_places=2))
+        model.objects.update(**{field_name: amount})
+    return copy
+
+
+def operations():
+    for model_name, field_name, options, decimal_options in AMOUNT_FIELDS:
+        yield migrations.AddField(model_name=model_name, name=f'{field_name}_cents', field=models.BigIntegerField(null=True))
+        yield migrations.AlterField(model_name=model_name, name=field_name, field=models.DecimalField(decimal_places=2, null=True, **decimal_options))
+        yield migrations.RunPython(copy_to_cents(model_name, field_name), copy_from_cents(model_name, field_name))
+        yield migrations.RemoveField(model_name=model_name, name=field_name)
+        yield migrations.RenameField(model_name=model_name, old_name=f'{field_name}_cents', new_name=field_name)
+        yield migrations.AlterField(model_name=model_name, name=field_name, field=split_expense.money.MoneyField(**options))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('split_expense', '0008_idempotencykey'),
+    ]
+
+    operations = list(operations())
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.3 on 2026-10-18 03:39
+
+import django.db.models.deletion
+import split_expense.money
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('split_expense', '0009_amounts_in_cents'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='memberbalance',
+            name='owed',
+            field=split_expense.money.MoneyField(default=0, max_digits=14),
+        ),
+        migrations.AlterField(
+            model_name='expense',
+            name='split_type',
+            field=models.CharField(choices=[('equal', 'Equal'), ('exact', 'Exact'), ('percentage', 'Percentage'), ('shares', 'Shares'), ('custom', 'Custom')], max_length=10),
+        ),
+        migrations.CreateModel(
+            name='Share',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', split_expense.money.MoneyField(max_digits=10)),
+                ('expense', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shares', to='split_expense.expense')),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shares', to='split_expense.expensegroup')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['expense', 'user'], name='share_expense_user_idx'), models.Index(fields=['group', 'user'], name='share_group_user_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.3 on 2026-10-18 03:55
+
+import django.db.models.deletion
+import split_expense.money
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('split_expense', '0010_shares'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_expense_id', models.BigIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='split_expense.expensegroup')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CheckpointBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('paid', split_expense.money.MoneyField(default=0, max_digits=14)),
+                ('owed', split_expense.money.MoneyField(default=0, max_digits=14)),
+                ('checkpoint', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balances', to='split_expense.balancecheckpoint')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='balancecheckpoint',
+            constraint=models.UniqueConstraint(fields=('group', 'last_expense_id'), name='unique_balance_checkpoint'),
+        ),
+        migrations.AddConstraint(
+            model_name='checkpointbalance',
+            constraint=models.UniqueConstraint(fields=('checkpoint', 'user'), name='unique_checkpoint_balance'),
+        ),
+    ]
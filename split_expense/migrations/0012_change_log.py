@@ -0,0 +1,45 @@
+# Generated by Django 5.1.3 on 2026-10-18 04:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_sequence(apps, schema_editor):
+    # Existing rows have no changes logged; clients load them in full before their first sync
+    apps.get_model('split_expense', 'ChangeSequence').objects.create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('split_expense', '0011_balance_checkpoints'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('purged_through', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('group_id', models.BigIntegerField()),
+                ('kind', models.CharField(choices=[('group', 'Group'), ('expense', 'Expense')], max_length=10)),
+                ('object_id', models.BigIntegerField()),
+                ('action', models.CharField(choices=[('upsert', 'Upsert'), ('delete', 'Delete')], max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['group_id', 'id'], name='change_group_idx'), models.Index(fields=['user', 'id'], name='change_user_idx')],
+            },
+        ),
+        migrations.RunPython(create_sequence, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.3 on 2026-10-18 04:28
+
+import split_expense.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('split_expense', '0012_change_log'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expensegroup',
+            name='version',
+            field=models.BigIntegerField(default=split_expense.models._initial_version),
+        ),
+    ]
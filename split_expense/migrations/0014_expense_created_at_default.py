@@ -0,0 +1,19 @@
+# Generated by Django 5.1.3 on 2026-10-18 04:37
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('split_expense', '0013_expensegroup_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='expense',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-18 04:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('split_expense', '0014_expense_created_at_default'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='change',
+            name='action',
+            field=models.CharField(choices=[('upsert', 'Upsert'), ('delete', 'Delete'), ('resync', 'Resync')], max_length=10),
+        ),
+    ]
@@ -1,12 +1,35 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, F, Max, Q, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from collections import defaultdict
+from contextlib import contextmanager
+import time
+from contextvars import ContextVar
+from .money import MoneyField
 # Create your models here.
 
+def _initial_version():
+    # Start from the clock rather than 0 so a group id reused after a rollback or restore never meets old ETags or cache entries
+    return time.time_ns()
+
+
+class ExpenseGroupManager(models.Manager):
+    def bump(self, *group_ids):
+        """Move the groups to a new version, changing their ETags and cache keys in every worker once the write commits"""
+        self.filter(id__in=group_ids).update(version=F('version') + 1)
+
+
 #Model to represent a group of users sharing expenses
 class ExpenseGroup(models.Model):
     name = models.CharField(max_length=100)
     members = models.ManyToManyField(User, related_name="expense_groups")
+    version = models.BigIntegerField(default=_initial_version) #Changed by every write to the group, inside its transaction
+
+    objects = ExpenseGroupManager()
 
     def __str__(self):
         return self.name
@@ -14,15 +37,23 @@ class ExpenseGroup(models.Model):
 #Model to represent an individual expense
 class Expense(models.Model):
     SPLIT_TYPE_CHOICES = [
-        ("equal", "Equal"), #Split equally among members
-        ("custom", "Custom"), #Custom split
+        ("equal", "Equal"), #Split equally among all members or the chosen participants
+        ("exact", "Exact"), #Each participant owes a given amount
+        ("percentage", "Percentage"), #Each participant owes a percentage of the amount
+        ("shares", "Shares"), #Split in proportion to each participant's number of shares
+        ("custom", "Custom"), #Contributions say who paid; everyone shares the cost equally
     ]
 
     group = models.ForeignKey(ExpenseGroup, on_delete=models.CASCADE, related_name="expenses") #Belongs to a specific  group
     description = models.CharField(max_length=255)
-    amount = models.DecimalField(max_digits=10, decimal_places=2)
-    split_type = models.CharField(max_length=10, choices=SPLIT_TYPE_CHOICES) #equal or custom
-    created_at = models.DateTimeField(auto_now_add=True)
+    amount = MoneyField(max_digits=10) #Stored as integer cents
+    split_type = models.CharField(max_length=10, choices=SPLIT_TYPE_CHOICES)
+    created_at = models.DateTimeField(default=timezone.now, editable=False) #Not auto_now_add, so imported history keeps its dates
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['group', 'created_at'], name='expense_group_created_idx'), #Listing a group's expenses in order
+        ]
 
     def __str__(self):
         return f"{self.description} - {self.amount}"
@@ -37,11 +68,24 @@ class Expense(models.Model):
         self.clean()
         super().save(*args, **kwargs)
 
+    #Take the expense's contributions and shares out of the balance ledger before they cascade away
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            MemberBalance.objects.reverse_expense(self)
+            return super().delete(*args, **kwargs)
+
 
 class Contribution(models.Model):
     expense = models.ForeignKey(Expense, on_delete=models.CASCADE, related_name="contributions")
+    group = models.ForeignKey(ExpenseGroup, on_delete=models.CASCADE, related_name="contributions") #Copy of expense.group so balance queries skip the join
     user = models.ForeignKey(User, on_delete=models.CASCADE)
-    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    amount = MoneyField(max_digits=10) #Stored as integer cents
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['expense', 'user'], name='contribution_expense_user_idx'),
+            models.Index(fields=['group', 'user'], name='contribution_group_user_idx'), #Per-member totals within a group
+        ]
 
     def __str__(self):
         return f"{self.user.username}: {self.amount}"
@@ -52,4 +96,511 @@ class Contribution(models.Model):
 
     def save(self, *args, **kwargs):
         self.clean()
-        super().save(*args, **kwargs)
\ No newline at end of file
+        if self.group_id is None:
+            self.group_id = self.expense.group_id
+        with transaction.atomic():
+            BalanceCheckpoint.objects.invalidate(self.group_id, self.expense_id)
+            deltas = {}
+            if self.pk:
+                previous = Contribution.objects.filter(pk=self.pk).values('user_id', 'amount').first()
+                if previous:
+                    deltas[previous['user_id']] = -previous['amount']
+            super().save(*args, **kwargs)
+            deltas[self.user_id] = deltas.get(self.user_id, 0) + self.amount
+            MemberBalance.objects.apply_deltas(self.group_id, deltas, spend_day(self.expense.created_at))
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            BalanceCheckpoint.objects.invalidate(self.group_id, self.expense_id)
+            MemberBalance.objects.apply_deltas(self.group_id, {self.user_id: -self.amount}, spend_day(self.expense.created_at))
+            return super().delete(*args, **kwargs)
+
+
+#Model to represent what a participant owes towards an expense, as computed by splitter.py
+class Share(models.Model):
+    expense = models.ForeignKey(Expense, on_delete=models.CASCADE, related_name="shares")
+    group = models.ForeignKey(ExpenseGroup, on_delete=models.CASCADE, related_name="shares") #Copy of expense.group, like Contribution.group
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    amount = MoneyField(max_digits=10) #Stored as integer cents
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['expense', 'user'], name='share_expense_user_idx'),
+            models.Index(fields=['group', 'user'], name='share_group_user_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} owes {self.amount}"
+
+    def clean(self):
+        if self.amount < 0:
+            raise ValidationError("Share amount must not be negative.")
+
+    def save(self, *args, **kwargs):
+        self.clean()
+        if self.group_id is None:
+            self.group_id = self.expense.group_id
+        with transaction.atomic():
+            BalanceCheckpoint.objects.invalidate(self.group_id, self.expense_id)
+            deltas = {}
+            if self.pk:
+                previous = Share.objects.filter(pk=self.pk).values('user_id', 'amount').first()
+                if previous:
+                    deltas[previous['user_id']] = -previous['amount']
+            super().save(*args, **kwargs)
+            deltas[self.user_id] = deltas.get(self.user_id, 0) + self.amount
+            MemberBalance.objects.apply_deltas(self.group_id, {}, owed=deltas)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            BalanceCheckpoint.objects.invalidate(self.group_id, self.expense_id)
+            MemberBalance.objects.apply_deltas(self.group_id, {}, owed={self.user_id: -self.amount})
+            return super().delete(*args, **kwargs)
+
+
+def spend_day(created_at):
+    """The rollup day an expense created at `created_at` counts towards, in the current time zone like TruncDate"""
+    return timezone.localdate(created_at) if timezone.is_aware(created_at) else created_at.date()
+
+
+class LedgerManager(models.Manager):
+    """Running per-user totals (value_fields) keyed by key_fields, updated by deltas and rebuildable from the history"""
+    key_fields = ('group_id', 'user_id')
+    value_fields = ('paid',)
+    checkpointed = False  # Whether the history can start from BalanceCheckpoint snapshots
+
+    def _add(self, scope, **fields):
+        """Add each user's delta for every field ({field: {user_id: delta}}) to their row within scope, creating rows
+        as needed; False if there was nothing to add"""
+        fields = {field: {user_id: delta for user_id, delta in deltas.items() if delta} for field, deltas in fields.items()}
+        fields = {field: deltas for field, deltas in fields.items() if deltas}
+        if not fields:
+            return False
+        user_ids = set().union(*fields.values())
+
+        # Create missing rows at zero first; a concurrent writer creating the same row is ignored
+        existing = set(self.filter(**scope, user_id__in=user_ids).values_list('user_id', flat=True))
+        missing = [user_id for user_id in user_ids if user_id not in existing]
+        if missing:
+            self.bulk_create([self.model(**scope, user_id=user_id) for user_id in missing], ignore_conflicts=True)
+
+        # Then add every delta in one UPDATE so concurrent writers never overwrite each other
+        updates = {}
+        for field, deltas in fields.items():
+            model_field = self.model._meta.get_field(field)
+            updates[field] = F(field) + Case(
+                *[When(user_id=user_id, then=Value(delta, output_field=model_field)) for user_id, delta in deltas.items()],
+                default=Value(0, output_field=model_field),
+            )
+        self.filter(**scope, user_id__in=user_ids).update(**updates)
+        return True
+
+    def history(self, field):
+        """The rows whose amounts add up to `field`"""
+        return Contribution.objects.all()
+
+    def history_totals(self, rows):
+        return rows.values('group_id', 'user_id').annotate(total=Sum('amount'))
+
+    def compute_from_history(self, group_ids=None, from_checkpoints=True):
+        """Recompute the value fields from the history, as {key: {field: total}} keyed by key_fields.
+
+        Checkpointed ledgers start from each group's latest checkpoint and only read the history after it,
+        unless from_checkpoints is False.
+        """
+        if from_checkpoints and self.checkpointed:
+            latest = BalanceCheckpoint.objects.latest_by_group(group_ids)
+            actual = BalanceCheckpoint.objects.totals(latest)
+            scopes = BalanceCheckpoint.objects.history_scopes(latest, group_ids)
+        else:
+            actual = defaultdict(dict)
+            scopes = [Q() if group_ids is None else Q(group_id__in=group_ids)]
+
+        for field in self.value_fields:
+            for scope in scopes:
+                for row in self.history_totals(self.history(field).filter(scope)):
+                    values = actual[tuple(row[name] for name in self.key_fields)]
+                    values[field] = values.get(field, 0) + row['total']
+        return actual
+
+    def find_drift(self, group_ids=None, from_checkpoints=True):
+        """Return (*key, field, stored, actual) for every value that disagrees with the history"""
+        actual = self.compute_from_history(group_ids, from_checkpoints)
+        rows = self.all()
+        if group_ids is not None:
+            rows = rows.filter(group_id__in=group_ids)
+        stored = {tuple(row[name] for name in self.key_fields): row for row in rows.values(*self.key_fields, *self.value_fields)}
+
+        drift = []
+        for key in sorted(set(actual) | set(stored)):
+            for field in self.value_fields:
+                stored_value = stored[key][field] if key in stored else 0
+                actual_value = actual.get(key, {}).get(field, 0)
+                if stored_value != actual_value:
+                    drift.append((*key, field, stored_value, actual_value))
+        return drift
+
+    def rebuild(self, group_ids=None, from_checkpoints=True):
+        """Replace the rows with totals recomputed from the history"""
+        actual = self.compute_from_history(group_ids, from_checkpoints)
+        with transaction.atomic():
+            rows = self.all()
+            if group_ids is not None:
+                rows = rows.filter(group_id__in=group_ids)
+            rows.delete()
+            created = self.bulk_create([
+                self.model(**dict(zip(self.key_fields, key)), **values)
+                for key, values in actual.items()
+                if any(values.values())
+            ], batch_size=5000)
+        return len(created)
+
+
+class MemberBalanceManager(LedgerManager):
+    value_fields = ('paid', 'owed')
+    checkpointed = True
+
+    def history(self, field):
+        return Share.objects.all() if field == 'owed' else super().history(field)
+
+    def apply_deltas(self, group_id, deltas, day=None, owed=None):
+        """Add each user's delta to their paid total in the group, and to the group's DailySpend for `day` when given;
+        `owed` holds deltas to what users owe, from their shares of expenses"""
+        if not self._add({'group_id': group_id}, paid=deltas, owed=owed or {}):
+            return
+        if day is not None:
+            DailySpend.objects._add({'group_id': group_id, 'day': day}, paid=deltas)
+
+        # Cached summaries are keyed by group version, so ledger writes made outside the views invalidate them too
+        ExpenseGroup.objects.bump(group_id)
+
+    def reverse_expense(self, expense):
+        """Remove every contribution and share of an expense from the ledger"""
+        BalanceCheckpoint.objects.invalidate(expense.group_id, expense.id)
+        paid = Contribution.objects.filter(expense=expense).values('user_id').annotate(total=Sum('amount'))
+        owed = Share.objects.filter(expense=expense).values('user_id').annotate(total=Sum('amount'))
+        self.apply_deltas(
+            expense.group_id,
+            {row['user_id']: -row['total'] for row in paid},
+            spend_day(expense.created_at),
+            owed={row['user_id']: -row['total'] for row in owed},
+        )
+
+
+#Model to keep each member's running totals paid and owed in a group, updated alongside Contribution and Share writes
+class MemberBalance(models.Model):
+    group = models.ForeignKey(ExpenseGroup, on_delete=models.CASCADE, related_name="balances")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="member_balances")
+    paid = MoneyField(default=0)
+    owed = MoneyField(default=0) #Sum of the member's shares of expenses split with splitter.py
+
+    objects = MemberBalanceManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['group', 'user'], name='unique_member_balance'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} in {self.group.name}: paid {self.paid}, owes {self.owed}"
+
+
+class BalanceCheckpointManager(models.Manager):
+    """Snapshots of the MemberBalance ledger as of an expense, so verifying or rebuilding it only reads newer history"""
+
+    def invalidate(self, group_id, expense_id):
+        """Drop the group's checkpoints that include the expense, whose contributions or shares are changing"""
+        self.filter(group_id=group_id, last_expense_id__gte=expense_id).delete()
+
+    def latest_by_group(self, group_ids=None):
+        """Each group's latest checkpoint, as {group_id: (checkpoint id, last_expense_id)}"""
+        checkpoints = self.all()
+        if group_ids is not None:
+            checkpoints = checkpoints.filter(group_id__in=group_ids)
+        latest = {}
+        for checkpoint_id, group_id, last_expense_id in checkpoints.order_by('group_id', '-last_expense_id').values_list('id', 'group_id', 'last_expense_id'):
+            latest.setdefault(group_id, (checkpoint_id, last_expense_id))
+        return latest
+
+    def totals(self, latest):
+        """The ledger as of the checkpoints in latest_by_group(), as {(group_id, user_id): {field: total}}"""
+        totals = defaultdict(dict)
+        rows = CheckpointBalance.objects.filter(checkpoint_id__in=[checkpoint_id for checkpoint_id, _ in latest.values()])
+        for row in rows.values('checkpoint__group_id', 'user_id', 'paid', 'owed'):
+            totals[(row['checkpoint__group_id'], row['user_id'])] = {'paid': row['paid'], 'owed': row['owed']}
+        return totals
+
+    def history_scopes(self, latest, group_ids=None, batch_size=500):
+        """Filters that together select the history after the checkpoints in latest_by_group(), within group_ids.
+
+        The history of a checkpointed group is reached through its expenses newer than the checkpoint, so the rows
+        the checkpoint covers are never read; groups come in batches to keep each query small.
+        """
+        if not latest:
+            return [Q() if group_ids is None else Q(group_id__in=group_ids)]
+        if group_ids is None:
+            group_ids = ExpenseGroup.objects.values_list('id', flat=True)
+        uncovered = [group_id for group_id in group_ids if group_id not in latest]
+        scopes = [Q(group_id__in=uncovered[start:start + batch_size]) for start in range(0, len(uncovered), batch_size)]
+
+        bounds = list(latest.items())
+        for start in range(0, len(bounds), batch_size):
+            newer = Q()
+            for group_id, (_, last_expense_id) in bounds[start:start + batch_size]:
+                newer |= Q(group_id=group_id, id__gt=last_expense_id)
+            scopes.append(Q(expense__in=Expense.objects.filter(newer).values('id')))
+        return scopes
+
+    def create_for(self, group_id, last_expense_id=None):
+        """Checkpoint the group's ledger as of last_expense_id (default: its latest expense), starting from the latest
+        earlier checkpoint; None if there is nothing to checkpoint"""
+        if last_expense_id is None:
+            last_expense_id = Expense.objects.filter(group_id=group_id).aggregate(last=Max('id'))['last']
+            if last_expense_id is None:
+                return None
+
+        with transaction.atomic():
+            previous = self.filter(group_id=group_id, last_expense_id__lte=last_expense_id).order_by('-last_expense_id').first()
+            if previous and previous.last_expense_id == last_expense_id:
+                return previous
+
+            totals = defaultdict(lambda: {'paid': 0, 'owed': 0})
+            if previous:
+                for row in previous.balances.values('user_id', 'paid', 'owed'):
+                    totals[row['user_id']] = {'paid': row['paid'], 'owed': row['owed']}
+            for field, model in (('paid', Contribution), ('owed', Share)):
+                if previous:
+                    # Reach the newer rows through their expenses, as in history_scopes()
+                    expenses = Expense.objects.filter(group_id=group_id, id__gt=previous.last_expense_id, id__lte=last_expense_id)
+                    rows = model.objects.filter(expense__in=expenses.values('id'))
+                else:
+                    rows = model.objects.filter(group_id=group_id, expense_id__lte=last_expense_id)
+                for row in rows.values('user_id').annotate(total=Sum('amount')):
+                    totals[row['user_id']][field] += row['total']
+
+            checkpoint = self.create(group_id=group_id, last_expense_id=last_expense_id)
+            CheckpointBalance.objects.bulk_create([
+                CheckpointBalance(checkpoint=checkpoint, user_id=user_id, **values)
+                for user_id, values in totals.items()
+                if any(values.values())
+            ], batch_size=5000)
+        return checkpoint
+
+    def compact(self, group_ids=None, keep=1):
+        """Delete all but each group's `keep` latest checkpoints; returns how many were deleted"""
+        checkpoints = self.all()
+        if group_ids is not None:
+            checkpoints = checkpoints.filter(group_id__in=group_ids)
+        kept = defaultdict(int)
+        stale = []
+        for checkpoint_id, group_id in checkpoints.order_by('group_id', '-last_expense_id').values_list('id', 'group_id'):
+            kept[group_id] += 1
+            if kept[group_id] > keep:
+                stale.append(checkpoint_id)
+        self.filter(id__in=stale).delete()
+        return len(stale)
+
+
+#Snapshot of every member's paid and owed totals in a group, covering the expenses with ids up to last_expense_id
+class BalanceCheckpoint(models.Model):
+    group = models.ForeignKey(ExpenseGroup, on_delete=models.CASCADE, related_name="checkpoints")
+    last_expense_id = models.BigIntegerField() #Expense ids only grow, so this splits the history into before and after
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = BalanceCheckpointManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['group', 'last_expense_id'], name='unique_balance_checkpoint'), #Also finds the latest one
+        ]
+
+    def __str__(self):
+        return f"{self.group_id} up to expense {self.last_expense_id}"
+
+
+class CheckpointBalance(models.Model):
+    checkpoint = models.ForeignKey(BalanceCheckpoint, on_delete=models.CASCADE, related_name="balances")
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    paid = MoneyField(default=0)
+    owed = MoneyField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['checkpoint', 'user'], name='unique_checkpoint_balance'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} at {self.checkpoint_id}: paid {self.paid}, owes {self.owed}"
+
+
+#Lowercased username and email of each user, indexed for the prefix search in directory.py; kept in sync by signals.py
+class UserDirectoryEntry(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name="directory_entry")
+    username_lower = models.CharField(max_length=150)
+    email_lower = models.CharField(max_length=254, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['username_lower'], name='directory_username_idx'),
+            models.Index(fields=['email_lower'], name='directory_email_idx'),
+        ]
+
+    @classmethod
+    def values_for(cls, user):
+        return {'username_lower': user.username.lower(), 'email_lower': (user.email or '').lower()}
+
+    def __str__(self):
+        return self.username_lower
+
+
+class DailySpendManager(LedgerManager):
+    key_fields = ('group_id', 'user_id', 'day')
+
+    def history_totals(self, rows):
+        # Expense times are truncated to days by the database
+        return rows.values('group_id', 'user_id', day=TruncDate('expense__created_at')).annotate(total=Sum('amount'))
+
+
+#Rollup of what each member paid in a group per day, for the stats endpoint; maintained through MemberBalance.objects.apply_deltas
+class DailySpend(models.Model):
+    group = models.ForeignKey(ExpenseGroup, on_delete=models.CASCADE, related_name="daily_spend")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="daily_spend")
+    day = models.DateField()
+    paid = MoneyField(default=0)
+
+    objects = DailySpendManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['group', 'day', 'user'], name='unique_daily_spend'), #Also serves range reads by group and day
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} in {self.group_id} on {self.day}: {self.paid}"
+
+
+#Idempotency-Key header of a client's POST and the response it got, so retries replay it (see idempotency.py)
+class IdempotencyKey(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="idempotency_keys")
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64) #Hash of the request the key was first used with
+    status_code = models.PositiveSmallIntegerField()
+    response = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True) #For the purge command
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.key}"
+
+
+_deferred_changes = ContextVar('deferred_changes', default=None)
+
+
+class ChangeManager(models.Manager):
+    def record(self, group_id, kind, object_ids, action='upsert', user_ids=(None,)):
+        """Append a change for each object, visible to each of user_ids, or to every current member of the group for None"""
+        rows = [
+            Change(group_id=group_id, user_id=user_id, kind=kind, object_id=object_id, action=action)
+            for object_id in object_ids for user_id in user_ids
+        ]
+        deferred = _deferred_changes.get()
+        if deferred is not None:
+            deferred.extend(rows)
+        else:
+            self._append(rows)
+
+    @contextmanager
+    def deferred(self):
+        """Hold back the changes recorded in the block and append them together at its end, locking the log only then"""
+        if _deferred_changes.get() is not None:
+            # Already inside a deferred block, which appends these too
+            yield
+            return
+        rows = []
+        token = _deferred_changes.set(rows)
+        try:
+            yield
+        finally:
+            _deferred_changes.reset(token)
+        # Nothing to log when the block's transaction is being rolled back
+        if not (transaction.get_connection().in_atomic_block and transaction.get_rollback()):
+            self._append(rows)
+
+    def _append(self, rows):
+        if not rows:
+            return
+        with transaction.atomic(savepoint=False):
+            last_id = ChangeSequence.objects.reserve(len(rows))
+            for change_id, row in enumerate(rows, start=last_id - len(rows) + 1):
+                row.id = change_id
+            self.bulk_create(rows)
+
+    def visible_to(self, user, group_ids):
+        """Changes to the given groups of the user's, plus those addressed to the user alone"""
+        return self.filter(Q(group_id__in=group_ids, user__isnull=True) | Q(user=user))
+
+
+#Append-only log of writes for the sync endpoint. Ids come from ChangeSequence, so they grow in commit order
+class Change(models.Model):
+    KIND_CHOICES = [
+        ("group", "Group"), #Created, renamed or its members changed
+        ("expense", "Expense"),
+    ]
+    ACTION_CHOICES = [
+        ("upsert", "Upsert"),
+        ("delete", "Delete"), #Tombstone
+        ("resync", "Resync"), #The user was added to the group and has none of its history; sent to that user alone
+    ]
+
+    id = models.BigIntegerField(primary_key=True)
+    group_id = models.BigIntegerField() #Not a foreign key, so tombstones outlive their group
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.CASCADE) #Only this user sees the change, e.g. their removal from a group
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True) #For the purge command
+
+    objects = ChangeManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['group_id', 'id'], name='change_group_idx'),
+            models.Index(fields=['user', 'id'], name='change_user_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.id}: {self.action} {self.kind} {self.object_id}"
+
+
+class ChangeSequenceManager(models.Manager):
+    def reserve(self, count):
+        """Reserve the next count change ids, returning the last one.
+
+        The UPDATE locks the single sequence row until the caller's transaction ends, so a transaction
+        holding lower ids always commits first and readers never see a later id before an earlier one.
+        The price is that writes to every group queue on that row, so callers append their changes as
+        the last statement of their transaction (see deferred()) and hold it only through the commit.
+        """
+        if not self.filter(pk=1).update(last_id=F('last_id') + count):
+            self.get_or_create(pk=1)
+            self.filter(pk=1).update(last_id=F('last_id') + count)
+        return self.values_list('last_id', flat=True).get(pk=1)
+
+    def position(self):
+        """(last committed change id, last purged change id)"""
+        return self.filter(pk=1).values_list('last_id', 'purged_through').first() or (0, 0)
+
+
+#The change log's single counter row
+class ChangeSequence(models.Model):
+    last_id = models.BigIntegerField(default=0)
+    purged_through = models.BigIntegerField(default=0) #Changes up to this id have been purged, so older cursors can't sync
+
+    objects = ChangeSequenceManager()
+
+    def __str__(self):
+        return f"Changes up to {self.last_id}, purged through {self.purged_through}"
@@ -0,0 +1,84 @@
+from decimal import Decimal, ROUND_HALF_EVEN
+from django.db import models
+from django.db.models import Sum
+
+# Money as integer minor units (cents).
+#
+# Amounts are stored as whole cents in BIGINT columns, and the balance engine
+# adds and splits plain ints, which is exact and much faster than Decimal.
+# Amounts become Decimal only at the edges: MoneyField hands models and
+# serializers Decimal values with two places, and to_decimal() turns computed
+# results back into amounts for responses.
+
+CENTS = 100
+
+
+def to_cents(amount):
+    """Whole cents in a Decimal, int or numeric string amount, rounding half-even below a cent"""
+    return int((Decimal(amount) * CENTS).to_integral_value(rounding=ROUND_HALF_EVEN))
+
+
+def to_decimal(cents):
+    """The amount for a number of cents, with two decimal places"""
+    return Decimal(cents).scaleb(-2)
+
+
+def split_evenly(total, parts):
+    """Split total cents into `parts` shares differing by at most a cent; the first shares get the extra cents"""
+    share, extra = divmod(total, parts)
+    return [share + 1] * extra + [share] * (parts - extra)
+
+
+def allocate(total, weights):
+    """Split total cents in proportion to non-negative integer weights, with the shares summing exactly to total.
+
+    Every share is first rounded down; the cents left over go to the shares with
+    the largest remainders (largest-remainder method), ties to the earlier weight.
+    """
+    weight_sum = sum(weights)
+    if not weight_sum:
+        return [0] * len(weights)
+    shares = []
+    remainders = []
+    for i, weight in enumerate(weights):
+        share, remainder = divmod(total * weight, weight_sum)
+        shares.append(share)
+        remainders.append((-remainder, i))
+    for _, i in sorted(remainders)[:total - sum(shares)]:
+        shares[i] += 1
+    return shares
+
+
+def sum_cents(expression, **extra):
+    """Sum of a MoneyField as raw integer cents, without the conversion to Decimal"""
+    return Sum(expression, output_field=models.BigIntegerField(), **extra)
+
+
+class MoneyField(models.DecimalField):
+    """An amount with two decimal places, stored as integer cents and read back as Decimal"""
+
+    def __init__(self, *args, max_digits=14, **kwargs):
+        kwargs['decimal_places'] = 2
+        super().__init__(*args, max_digits=max_digits, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        del kwargs['decimal_places']
+        return name, path, args, kwargs
+
+    def get_internal_type(self):
+        return 'BigIntegerField'
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if hasattr(value, 'as_sql'):
+            return value
+        if not prepared:
+            value = self.get_prep_value(value)
+        return None if value is None else to_cents(value)
+
+    def get_db_prep_save(self, value, connection):
+        # DecimalField adapts saved values itself instead of going through get_db_prep_value
+        return self.get_db_prep_value(value, connection)
+
+    def from_db_value(self, value, expression, connection):
+        return None if value is None else to_decimal(value)
@@ -0,0 +1,79 @@
+import base64
+import json
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+# Keyset (cursor) pagination: each page continues strictly after the last row of the
+# previous one, so the cost of a page doesn't grow with how deep the client has paged.
+# Pages are returned as plain lists; the next cursor travels in the Link and
+# X-Next-Cursor response headers so existing clients keep receiving a list.
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 500
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def encode_cursor(values):
+    payload = json.dumps([str(value) for value in values]).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+
+def decode_cursor(cursor, model, ordering):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw_values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(raw_values, list) or len(raw_values) != len(ordering):
+            raise ValueError
+        return [model._meta.get_field(name).to_python(value) for name, value in zip(ordering, raw_values)]
+    except (ValueError, TypeError, ValidationError):
+        raise InvalidCursor('Invalid cursor')
+
+
+def parse_limit(request, default=DEFAULT_LIMIT, maximum=MAX_LIMIT):
+    try:
+        limit = int(request.query_params.get('limit', default))
+    except ValueError:
+        raise InvalidCursor('Invalid limit')
+    if limit < 1:
+        raise InvalidCursor('Invalid limit')
+    return min(limit, maximum)
+
+
+def after(values, ordering):
+    """Filter for rows that sort strictly after `values` in ascending `ordering`"""
+    condition = Q()
+    for i in reversed(range(len(ordering))):
+        equal_prefix = {name: value for name, value in zip(ordering[:i], values[:i])}
+        condition |= Q(**equal_prefix, **{f'{ordering[i]}__gt': values[i]})
+    return condition
+
+
+def paginate(request, queryset, ordering, default_limit=DEFAULT_LIMIT, max_limit=MAX_LIMIT):
+    """Return (rows, next cursor or None) for the page selected by the request's cursor and limit"""
+    limit = parse_limit(request, default_limit, max_limit)
+    queryset = queryset.order_by(*ordering)
+    cursor = request.query_params.get('cursor')
+    if cursor:
+        queryset = queryset.filter(after(decode_cursor(cursor, queryset.model, ordering), ordering))
+
+    # Fetch one extra row to learn whether there is a next page
+    rows = list(queryset[:limit + 1])
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor([getattr(last, name) for name in ordering])
+
+
+def next_page_headers(request, next_cursor):
+    """Link / X-Next-Cursor headers pointing at the next page"""
+    if not next_cursor:
+        return {}
+    params = request.query_params.copy()
+    params['cursor'] = next_cursor
+    url = request.build_absolute_uri(f'{request.path}?{params.urlencode()}')
+    return {'Link': f'<{url}>; rel="next"', 'X-Next-Cursor': next_cursor}
+
@@ -0,0 +1,111 @@
+import random
+from contextvars import ContextVar
+from functools import wraps
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+
+# Read-replica routing.
+#
+# Only views decorated with @replica_reads read from a replica, and only for
+# safe methods: everything else, including authentication and every write,
+# stays on the primary. A user who has just written something is pinned to
+# the primary for REPLICA_PIN_SECONDS so they always read their own writes,
+# however far the replicas lag behind. The pin is a signed cookie rather than
+# a cache entry, so it holds whichever worker serves the next read.
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+DEFAULT_PIN_SECONDS = 10
+PIN_COOKIE = 'replica_pin'
+
+_read_database = ContextVar('read_database', default=None)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _read_database.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+
+def _pin_seconds():
+    return getattr(settings, 'REPLICA_PIN_SECONDS', DEFAULT_PIN_SECONDS)
+
+
+def pin_to_primary(request, response, user_id):
+    """Pin the client to the primary with a signed cookie naming the user, valid for REPLICA_PIN_SECONDS"""
+    response.set_signed_cookie(
+        PIN_COOKIE, str(user_id), salt=PIN_COOKIE, max_age=_pin_seconds(),
+        secure=request.is_secure(), httponly=True, samesite='Lax',
+    )
+
+
+def _pinned(request):
+    # The signature's timestamp expires the pin even if the client keeps the cookie longer
+    user_id = request.get_signed_cookie(PIN_COOKIE, default=None, salt=PIN_COOKIE, max_age=_pin_seconds())
+    return user_id is not None and user_id == str(request.user.id)
+
+
+def _replica_for(request):
+    replicas = getattr(settings, 'REPLICA_DATABASES', [])
+    if not replicas or request.method not in SAFE_METHODS or _pinned(request):
+        return None
+    return random.choice(replicas)
+
+
+def replica_reads(view):
+    """Send the view's queries to a replica for safe requests from users not pinned to the primary"""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            token = _read_database.set(_replica_for(request))
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _read_database.reset(token)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        token = _read_database.set(_replica_for(request))
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _read_database.reset(token)
+    return wrapper
+
+
+class ReplicaPinningMiddleware:
+    """Pin users to the primary after any unsafe request so their next reads see what they wrote"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        self.pin(request, response)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        # request.user may still be the lazy session user, which needs the database
+        await sync_to_async(self.pin)(request, response)
+        return response
+
+    def pin(self, request, response):
+        if request.method in SAFE_METHODS or not getattr(settings, 'REPLICA_DATABASES', []):
+            return
+        # DRF copies the authenticated user onto the underlying HttpRequest
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            pin_to_primary(request, response, user.id)
@@ -1,6 +1,6 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import ExpenseGroup, Expense, Contribution
+from .models import ExpenseGroup, Expense, Contribution, Share
 
 # Serializes the User model for registration and authentication
 class UserSerializer(serializers.ModelSerializer):
@@ -23,13 +23,30 @@ class ContributionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Contribution
         fields = ['id', 'expense', 'user', 'amount']
-        
+
+# Serializes the Share model: what a participant owes towards an expense
+class ShareSerializer(serializers.ModelSerializer):
+    user = serializers.SlugRelatedField(queryset=User.objects.all(), slug_field='username')
+
+    class Meta:
+        model = Share
+        fields = ['id', 'expense', 'user', 'amount']
+
 # Serializes the Expense model to include the group, description, amount, and split type
 class ExpenseSerializer(serializers.ModelSerializer):
     group = ExpenseGroupSerializer()  # Include the group details
     contributions = ContributionSerializer(many=True,read_only=True)
+    shares = ShareSerializer(many=True, read_only=True)
 
     class Meta:
         model = Expense
-        fields = ['id', 'group', 'description', 'amount', 'split_type', 'contributions', 'created_at']
+        fields = ['id', 'group', 'description', 'amount', 'split_type', 'contributions', 'shares', 'created_at']
+
+# Lighter Expense representation for listings: references the group by id instead of embedding it
+class ExpenseListSerializer(serializers.ModelSerializer):
+    contributions = ContributionSerializer(many=True, read_only=True)
+    shares = ShareSerializer(many=True, read_only=True)
 
+    class Meta:
+        model = Expense
+        fields = ['id', 'group', 'description', 'amount', 'split_type', 'contributions', 'shares', 'created_at']
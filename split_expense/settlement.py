@@ -0,0 +1,92 @@
+import heapq
+from .money import to_cents, to_decimal
+
+# Settlement planning: turn net balances ({name: amount}, positive when the member
+# is owed money) into a short list of (payer, payee, amount) transfers.
+# Amounts are handled as integer cents internally so the plan nets to exactly zero.
+
+# The exact planner enumerates every subset of the non-zero balances
+EXACT_MAX_MEMBERS = 12
+
+
+def settle_up(balances, exact=False):
+    """Return a list of (payer, payee, amount) transfers that settles every balance"""
+    transfers = settle_up_cents({name: to_cents(amount) for name, amount in balances.items()}, exact)
+    return [(payer, payee, to_decimal(amount)) for payer, payee, amount in transfers]
+
+
+def settle_up_cents(balances, exact=False):
+    """settle_up() for balances and transfers in integer cents"""
+    cents = _nonzero(balances)
+    if exact and len(cents) <= EXACT_MAX_MEMBERS:
+        transfers = []
+        for subset in _zero_sum_groups(cents):
+            transfers.extend(_greedy({name: cents[name] for name in subset}))
+    else:
+        transfers = _greedy(cents)
+    return transfers
+
+
+def _nonzero(balances):
+    """Drop settled members and fold any rounding residue into the largest balance"""
+    cents = {name: value for name, value in balances.items() if value}
+
+    residue = sum(cents.values())
+    if residue and cents:
+        largest = max(cents, key=lambda name: (abs(cents[name]), name))
+        cents[largest] -= residue
+        if not cents[largest]:
+            del cents[largest]
+    return cents
+
+
+def _greedy(cents):
+    """Repeatedly match the largest debtor with the largest creditor; at most n - 1 transfers"""
+    creditors = [(-amount, name) for name, amount in cents.items() if amount > 0]
+    debtors = [(amount, name) for name, amount in cents.items() if amount < 0]
+    heapq.heapify(creditors)
+    heapq.heapify(debtors)
+
+    transfers = []
+    while creditors and debtors:
+        credit, payee = heapq.heappop(creditors)
+        debt, payer = heapq.heappop(debtors)
+        amount = min(-credit, -debt)
+        transfers.append((payer, payee, amount))
+        if -credit > amount:
+            heapq.heappush(creditors, (credit + amount, payee))
+        if -debt > amount:
+            heapq.heappush(debtors, (debt + amount, payer))
+    return transfers
+
+
+def _zero_sum_groups(cents):
+    """Split the members into the largest number of disjoint groups that each net to zero.
+
+    Every zero-sum group of k members settles in k - 1 transfers, so maximising the
+    number of groups minimises the total number of transfers.
+    """
+    names = sorted(cents)
+    n = len(names)
+    full = (1 << n) - 1
+
+    sums = [0] * (full + 1)
+    best = [0] * (full + 1)
+    for mask in range(1, full + 1):
+        low = mask & -mask
+        sums[mask] = sums[mask ^ low] + cents[names[low.bit_length() - 1]]
+        best[mask] = max(best[mask ^ (1 << i)] for i in range(n) if mask >> i & 1) + (sums[mask] == 0)
+
+    # Walk back from the full set, cutting a group at every zero-sum mask on the way
+    groups = []
+    mask, boundary = full, full
+    while mask:
+        for i in range(n):
+            bit = 1 << i
+            if mask & bit and best[mask ^ bit] + (sums[mask] == 0) == best[mask]:
+                mask ^= bit
+                break
+        if sums[mask] == 0:
+            groups.append([names[i] for i in range(n) if (boundary ^ mask) >> i & 1])
+            boundary = mask
+    return groups
@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .caching import bump_user
+from .directory import hot_prefixes
+from .models import UserDirectoryEntry
+
+
+#Cached authentication data (see authentication.py) must not outlive a password change or deactivation
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    bump_user(instance.pk)
+
+
+#Keep the user directory's search columns in step with the user
+@receiver(post_save, sender=User)
+def update_directory_entry(sender, instance, update_fields=None, raw=False, **kwargs):
+    if raw or (update_fields is not None and not {'username', 'email'} & set(update_fields)):
+        return
+    UserDirectoryEntry.objects.update_or_create(user=instance, defaults=UserDirectoryEntry.values_for(instance))
+    hot_prefixes.clear()
+
+
+@receiver(post_delete, sender=User)
+def forget_directory_entry(sender, instance, **kwargs):
+    # The entry itself cascades with the user
+    hot_prefixes.clear()
+
+
+#Tuning pragmas from the production settings profile; SQLite resets most of them per connection
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', None)
+    if connection.vendor != 'sqlite' or not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
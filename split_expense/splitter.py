@@ -0,0 +1,59 @@
+from decimal import Decimal, InvalidOperation
+from .money import allocate, split_evenly
+
+# Splitting an expense into what each participant owes.
+#
+# split() takes the expense total in cents and one value per participant, turns
+# the values into integer weights in a single pass and hands them to
+# money.allocate(), so every split type comes out in whole cents that add up to
+# exactly the total. The results are stored as Share rows and summed by the
+# balance ledger, so summaries never divide group totals themselves.
+#
+#   equal       values are ignored; the total is split evenly
+#   exact       values are the amounts each participant owes
+#   percentage  values are percentages with up to two decimals, adding up to 100
+#   shares      values are non-negative numbers of shares, e.g. 2 for a couple
+
+SPLIT_FIELDS = {'equal': None, 'exact': 'amount', 'percentage': 'percent', 'shares': 'shares'}  # Split type -> value key in a request's splits
+HUNDRED_PERCENT = 100 * 100  # Percentages are weighted in hundredths
+
+
+class SplitError(ValueError):
+    pass
+
+
+def _weights(values):
+    """Integer weights in hundredths for non-negative decimal values with at most two places"""
+    weights = []
+    for value in values:
+        try:
+            number = Decimal(str(value).strip())
+        except (InvalidOperation, ValueError):
+            raise SplitError(f'Invalid split value {value!r}')
+        if not number.is_finite() or number < 0 or number.as_tuple().exponent < -2:
+            raise SplitError(f'Invalid split value {value!r}')
+        weights.append(int(number.scaleb(2)))
+    return weights
+
+
+def split(split_type, total, values):
+    """Split total cents between participants, one value per participant, returning what each owes in cents"""
+    if split_type not in SPLIT_FIELDS:
+        raise SplitError(f'Cannot split a {split_type!r} expense into shares')
+    if not values:
+        raise SplitError('At least one participant is required')
+
+    if split_type == 'equal':
+        return split_evenly(total, len(values))
+
+    weights = _weights(values)
+    if split_type == 'exact':
+        if sum(weights) != total:
+            raise SplitError('Split amounts do not match the total amount')
+        return weights
+    if split_type == 'percentage' and sum(weights) != HUNDRED_PERCENT:
+        raise SplitError('Percentages must add up to 100')
+    if not any(weights):
+        raise SplitError('At least one participant must have a share')
+    return allocate(total, weights)
+
@@ -3,8 +3,31 @@ from django.urls import reverse
 from django.contrib.auth.models import User
 from rest_framework import status
 from rest_framework_simplejwt.tokens import RefreshToken
-from .models import ExpenseGroup, Expense, Contribution
+from .models import ExpenseGroup, Expense, Contribution, Share, MemberBalance, DailySpend, IdempotencyKey, BalanceCheckpoint, Change
+from django.core.management import call_command, CommandError
 from decimal import Decimal
+from django.core.files.uploadedfile import SimpleUploadedFile
+import json
+import sqlite3
+import sys
+import types
+from datetime import datetime, timedelta, timezone as tz
+from django.utils import timezone
+import tracemalloc
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.core.cache import cache
+from django.db import connection, connections
+from django.http import HttpResponse
+from django.test import AsyncClient, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from rest_framework_simplejwt.tokens import AccessToken
+from .authentication import CachedJWTAuthentication
+from .balances import member_balances
+from .checks import shared_cache_check
+from .exporter import iter_expenses
+from .metrics import QueryMetricsMiddleware, render_prometheus
+from .routers import ReplicaRouter
 
 @pytest.mark.django_db
 def test_register_user(client):
@@ -282,6 +305,1201 @@ def test_overall_balance_summary(client, authenticated_user):
     assert response_data['owed_by'][0]['owed_by'] == 'user2'
     assert response_data['owed_by'][0]['amount'] == 50.00
 
+@pytest.mark.django_db
+def test_balance_ledger_follows_expense_writes(client, authenticated_user):
+    other_user = User.objects.create_user(username='testuser2', password='testpassword2')
+    group = ExpenseGroup.objects.create(name='Test Group')
+    group.members.add(authenticated_user, other_user)
+    token = get_jwt_token(authenticated_user)
+
+    url = reverse('manage_expenses', kwargs={'group_id': group.id})
+    data = {
+        'description': 'Dinner',
+        'amount': '90.00',
+        'split_type': 'custom',
+        'contributions': [
+            {'username': 'testuser', 'amount': '60.00'},
+            {'username': 'testuser2', 'amount': '30.00'}
+        ]
+    }
+    response = client.post(url, data, content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_201_CREATED
+    assert MemberBalance.objects.get(group=group, user=authenticated_user).paid == Decimal('60.00')
+    assert MemberBalance.objects.get(group=group, user=other_user).paid == Decimal('30.00')
+
+    # Editing replaces the old contributions in the ledger
+    expense_url = reverse('edit_or_delete_expense', kwargs={'group_id': group.id, 'expense_id': response.data['id']})
+    data = {'amount': '50.00', 'split_type': 'equal'}
+    response = client.patch(expense_url, data, content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_200_OK
+    assert MemberBalance.objects.get(group=group, user=authenticated_user).paid == Decimal('50.00')
+    assert MemberBalance.objects.get(group=group, user=other_user).paid == Decimal('0.00')
+
+    response = client.delete(expense_url, HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_200_OK
+    assert MemberBalance.objects.get(group=group, user=authenticated_user).paid == Decimal('0.00')
+    assert MemberBalance.objects.find_drift() == []
+
+@pytest.mark.django_db
+def test_rebuild_balances_command(authenticated_user):
+    group = ExpenseGroup.objects.create(name='Test Group')
+    group.members.add(authenticated_user)
+    expense = Expense.objects.create(group=group, description='Dinner', amount=100.00, split_type='equal')
+    Contribution.objects.create(expense=expense, user=authenticated_user, amount=Decimal('100.00'))
+
+    # Simulate drift and make sure the check catches it
+    MemberBalance.objects.filter(group=group).update(paid=Decimal('1.00'))
+    with pytest.raises(CommandError):
+        call_command('rebuild_balances', '--check')
+
+    call_command('rebuild_balances')
+    assert MemberBalance.objects.get(group=group, user=authenticated_user).paid == Decimal('100.00')
+    call_command('rebuild_balances', '--check')
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('member_count', [2, 50])
+def test_group_summary_query_count(client, authenticated_user, django_assert_num_queries, member_count):
+    group = ExpenseGroup.objects.create(name='Test Group')
+    group.members.add(authenticated_user)
+    others = [User.objects.create(username=f'member{i}') for i in range(member_count - 1)]
+    group.members.add(*others)
+    expense = Expense.objects.create(group=group, description='Dinner', amount=Decimal('100.00'), split_type='equal')
+    Contribution.objects.create(expense=expense, user=authenticated_user, amount=Decimal('100.00'))
+
+    url = reverse('group_summary', kwargs={'group_id': group.id})
+    token = get_jwt_token(authenticated_user)
+    # Authentication, group lookup, member totals and group total
+    with django_assert_num_queries(4):
+        response = client.get(url, HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.data['balances']) == member_count
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('group_count', [1, 20])
+def test_overall_balance_summary_query_count(client, authenticated_user, django_assert_num_queries, group_count):
+    other_user = User.objects.create_user(username='user2', password='password')
+    for i in range(group_count):
+        group = ExpenseGroup.objects.create(name=f'Group {i}')
+        group.members.add(authenticated_user, other_user)
+        expense = Expense.objects.create(group=group, description='Dinner', amount=Decimal('10.00'), split_type='equal')
+        Contribution.objects.create(expense=expense, user=authenticated_user, amount=Decimal('10.00'))
+
+    url = reverse('overall_balance_summary')
+    token = get_jwt_token(authenticated_user)
+    # Authentication, the user's group ids for the cache key, memberships and the (group, user) paid totals
+    with django_assert_num_queries(4):
+        response = client.get(url, HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    response_data = response.json()
+    assert response.status_code == status.HTTP_200_OK
+    assert response_data['total_owed_to_user'] == 5.00 * group_count
+    assert response_data['owed_by'] == [{'owed_by': 'user2', 'amount': 5.00 * group_count}]
+
+@pytest.mark.django_db
+def test_settle_plan(client, authenticated_user):
+    user2 = User.objects.create_user(username='user2', password='password')
+    user3 = User.objects.create_user(username='user3', password='password')
+    group = ExpenseGroup.objects.create(name='Test Group')
+    group.members.add(authenticated_user, user2, user3)
+    expense = Expense.objects.create(group=group, description='Dinner', amount=Decimal('90.00'), split_type='equal')
+    Contribution.objects.create(expense=expense, user=authenticated_user, amount=Decimal('90.00'))
+
+    url = reverse('settle_plan', kwargs={'group_id': group.id})
+    token = get_jwt_token(authenticated_user)
+    response = client.get(url, {'mode': 'exact'}, HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data['mode'] == 'exact'
+    assert sorted((t['from'], t['to'], t['amount']) for t in response.data['transfers']) == [
+        ('user2', 'testuser', Decimal('30.00')),
+        ('user3', 'testuser', Decimal('30.00')),
+    ]
+
+    response = client.get(url, {'mode': 'fastest'}, HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+@pytest.mark.django_db
+def test_bulk_import_expenses_csv(client, authenticated_user):
+    user2 = User.objects.create_user(username='user2', password='password')
+    group = ExpenseGroup.objects.create(name='Test Group')
+    group.members.add(authenticated_user, user2)
+
+    rows = [
+        'description,amount,split_type,paid_by,contributions',
+        'Dinner,100.00,equal,,',
+        'Taxi,30.00,custom,,testuser:10.00;user2:20.00',
+        'Hotel,50.00,custom,,testuser:10.00',
+        'Museum,-5,equal,,',
+        'Lunch,20.00,equal,stranger,',
+    ]
+    upload = SimpleUploadedFile('expenses.csv', '\n'.join(rows).encode(), content_type='text/csv')
+    url = reverse('bulk_import_expenses', kwargs={'group_id': group.id})
+    token = get_jwt_token(authenticated_user)
+    response = client.post(url, {'file': upload}, HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.data['created'] == 2
+    assert [error['row'] for error in response.data['errors']] == [3, 4, 5]
+    assert Expense.objects.filter(group=group).count() == 2
+    assert MemberBalance.objects.get(group=group, user=authenticated_user).paid == Decimal('110.00')
+    assert MemberBalance.objects.get(group=group, user=user2).paid == Decimal('20.00')
+    assert MemberBalance.objects.find_drift() == []
+
+@pytest.mark.django_db
+def test_bulk_import_expenses_ndjson(client, authenticated_user):
+    group = ExpenseGroup.objects.create(name='Test Group')
+    group.members.add(authenticated_user)
+
+    lines = [
+        json.dumps({'description': 'Dinner', 'amount': '10.00', 'split_type': 'equal'}),
+        'not json',
+        json.dumps({'description': 'Taxi', 'amount': '5.00', 'split_type': 'custom', 'contributions': [{'username': 'testuser', 'amount': '5.00'}]}),
+    ]
+    upload = SimpleUploadedFile('expenses.ndjson', '\n'.join(lines).encode(), content_type='application/x-ndjson')
+    url = reverse('bulk_import_expenses', kwargs={'group_id': group.id})
+    token = get_jwt_token(authenticated_user)
+    response = client.post(url, {'file': upload}, HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.data['created'] == 2
+    assert response.data['errors'] == [{'row': 2, 'error': 'Row is not a JSON object'}]
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('returns_ids', [True, False])
+def test_bulk_import_keeps_the_dates_of_imported_rows(client, authenticated_user, monkeypatch, returns_ids):
+    # Without returned ids (as on MySQL) the imported rows are read back to find theirs
+    monkeypatch.setattr(connection.features, 'can_return_columns_from_insert', returns_ids)
+    group = ExpenseGroup.objects.create(name='Test Group')
+    group.members.add(authenticated_user)
+
+    rows = [
+        'description,amount,split_type,created_at',
+        'Dinner,10.00,equal,2024-03-01T19:30:00+00:00',
+        'Dinner,10.00,equal,2024-03-01T19:30:00+00:00',
+        'Taxi,5.00,equal,2024-03-02',
+        'Lunch,7.00,equal,',
+        'Museum,3.00,equal,yesterday',
+    ]
+    upload = SimpleUploadedFile('expenses.csv', '\n'.join(rows).encode(), content_type='text/csv')
+    url = reverse('bulk_import_expenses', kwargs={'group_id': group.id})
+    response = client.post(url, {'file': upload}, HTTP_AUTHORIZATION=f'Bearer {get_jwt_token(authenticated_user)}')
+
+    assert response.data['created'] == 4
+    assert response.data['errors'] == [{'row': 5, 'error': "Invalid date 'yesterday'"}]
+    expenses = Expense.objects.filter(group=group).order_by('id')
+    assert [e.created_at.date() for e in expenses] == [datetime(2024, 3, 1).date()] * 2 + [datetime(2024, 3, 2).date(), timezone.localdate()]
+    assert Contribution.objects.filter(expense__in=expenses).count() == Share.objects.filter(expense__in=expenses).count() == 4
+    assert dict(DailySpend.objects.filter(group=group).values_list('day', 'paid')) == {
+        datetime(2024, 3, 1).date(): Decimal('20.00'), datetime(2024, 3, 2).date(): Decimal('5.00'), timezone.localdate(): Decimal('7.00'),
+    }
+    assert DailySpend.objects.find_drift() == [] and MemberBalance.objects.find_drift() == []
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('split_type', ['equal', 'custom'])
+def test_add_expense_query_count_is_independent_of_group_size(client, authenticated_user, django_assert_max_num_queries, split_type):
+    group = ExpenseGroup.objects.create(name='Test Group')
+    others = [User.objects.create(username=f'member{i}') for i in range(49)]
+    group.members.add(authenticated_user, *others)
+
+    data = {'description': 'Party', 'amount': '490.00', 'split_type': split_type}
+    if split_type == 'custom':
+        data['contributions'] = [{'username': user.username, 'amount': '10.00'} for user in others]
+    url = reverse('manage_expenses', kwargs={'group_id': group.id})
+    token = get_jwt_token(authenticated_user)
+    # Includes up to three each for the balance ledger, the daily spend rollup and the change log, the shares insert and reload,
+    # and the group version update
+    with django_assert_max_num_queries(24):
+        response = client.post(url, data, content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    assert response.status_code == status.HTTP_201_CREATED
+    # An equal split is paid by the poster and owed in equal shares by every member
+    assert len(response.data['contributions']) == (49 if split_type == 'custom' else 1)
+    assert len(response.data['shares']) == (0 if split_type == 'custom' else 50)
+    assert MemberBalance.objects.find_drift() == []
+    assert DailySpend.objects.find_drift() == []
+
+@pytest.mark.django_db
+def test_add_expense_rejects_unknown_contributors(client, authenticated_user):
+    group = ExpenseGroup.objects.create(name='Test Group')
+    group.members.add(authenticated_user)
+    User.objects.create_user(username='outsider', password='password')
+
+    data = {
+        'description': 'Taxi',
+        'amount': '30.00',
+        'split_type': 'custom',
+        'contributions': [
+            {'username': 'testuser', 'amount': '10.00'},
+            {'username': 'outsider', 'amount': '10.00'},
+            {'username': 'ghost', 'amount': '10.00'}
+        ]
+    }
+    url = reverse('manage_expenses', kwargs={'group_id': group.id})
+    token = get_jwt_token(authenticated_user)
+    response = client.post(url, data, content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.data['errors'] == ['User outsider is not a member of the group', 'User ghost not found']
+    assert Expense.objects.count() == 0
+    assert MemberBalance.objects.filter(group=group).count() == 0
+
+@pytest.mark.django_db
+def test_get_expenses_is_cursor_paginated(client, authenticated_user, django_assert_num_queries):
+    user2 = User.objects.create_user(username='user2', password='password')
+    group = ExpenseGroup.objects.create(name='Test Group')
+    group.members.add(authenticated_user, user2)
+    for i in range(5):
+        expense = Expense.objects.create(group=group, description=f'Expense {i}', amount=Decimal('10.00'), split_type='custom')
+        Contribution.objects.create(expense=expense, user=authenticated_user, amount=Decimal('4.00'))
+        Contribution.objects.create(expense=expense, user=user2, amount=Decimal('6.00'))
+
+    url = reverse('manage_expenses', kwargs={'group_id': group.id})
+    token = get_jwt_token(authenticated_user)
+    descriptions = []
+    params = {'limit': 2}
+    while True:
+        # Group lookup, the page, its contributions and its shares with their users, plus the user on the first request
+        with django_assert_num_queries(4 if 'cursor' in params else 5):
+            response = client.get(url, params, HTTP_AUTHORIZATION=f'Bearer {token}')
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data[0]['group'] == group.id
+        assert len(response.data[0]['contributions']) == 2
+        assert response.data[0]['shares'] == []
+        descriptions += [expense['description'] for expense in response.data]
+        if 'X-Next-Cursor' not in response:
+            break
+        assert 'rel="next"' in response['Link']
+        params['cursor'] = response['X-Next-Cursor']
+
+    assert descriptions == [f'Expense {i}' for i in range(5)]
+
+    response = client.get(url, {'cursor': 'garbage'}, HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+@pytest.mark.django_db
+def test_group_summary_is_cached_until_the_group_changes(client, authenticated_user, django_assert_num_queries):
+    user2 = User.objects.create_user(username='user2', password='password')
+    group = ExpenseGroup.objects.create(name='Test Group')
+    group.members.add(authenticated_user, user2)
+    token = get_jwt_token(authenticated_user)
+    summary_url = reverse('group_summary', kwargs={'group_id': group.id})
+
+    response = client.get(summary_url, HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.data['balances'] == []
+
+    # Served from the cache, as is the authenticated user: only the access check hits the database
+    with django_assert_num_queries(1):
+        response = client.get(summary_url, HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.data['balances'] == []
+
+    data = {'description': 'Dinner', 'amount': '100.00', 'split_type': 'equal'}
+    client.post(reverse('manage_expenses', kwargs={'group_id': group.id}), data, content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {token}')
+    response = client.get(summary_url, HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.data['balances'] == [
+        {'owed_to': 'testuser', 'amount': Decimal('50.00')},
+        {'owed_by': 'user2', 'amount': Decimal('50.00')},
+    ]
+
+    # Membership changes invalidate the cached member list too
+    members_url = reverse('group_members', kwargs={'group_id': group.id})
+    assert len(client.get(members_url, HTTP_AUTHORIZATION=f'Bearer {token}').data['members']) == 2
+    data = {'action': 'remove', 'usernames': ['user2']}
+    client.patch(reverse('edit_group_members', kwargs={'group_id': group.id}), data, content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert len(client.get(members_url, HTTP_AUTHORIZATION=f'Bearer {token}').data['members']) == 1
+
+@pytest.mark.django_db
+def test_cached_responses_are_invalidated_by_writes_in_another_worker(client, authenticated_user):
+    user2 = User.objects.create_user(username='user2', password='password')
+    group = ExpenseGroup.objects.create(name='Test Group')
+    group.members.add(authenticated_user)
+    token = get_jwt_token(authenticated_user)
+    urls = [reverse(name, kwargs={'group_id': group.id}) for name in ['group_summary', 'group_members']] + [reverse('overall_balance_summary')]
+    before = [client.get(url, HTTP_AUTHORIZATION=f'Bearer {token}').data for url in urls]
+
+    # Another worker has its own local memory cache, so nothing it does reaches ours
+    with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'another-worker'}}):
+        data = {'action': 'add', 'usernames': ['user2']}
+        client.patch(reverse('edit_group_members', kwargs={'group_id': group.id}), data, content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {token}')
+        data = {'description': 'Dinner', 'amount': '100.00', 'split_type': 'equal'}
+        client.post(reverse('manage_expenses', kwargs={'group_id': group.id}), data, content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    summary, members, overall = [client.get(url, HTTP_AUTHORIZATION=f'Bearer {token}').data for url in urls]
+    assert summary != before[0]
+    assert summary['balances'] == [
+        {'owed_to': 'testuser', 'amount': Decimal('50.00')},
+        {'owed_by': 'user2', 'amount': Decimal('50.00')},
+    ]
+    assert len(members['members']) == 2
+    assert overall != before[2]
+
+@pytest.mark.django_db
+def test_cache_statistics(client, authenticated_user):
+    group = ExpenseGroup.objects.create(name='Test Group')
+    group.members.add(authenticated_user)
+    token = get_jwt_token(authenticated_user)
+    for _ in range(3):
+        client.get(reverse('group_summary', kwargs={'group_id': group.id}), HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    url = reverse('cache_statistics')
+    assert client.get(url, HTTP_AUTHORIZATION=f'Bearer {token}').status_code == status.HTTP_403_FORBIDDEN
+
+    admin = User.objects.create_user(username='admin', password='password', is_staff=True)
+    response = client.get(url, HTTP_AUTHORIZATION=f'Bearer {get_jwt_token(admin)}')
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data['group_summary'] == {'hits': 2, 'misses': 1}
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('url_name', ['manage_expenses', 'group_summary', 'group_members', 'groups'])
+def test_conditional_get_returns_not_modified(client, authenticated_user, django_assert_max_num_queries, url_name):
+    group = ExpenseGroup.objects.create(name='Test Group')
+    group.members.add(authenticated_user)
+    url = reverse(url_name) if url_name == 'groups' else reverse(url_name, kwargs={'group_id': group.id})
+    token = get_jwt_token(authenticated_user)
+
+    response = client.get(url, HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_200_OK
+    etag = response['ETag']
+
+    # Revalidation needs only authentication and the access check
+    with django_assert_max_num_queries(2):
+        response = client.get(url, HTTP_AUTHORIZATION=f'Bearer {token}', HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response['ETag'] == etag
+
+    # Any write to the group changes the ETag
+    client.patch(reverse('edit_or_delete_group', kwargs={'group_id': group.id}), {'name': 'Renamed'}, content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {token}')
+    response = client.get(url, HTTP_AUTHORIZATION=f'Bearer {token}', HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_200_OK
+    assert response['ETag'] != etag
+
+    # So does a write handled by another worker, which has its own local memory cache
+    etag = response['ETag']
+    with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'another-worker'}}):
+        data = {'description': 'Dinner', 'amount': '10.00', 'split_type': 'equal'}
+        client.post(reverse('manage_expenses', kwargs={'group_id': group.id}), data, content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {token}')
+    response = client.get(url, HTTP_AUTHORIZATION=f'Bearer {token}', HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_200_OK
+    assert response['ETag'] != etag
+
+@pytest.mark.django_db
+def test_metrics_endpoint(client, authenticated_user):
+    group = ExpenseGroup.objects.create(name='Test Group')
+    group.members.add(authenticated_user)
+    token = get_jwt_token(authenticated_user)
+    client.get(reverse('group_summary', kwargs={'group_id': group.id}), HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    url = reverse('metrics')
+    assert client.get(url, HTTP_AUTHORIZATION=f'Bearer {token}').status_code == status.HTTP_403_FORBIDDEN
+
+    admin = User.objects.create_user(username='admin', password='password', is_staff=True)
+    response = client.get(url, HTTP_AUTHORIZATION=f'Bearer {get_jwt_token(admin)}')
+    assert response.status_code == status.HTTP_200_OK
+    assert response['Content-Type'].startswith('text/plain; version=0.0.4')
+    body = response.content.decode()
+    assert 'http_request_duration_seconds_count{endpoint="group_summary"} 1' in body
+    assert 'http_request_db_queries_bucket{endpoint="group_summary",le="+Inf"} 1' in body
+    assert 'http_responses_total{endpoint="metrics",status="403"} 1' in body
+
+@pytest.mark.django_db
+def test_metrics_middleware_flags_repeated_queries(rf, settings, caplog):
+    settings.METRICS_REPEATED_QUERY_THRESHOLD = 3
+    users = [User.objects.create_user(username=f'user{i}', password='password') for i in range(5)]
+
+    def n_plus_one_view(request):
+        for user in users:
+            User.objects.get(id=user.id)
+        return HttpResponse()
+
+    QueryMetricsMiddleware(n_plus_one_view)(rf.get('/'))
+    assert 'Possible N+1 in unmatched: query ran 5 times' in caplog.text
+    body = render_prometheus()
+    assert 'http_request_db_queries_sum{endpoint="unmatched"} 5' in body
+    assert 'http_repeated_queries_total{endpoint="unmatched"} 1' in body
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('url_name', ['groups', 'group_summary', 'group_members', 'overall_balance_summary'])
+def test_async_read_views_match_sync(client, authenticated_user, settings, url_name):
+    user2 = User.objects.create_user(username='user2', password='password')
+    group = ExpenseGroup.objects.create(name='Test Group')
+    group.members.add(authenticated_user, user2)
+    expense = Expense.objects.create(group=group, description='Dinner', amount=Decimal('30.00'), split_type='equal')
+    Contribution.objects.create(expense=expense, user=authenticated_user, amount=Decimal('30.00'))
+    kwargs = {} if url_name in ['groups', 'overall_balance_summary'] else {'group_id': group.id}
+    token = get_jwt_token(authenticated_user)
+
+    responses = []
+    for urlconf in ['expense_splitter.urls', 'expense_splitter.asgi_urls']:
+        settings.ROOT_URLCONF = urlconf
+        cache.clear()
+        url = reverse(url_name, kwargs=kwargs)
+        assert iscoroutinefunction(resolve(url).func) == (urlconf == 'expense_splitter.asgi_urls')
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url, HTTP_AUTHORIZATION=f'Bearer {token}')
+        assert response.status_code == status.HTTP_200_OK
+        responses.append((response.json(), len(queries)))
+    assert responses[0] == responses[1]
+
+@pytest.mark.django_db
+@pytest.mark.urls('expense_splitter.asgi_urls')
+def test_async_views_authentication_and_methods(client, authenticated_user):
+    group = ExpenseGroup.objects.create(name='Test Group')
+    group.members.add(authenticated_user)
+    token = get_jwt_token(authenticated_user)
+    url = reverse('group_summary', kwargs={'group_id': group.id})
+
+    response = client.get(url)
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    assert response['WWW-Authenticate'] == 'Bearer realm="api"'
+    assert client.get(url, HTTP_AUTHORIZATION='Bearer not-a-token').status_code == status.HTTP_401_UNAUTHORIZED
+    assert client.post(url, HTTP_AUTHORIZATION=f'Bearer {token}').status_code == status.HTTP_405_METHOD_NOT_ALLOWED
+
+    # Writes on a shared path still go to the sync view
+    response = client.post(reverse('groups'), {'name': 'Second Group'}, content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_201_CREATED
+    assert ExpenseGroup.objects.filter(name='Second Group', members=authenticated_user).exists()
+
+@pytest.mark.django_db
+@pytest.mark.urls('expense_splitter.asgi_urls')
+def test_async_view_through_async_handler(authenticated_user):
+    group = ExpenseGroup.objects.create(name='Test Group')
+    group.members.add(authenticated_user)
+    url = reverse('group_summary', kwargs={'group_id': group.id})
+
+    response = async_to_sync(AsyncClient().get)(url, headers={'Authorization': f'Bearer {get_jwt_token(authenticated_user)}'})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {'balances': []}
+    # The middleware runs in async mode and still sees the queries made by the async ORM
+    assert 'http_request_db_queries_sum{endpoint="group_summary"} 4' in render_prometheus()
+
+@pytest.mark.django_db
+def test_authenticated_user_is_cached_until_the_user_changes(client, authenticated_user, django_assert_num_queries):
+    group = ExpenseGroup.objects.create(name='Test Group')
+    group.members.add(authenticated_user)
+    token = get_jwt_token(authenticated_user)
+    url = reverse('group_summary', kwargs={'group_id': group.id})
+
+    client.get(url, HTTP_AUTHORIZATION=f'Bearer {token}')
+    # Cached summary and cached user: only the access check remains
+    with django_assert_num_queries(1):
+        assert client.get(url, HTTP_AUTHORIZATION=f'Bearer {token}').status_code == status.HTTP_200_OK
+
+    # The cached user only carries the fields views need; the rest load on access and are never overwritten
+    cached_user = CachedJWTAuthentication().get_user(AccessToken(token))
+    assert (cached_user.id, cached_user.username) == (authenticated_user.id, 'testuser')
+    assert 'password' in cached_user.get_deferred_fields()
+    cached_user.email = 'new@example.com'
+    cached_user.save()
+    assert User.objects.get(id=authenticated_user.id).check_password('testpassword')
+
+    authenticated_user.is_active = False
+    authenticated_user.save()
+    response = client.get(url, HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    assert response.data['detail'] == 'User is inactive'
+
+@pytest.mark.django_db
+def test_deactivation_without_signals_takes_effect_once_the_cached_user_expires(client, authenticated_user):
+    token = get_jwt_token(authenticated_user)
+    url = reverse('groups')
+    assert client.get(url, HTTP_AUTHORIZATION=f'Bearer {token}').status_code == status.HTTP_200_OK
+
+    # QuerySet.update() sends no signal, so the cached user is served until JWT_USER_CACHE_TIMEOUT at worst
+    User.objects.filter(id=authenticated_user.id).update(is_active=False)
+    assert client.get(url, HTTP_AUTHORIZATION=f'Bearer {token}').status_code == status.HTTP_200_OK
+    # As after the timeout, or on a worker that hasn't cached the user
+    cache.clear()
+    response = client.get(url, HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    assert response.data['detail'] == 'User is inactive'
+
+def test_production_profile_requires_a_shared_cache(settings):
+    settings.SETTINGS_PROFILE = 'production'
+    settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    assert [error.id for error in shared_cache_check(None)] == ['split_expense.E001']
+    settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://127.0.0.1:6379/1'}}
+    assert shared_cache_check(None) == []
+    settings.SETTINGS_PROFILE = 'development'
+    settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    assert shared_cache_check(None) == []
+
+@pytest.mark.django_db
+def test_reads_use_a_replica_until_the_user_writes(client, authenticated_user, settings, monkeypatch):
+    settings.REPLICA_DATABASES = ['replica']
+    chosen = []
+    route = ReplicaRouter.db_for_read
+    def spy(self, model, **hints):
+        chosen.append(route(self, model, **hints))
+        # There is no replica alias under test, so the query itself still runs on the primary
+        return None
+    monkeypatch.setattr(ReplicaRouter, 'db_for_read', spy)
+
+    group = ExpenseGroup.objects.create(name='Test Group')
+    group.members.add(authenticated_user)
+    token = get_jwt_token(authenticated_user)
+    summary_url = reverse('group_summary', kwargs={'group_id': group.id})
+
+    client.get(summary_url, HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert 'replica' in chosen
+
+    chosen.clear()
+    data = {'description': 'Dinner', 'amount': '100.00', 'split_type': 'equal'}
+    response = client.post(reverse('manage_expenses', kwargs={'group_id': group.id}), data, content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_201_CREATED
+    assert 'replica' not in chosen
+
+    # Pinned to the primary after the write, even when another worker, with its own cache, serves the read
+    cache.clear()
+    chosen.clear()
+    response = client.get(summary_url, HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.data['balances'] == []
+    assert chosen and 'replica' not in chosen
+
+    # The pin names the user, and expires after REPLICA_PIN_SECONDS
+    chosen.clear()
+    client.get(reverse('groups'), HTTP_AUTHORIZATION=f'Bearer {get_jwt_token(User.objects.create_user(username="other"))}')
+    assert 'replica' in chosen
+    settings.REPLICA_PIN_SECONDS = -1
+    chosen.clear()
+    client.get(reverse('groups'), HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert 'replica' in chosen
+
+
+@pytest.mark.django_db
+def test_sqlite_pragmas_are_applied_to_new_connections(settings):
+    settings.SQLITE_PRAGMAS = {'synchronous': 'NORMAL', 'cache_size': -64000}
+    connection = connections.create_connection('default')
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            assert cursor.fetchone()[0] == 1  # NORMAL
+            cursor.execute('PRAGMA cache_size')
+            assert cursor.fetchone()[0] == -64000
+    finally:
+        connection.close()
+
+
+@pytest.mark.django_db
+def test_fetch_users_searches_by_prefix_a_page_at_a_time(client, authenticated_user, django_assert_num_queries):
+    for i in range(5):
+        User.objects.create_user(username=f'Alice{i}', password='password', email=f'a{i}@example.com')
+    User.objects.create_user(username='bob', password='password', email='ALICE.bob@example.com')
+    token = get_jwt_token(authenticated_user)
+    url = reverse('fetch_users')
+
+    response = client.get(url, {'q': 'alice', 'limit': 4}, HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_200_OK
+    assert [user['username'] for user in response.data] == ['Alice0', 'Alice1', 'Alice2', 'Alice3']
+
+    response = client.get(url, {'q': 'alice', 'limit': 4, 'cursor': response['X-Next-Cursor']}, HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert [user['username'] for user in response.data] == ['Alice4']
+    assert 'X-Next-Cursor' not in response
+
+    # Queries containing an @ match emails
+    response = client.get(url, {'q': 'alice.BOB@'}, HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert [user['username'] for user in response.data] == ['bob']
+
+    # The page size is capped
+    response = client.get(url, {'limit': 1000}, HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert len(response.data) == 7
+
+    # Repeated prefixes are served from the in-process LRU until a user changes
+    with django_assert_num_queries(0):
+        response = client.get(url, {'q': 'ALICE', 'limit': 4}, HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert len(response.data) == 4
+    User.objects.filter(username='Alice0').get().delete()
+    response = client.get(url, {'q': 'alice', 'limit': 4}, HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.data[0]['username'] == 'Alice1'
+
+
+@pytest.mark.django_db
+def test_group_stats_reads_buckets_from_the_rollup(client, authenticated_user):
+    other = User.objects.create_user(username='other', password='password')
+    group = ExpenseGroup.objects.create(name='Test Group')
+    group.members.add(authenticated_user, other)
+    token = get_jwt_token(authenticated_user)
+    url = reverse('manage_expenses', kwargs={'group_id': group.id})
+    for amount in ['30.00', '20.00']:
+        client.post(url, {'description': 'Dinner', 'amount': amount, 'split_type': 'equal'}, content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {token}')
+    data = {'description': 'Taxi', 'amount': '10.00', 'split_type': 'custom', 'contributions': [{'username': 'other', 'amount': '10.00'}]}
+    client.post(url, data, content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    # Move one expense to an earlier month and rebuild the rollup from the history
+    Expense.objects.filter(description='Taxi').update(created_at=datetime(2024, 1, 15, 12, tzinfo=tz.utc))
+    assert DailySpend.objects.find_drift() != []
+    call_command('rebuild_balances')
+    assert DailySpend.objects.find_drift() == []
+
+    stats_url = reverse('group_stats', kwargs={'group_id': group.id})
+    response = client.get(stats_url, {'interval': 'month'}, HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_200_OK
+    this_month = Expense.objects.get(description='Dinner', amount=Decimal('30.00')).created_at.date().replace(day=1)
+    assert response.data['buckets'] == ['2024-01-01', this_month.isoformat()]
+    assert response.data['totals'] == [Decimal('10.00'), Decimal('50.00')]
+    assert response.data['members'] == {
+        'other': [Decimal('10.00'), Decimal('0')],
+        authenticated_user.username: [Decimal('0'), Decimal('50.00')],
+    }
+
+    response = client.get(stats_url, {'interval': 'day', 'start': '2024-01-16'}, HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.data['totals'] == [Decimal('50.00')]
+
+    # Deleting an expense takes it out of the rollup
+    expense = Expense.objects.get(description='Dinner', amount=Decimal('20.00'))
+    client.delete(reverse('edit_or_delete_expense', kwargs={'group_id': group.id, 'expense_id': expense.id}), HTTP_AUTHORIZATION=f'Bearer {token}')
+    response = client.get(stats_url, {'interval': 'week', 'start': '2024-02-01'}, HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.data['totals'] == [Decimal('30.00')]
+
+    assert client.get(stats_url, {'interval': 'year'}, HTTP_AUTHORIZATION=f'Bearer {token}').status_code == status.HTTP_400_BAD_REQUEST
+    assert client.get(stats_url, {'start': 'yesterday'}, HTTP_AUTHORIZATION=f'Bearer {token}').status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_export_expenses_round_trips_through_the_importer(client, authenticated_user):
+    other = User.objects.create_user(username='other', password='password')
+    group = ExpenseGroup.objects.create(name='Test Group')
+    group.members.add(authenticated_user, other)
+    token = get_jwt_token(authenticated_user)
+    url = reverse('manage_expenses', kwargs={'group_id': group.id})
+    client.post(url, {'description': 'Dinner, with "friends"', 'amount': '30.00', 'split_type': 'equal'}, content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {token}')
+    data = {'description': 'Taxi', 'amount': '10.00', 'split_type': 'custom', 'contributions': [
+        {'username': 'other', 'amount': '6.00'}, {'username': authenticated_user.username, 'amount': '4.00'},
+    ]}
+    client.post(url, data, content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    export_url = reverse('export_expenses', kwargs={'group_id': group.id})
+    response = client.get(export_url, {'file_format': 'ndjson'}, HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_200_OK
+    assert response.streaming
+    lines = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+    assert [(line['description'], line['paid_by']) for line in lines] == [('Dinner, with "friends"', authenticated_user.username), ('Taxi', None)]
+    assert lines[1]['contributions'] == [{'username': 'other', 'amount': '6.00'}, {'username': authenticated_user.username, 'amount': '4.00'}]
+
+    response = client.get(export_url, HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response['Content-Type'].startswith('text/csv')
+    exported = b''.join(response.streaming_content)
+
+    copy = ExpenseGroup.objects.create(name='Copy')
+    copy.members.add(authenticated_user, other)
+    upload = SimpleUploadedFile('export.csv', exported, content_type='text/csv')
+    response = client.post(reverse('bulk_import_expenses', kwargs={'group_id': copy.id}), {'file': upload}, HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.data == {'created': 2, 'errors': []}
+    assert client.get(reverse('group_summary', kwargs={'group_id': copy.id}), HTTP_AUTHORIZATION=f'Bearer {token}').data == \
+        client.get(reverse('group_summary', kwargs={'group_id': group.id}), HTTP_AUTHORIZATION=f'Bearer {token}').data
+
+    assert client.get(export_url, {'file_format': 'xlsx'}, HTTP_AUTHORIZATION=f'Bearer {token}').status_code == status.HTTP_400_BAD_REQUEST
+
+
+class FakeSSCursor(sqlite3.Cursor):
+    #Stands in for MySQLdb's server-side cursor on the SQLite test database, which takes ? placeholders
+    def execute(self, sql, params=()):
+        return super().execute(sql.replace('%s', '?'), params)
+
+
+@pytest.mark.django_db
+def test_export_on_mysql_streams_through_a_wrapped_server_side_cursor(client, authenticated_user, monkeypatch):
+    group = ExpenseGroup.objects.create(name='Test Group')
+    group.members.add(authenticated_user)
+    token = get_jwt_token(authenticated_user)
+    url = reverse('manage_expenses', kwargs={'group_id': group.id})
+    for description in ['Dinner', 'Taxi', 'Hotel']:
+        client.post(url, {'description': description, 'amount': '30.00', 'split_type': 'equal'}, content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {token}')
+    expected = list(iter_expenses(group))
+
+    cursors = types.ModuleType('MySQLdb.cursors')
+    cursors.SSCursor = FakeSSCursor
+    monkeypatch.setitem(sys.modules, 'MySQLdb', types.ModuleType('MySQLdb'))
+    monkeypatch.setitem(sys.modules, 'MySQLdb.cursors', cursors)
+    monkeypatch.setattr(connections['default'], 'vendor', 'mysql')
+    executed = []
+
+    def wrapper(execute, sql, params, many, context):
+        executed.append(type(context['cursor'].cursor))
+        return execute(sql, params, many, context)
+
+    # Execute wrappers, which the query metrics rely on, and query logging both see the export
+    with connection.execute_wrapper(wrapper), CaptureQueriesContext(connection) as queries:
+        assert list(iter_expenses(group, chunk_size=2)) == expected
+    assert executed == [FakeSSCursor]
+    assert len(queries) == 1 and 'UNION ALL' in queries[0]['sql']
+
+
+@pytest.mark.django_db
+def test_export_expenses_memory_does_not_grow_with_the_group(client, authenticated_user):
+    others = [User.objects.create(username=f'member{i}') for i in range(2)]
+    group = ExpenseGroup.objects.create(name='Test Group')
+    group.members.add(authenticated_user, *others)
+    token = get_jwt_token(authenticated_user)
+    url = reverse('export_expenses', kwargs={'group_id': group.id})
+
+    def add_expenses(count):
+        expenses = Expense.objects.bulk_create([
+            Expense(group=group, description=f'Expense {i}', amount=Decimal('30.00'), split_type='custom') for i in range(count)
+        ])
+        Contribution.objects.bulk_create([
+            Contribution(expense=expense, group=group, user=user, amount=Decimal('10.00'))
+            for expense in expenses for user in [authenticated_user, *others]
+        ])
+
+    def export_peak():
+        response = client.get(url, {'file_format': 'ndjson'}, HTTP_AUTHORIZATION=f'Bearer {token}')
+        tracemalloc.start()
+        try:
+            size = sum(len(chunk) for chunk in response.streaming_content)
+            return size, tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    add_expenses(2000)
+    small_size, small_peak = export_peak()
+    add_expenses(8000)
+    large_size, large_peak = export_peak()
+
+    assert large_size > 4 * small_size
+    # Five times the rows, about the same peak: one chunk of rows and one output buffer
+    assert large_peak < 1.5 * small_peak
+
+
+@pytest.mark.django_db
+def test_expense_creation_with_an_idempotency_key_is_replayed(client, authenticated_user, django_assert_max_num_queries):
+    group = ExpenseGroup.objects.create(name='Test Group')
+    group.members.add(authenticated_user)
+    token = get_jwt_token(authenticated_user)
+    url = reverse('manage_expenses', kwargs={'group_id': group.id})
+    data = {'description': 'Dinner', 'amount': '100.00', 'split_type': 'equal'}
+    headers = {'HTTP_AUTHORIZATION': f'Bearer {token}', 'HTTP_IDEMPOTENCY_KEY': 'retry-1'}
+
+    first = client.post(url, data, content_type='application/json', **headers)
+    assert first.status_code == status.HTTP_201_CREATED
+
+    with django_assert_max_num_queries(1) as captured:
+        replay = client.post(url, data, content_type='application/json', **headers)
+    assert replay.status_code == status.HTTP_201_CREATED
+    assert replay['Idempotent-Replayed'] == 'true'
+    assert replay.json() == first.json()
+    assert not any('split_expense_expense' in query['sql'] or 'split_expense_contribution' in query['sql'] for query in captured.captured_queries)
+    assert Expense.objects.filter(group=group).count() == 1
+
+    # The same key with a different body is refused
+    response = client.post(url, {**data, 'amount': '5.00'}, content_type='application/json', **headers)
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    # Failed requests don't use up the key
+    headers['HTTP_IDEMPOTENCY_KEY'] = 'retry-2'
+    response = client.post(url, {**data, 'split_type': 'bogus'}, content_type='application/json', **headers)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    response = client.post(url, data, content_type='application/json', **headers)
+    assert response.status_code == status.HTTP_201_CREATED
+    assert Expense.objects.filter(group=group).count() == 2
+
+    IdempotencyKey.objects.filter(key='retry-1').update(created_at=timezone.now() - timedelta(days=2))
+    call_command('purge_idempotency_keys')
+    assert list(IdempotencyKey.objects.values_list('key', flat=True)) == ['retry-2']
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('idempotency_key', [None, 'retry-1'])
+def test_writes_lock_the_change_log_last(client, authenticated_user, idempotency_key):
+    group = ExpenseGroup.objects.create(name='Test Group')
+    group.members.add(authenticated_user)
+    headers = {'HTTP_AUTHORIZATION': f'Bearer {get_jwt_token(authenticated_user)}'}
+    if idempotency_key:
+        headers['HTTP_IDEMPOTENCY_KEY'] = idempotency_key
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.post(reverse('manage_expenses', kwargs={'group_id': group.id}),
+                               {'description': 'Dinner', 'amount': '100.00', 'split_type': 'equal'},
+                               content_type='application/json', **headers)
+    assert response.status_code == status.HTTP_201_CREATED
+
+    # The change itself is the only write after the UPDATE that locks the sequence row
+    writes = [query['sql'] for query in queries.captured_queries if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))]
+    locked = next(i for i, sql in enumerate(writes) if sql.startswith('UPDATE "split_expense_changesequence"'))
+    assert [sql.split(' (')[0] for sql in writes[locked + 1:]] == ['INSERT INTO "split_expense_change"']
+
+
+@pytest.mark.django_db
+def test_balances_split_to_the_cent_and_net_to_zero(client, authenticated_user):
+    others = [User.objects.create_user(username=f'member{i}', password='password') for i in range(2)]
+    group = ExpenseGroup.objects.create(name='Test Group')
+    group.members.add(authenticated_user, *others)
+    token = get_jwt_token(authenticated_user)
+    data = {'description': 'Dinner', 'amount': '100.00', 'split_type': 'equal'}
+    client.post(reverse('manage_expenses', kwargs={'group_id': group.id}), data, content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    response = client.get(reverse('group_summary', kwargs={'group_id': group.id}), HTTP_AUTHORIZATION=f'Bearer {token}')
+    # 100.00 / 3: the payer's own share takes the leftover cent
+    assert response.data['balances'] == [
+        {'owed_to': 'testuser', 'amount': Decimal('66.66')},
+        {'owed_by': 'member0', 'amount': Decimal('33.33')},
+        {'owed_by': 'member1', 'amount': Decimal('33.33')},
+    ]
+
+    response = client.get(reverse('overall_balance_summary'), HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.data['total_owed_to_user'] == Decimal('66.66')
+    assert sum(row['amount'] for row in response.data['owed_by']) == Decimal('66.66')
+
+    # Amounts are stored as cents and still come back as decimal strings
+    assert Contribution.objects.filter(amount=Decimal('100.00')).exists()
+    response = client.get(reverse('manage_expenses', kwargs={'group_id': group.id}), HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.json()[0]['amount'] == '100.00'
+
+
+@pytest.mark.django_db
+def test_expenses_are_split_into_owed_shares(client, authenticated_user):
+    user2 = User.objects.create_user(username='user2', password='password')
+    user3 = User.objects.create_user(username='user3', password='password')
+    group = ExpenseGroup.objects.create(name='Test Group')
+    group.members.add(authenticated_user, user2, user3)
+    token = get_jwt_token(authenticated_user)
+    url = reverse('manage_expenses', kwargs={'group_id': group.id})
+
+    def post(data):
+        return client.post(url, {'description': 'Expense', **data}, content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    # An equal split between some of the members
+    response = post({'amount': '10.00', 'split_type': 'equal', 'participants': ['testuser', 'user2']})
+    assert response.status_code == status.HTTP_201_CREATED
+    assert [(c['user'], c['amount']) for c in response.data['contributions']] == [('testuser', '10.00')]
+    assert [(s['user'], s['amount']) for s in response.data['shares']] == [('testuser', '5.00'), ('user2', '5.00')]
+
+    response = post({'amount': '100.00', 'split_type': 'percentage', 'splits': [
+        {'username': 'user2', 'percent': '50'}, {'username': 'user3', 'percent': '25'}, {'username': 'testuser', 'percent': '25'},
+    ]})
+    assert response.status_code == status.HTTP_201_CREATED
+    response = post({'amount': '30.00', 'split_type': 'shares', 'splits': [{'username': 'user3', 'shares': 2}, {'username': 'user2', 'shares': 1}]})
+    assert sorted((s['user'], s['amount']) for s in response.data['shares']) == [('user2', '10.00'), ('user3', '20.00')]
+    response = post({'amount': '12.00', 'split_type': 'exact', 'splits': [{'username': 'user3', 'amount': '12.00'}]})
+    assert response.status_code == status.HTTP_201_CREATED
+
+    # testuser paid 152.00 and owes 30.00; user2 owes 65.00 and user3 57.00
+    assert MemberBalance.objects.get(group=group, user=user2).owed == Decimal('65.00')
+    assert MemberBalance.objects.find_drift() == []
+    response = client.get(reverse('group_summary', kwargs={'group_id': group.id}), HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.data['balances'] == [
+        {'owed_to': 'testuser', 'amount': Decimal('122.00')},
+        {'owed_by': 'user2', 'amount': Decimal('65.00')},
+        {'owed_by': 'user3', 'amount': Decimal('57.00')},
+    ]
+
+    # Members who join later don't owe anything towards earlier shared expenses
+    group.members.add(User.objects.create_user(username='user4', password='password'))
+    response = client.get(reverse('group_summary', kwargs={'group_id': group.id}), HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert {'owed_by': 'user4', 'amount': Decimal('0.00')} not in response.data['balances']
+    assert len(response.data['balances']) == 3
+
+    for data, error in [
+        ({'split_type': 'percentage', 'splits': [{'username': 'user2', 'percent': '60'}]}, 'Percentages must add up to 100'),
+        ({'split_type': 'exact', 'splits': [{'username': 'user2', 'amount': '1.00'}]}, 'Split amounts do not match the total amount'),
+        ({'split_type': 'shares'}, 'Splits are required for shares split'),
+    ]:
+        response = post({'amount': '10.00', **data})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data['error'] == error
+    response = post({'amount': '10.00', 'split_type': 'equal', 'participants': ['user2', 'stranger']})
+    assert response.data['errors'] == ['User stranger is not a member of the group']
+    assert Expense.objects.filter(group=group).count() == 4
+
+
+@pytest.mark.django_db
+def test_editing_an_expense_replaces_its_shares(client, authenticated_user):
+    user2 = User.objects.create_user(username='user2', password='password')
+    group = ExpenseGroup.objects.create(name='Test Group')
+    group.members.add(authenticated_user, user2)
+    token = get_jwt_token(authenticated_user)
+    data = {'description': 'Dinner', 'amount': '40.00', 'split_type': 'equal'}
+    response = client.post(reverse('manage_expenses', kwargs={'group_id': group.id}), data, content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    expense_url = reverse('edit_or_delete_expense', kwargs={'group_id': group.id, 'expense_id': response.data['id']})
+    data = {'split_type': 'exact', 'splits': [{'username': 'user2', 'amount': '40.00'}]}
+    response = client.patch(expense_url, data, content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_200_OK
+    assert list(Share.objects.values_list('user__username', 'amount')) == [('user2', Decimal('40.00'))]
+    assert MemberBalance.objects.get(group=group, user=authenticated_user).owed == Decimal('0.00')
+    assert MemberBalance.objects.get(group=group, user=user2).owed == Decimal('40.00')
+
+    # Shares drift is caught and rebuilt like paid totals
+    MemberBalance.objects.filter(group=group).update(owed=0)
+    assert [row[2:] for row in MemberBalance.objects.find_drift()] == [('owed', Decimal('0.00'), Decimal('40.00'))]
+    call_command('rebuild_balances')
+    assert MemberBalance.objects.find_drift() == []
+
+    client.delete(expense_url, HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert not Share.objects.exists()
+    assert MemberBalance.objects.get(group=group, user=user2).owed == Decimal('0.00')
+
+
+@pytest.mark.django_db
+def test_shares_round_trip_through_export_and_import(client, authenticated_user):
+    user2 = User.objects.create_user(username='user2', password='password')
+    group = ExpenseGroup.objects.create(name='Test Group')
+    group.members.add(authenticated_user, user2)
+    token = get_jwt_token(authenticated_user)
+    data = {'description': 'Rent', 'amount': '10.00', 'split_type': 'percentage', 'splits': [
+        {'username': 'testuser', 'percent': '33.33'}, {'username': 'user2', 'percent': '66.67'},
+    ]}
+    client.post(reverse('manage_expenses', kwargs={'group_id': group.id}), data, content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    response = client.get(reverse('export_expenses', kwargs={'group_id': group.id}), HTTP_AUTHORIZATION=f'Bearer {token}')
+    exported = b''.join(response.streaming_content)
+    assert exported.decode().splitlines()[1].endswith('percentage,testuser,testuser:10.00,testuser:3.33;user2:6.67')
+
+    copy = ExpenseGroup.objects.create(name='Copy')
+    copy.members.add(authenticated_user, user2)
+    rows = exported + b',,Museum,20.00,shares,user2,,\n'
+    upload = SimpleUploadedFile('export.csv', rows, content_type='text/csv')
+    response = client.post(reverse('bulk_import_expenses', kwargs={'group_id': copy.id}), {'file': upload}, HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.data == {'created': 1, 'errors': [{'row': 2, 'error': 'Shares are required for shares split'}]}
+    assert MemberBalance.objects.get(group=copy, user=user2).owed == Decimal('6.67')
+    assert MemberBalance.objects.find_drift() == []
+
+
+@pytest.mark.django_db
+def test_balance_checkpoints_cover_older_history(client, authenticated_user):
+    user2 = User.objects.create_user(username='user2', password='password')
+    group = ExpenseGroup.objects.create(name='Test Group')
+    group.members.add(authenticated_user, user2)
+    token = get_jwt_token(authenticated_user)
+    url = reverse('manage_expenses', kwargs={'group_id': group.id})
+
+    def post(amount):
+        data = {'description': 'Dinner', 'amount': amount, 'split_type': 'equal'}
+        return client.post(url, data, content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {token}').data['id']
+
+    first = post('10.00')
+    post('20.00')
+    call_command('checkpoint_balances')
+    checkpoint = BalanceCheckpoint.objects.get(group=group)
+    assert sorted(checkpoint.balances.values_list('user__username', 'paid', 'owed')) == [
+        ('testuser', Decimal('30.00'), Decimal('15.00')), ('user2', Decimal('0.00'), Decimal('15.00')),
+    ]
+
+    # Later expenses are read on top of the checkpoint, and the next checkpoint starts from this one
+    post('40.00')
+    assert MemberBalance.objects.find_drift() == []
+    call_command('checkpoint_balances', '--keep', '2')
+    assert BalanceCheckpoint.objects.filter(group=group).count() == 2
+    call_command('checkpoint_balances')
+    latest = BalanceCheckpoint.objects.get(group=group)
+    assert latest.balances.get(user=user2).owed == Decimal('35.00')
+
+    # Only history after the checkpoint is read: a change that bypasses the ledger shows up in a full check only
+    Contribution.objects.filter(expense_id=first).update(amount=Decimal('11.00'))
+    assert MemberBalance.objects.find_drift() == []
+    assert MemberBalance.objects.find_drift(from_checkpoints=False) != []
+    Contribution.objects.filter(expense_id=first).update(amount=Decimal('10.00'))
+
+    # Editing an expense the checkpoint covers drops it
+    expense_url = reverse('edit_or_delete_expense', kwargs={'group_id': group.id, 'expense_id': first})
+    client.patch(expense_url, {'amount': '12.00'}, content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert not BalanceCheckpoint.objects.exists()
+    assert MemberBalance.objects.find_drift() == []
+
+    # Checkpoints as of a date only cover the expenses created before it
+    Expense.objects.filter(id=first).update(created_at=timezone.now() - timedelta(days=30))
+    call_command('checkpoint_balances', '--before', (timezone.now() - timedelta(days=1)).date().isoformat())
+    assert BalanceCheckpoint.objects.get(group=group).last_expense_id == first
+    assert MemberBalance.objects.find_drift() == []
+    call_command('rebuild_balances', '--ignore-checkpoints')
+    assert not BalanceCheckpoint.objects.exists()
+
+@pytest.mark.django_db
+def test_batch_runs_operations_in_order(client, authenticated_user):
+    friends = [User.objects.create_user(username=f'friend{i}', password='password') for i in range(3)]
+    token = get_jwt_token(authenticated_user)
+    url = reverse('batch')
+
+    def add_expense(i):
+        return {'op': 'add_expense', 'group': 'trip', 'ref': f'expense{i}', 'description': f'Taxi {i}', 'amount': '40.00', 'split_type': 'equal'}
+
+    operations = [
+        {'op': 'create_group', 'ref': 'trip', 'name': 'Trip'},
+        {'op': 'edit_group_members', 'group': 'trip', 'action': 'add', 'usernames': ['friend0', 'friend1', 'friend2']},
+        {'op': 'add_expense', 'group': 'trip', 'description': 'Hotel', 'amount': '100.00', 'split_type': 'exact',
+         'splits': [{'username': 'testuser', 'amount': '10.00'}, {'username': 'friend0', 'amount': '90.00'}]},
+        add_expense(0),
+        {'op': 'edit_expense', 'group': 'trip', 'expense': 'expense0', 'amount': '80.00'},
+        add_expense(1),
+        {'op': 'delete_expense', 'group': 'trip', 'expense': 'expense1'},
+    ]
+    response = client.post(url, {'operations': operations}, content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_200_OK
+    results = response.json()['results']
+    assert [r['status'] for r in results] == [201, 200, 201, 201, 200, 201, 200]
+    group = ExpenseGroup.objects.get(name='Trip')
+    assert results[0]['data'] == {'id': group.id, 'name': 'Trip', 'members': ['testuser', 'friend0', 'friend1', 'friend2']}
+    assert results[4]['data']['amount'] == '80.00'
+    assert sorted((s['user'], s['amount']) for s in results[4]['data']['shares']) == [
+        ('friend0', '20.00'), ('friend1', '20.00'), ('friend2', '20.00'), ('testuser', '20.00'),
+    ]
+    assert results[5]['data'] == {'id': results[5]['data']['id']}  # Deleted by the last operation
+    assert list(group.expenses.order_by('id').values_list('description', flat=True)) == ['Hotel', 'Taxi 0']
+
+    assert member_balances(group) == {'testuser': 15000, 'friend0': -11000, 'friend1': -2000, 'friend2': -2000}
+    assert MemberBalance.objects.find_drift([group.id]) == []
+
+    # Group, membership and user lookups are shared, so each further expense costs the same fixed number of queries
+    def count_queries(n):
+        operations = [{'op': 'add_expense', 'group': group.id, 'description': 'Coffee', 'amount': '4.00', 'split_type': 'equal'}] * n
+        with CaptureQueriesContext(connection) as queries:
+            response = client.post(url, {'operations': operations}, content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {token}')
+        assert response.status_code == status.HTTP_200_OK
+        return len(queries)
+    per_expense = (count_queries(11) - count_queries(1)) / 10
+    assert per_expense <= 10
+
+@pytest.mark.django_db
+def test_failed_batch_operation_rolls_back_the_batch(client, authenticated_user):
+    other = User.objects.create_user(username='other', password='password')
+    outsider_group = ExpenseGroup.objects.create(name='Not Mine')
+    outsider_group.members.add(other)
+    token = get_jwt_token(authenticated_user)
+    url = reverse('batch')
+
+    operations = [
+        {'op': 'create_group', 'ref': 'trip', 'name': 'Trip'},
+        {'op': 'add_expense', 'group': 'trip', 'description': 'Dinner', 'amount': '30.00', 'split_type': 'equal'},
+        {'op': 'edit_group_members', 'group': 'trip', 'action': 'add', 'usernames': ['other', 'nobody']},
+        {'op': 'add_expense', 'group': 'trip', 'description': 'Never run', 'amount': '30.00', 'split_type': 'equal'},
+    ]
+    response = client.post(url, {'operations': operations}, content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    data = response.json()
+    assert data['error'] == 'Operation 2 failed, so no changes were made'
+    assert [r['status'] for r in data['results']] == [201, 201, 400]
+    assert data['results'][2]['data'] == {'errors': ['User nobody not found']}
+    assert not ExpenseGroup.objects.filter(name='Trip').exists()
+    assert not Expense.objects.exists() and not MemberBalance.objects.exists()
+
+    # Groups the user isn't in can't be reached, by id or through another kind of ref
+    for operations in (
+        [{'op': 'add_expense', 'group': outsider_group.id, 'description': 'Dinner', 'amount': '30.00', 'split_type': 'equal'}],
+        [{'op': 'create_group', 'ref': 'trip', 'name': 'Trip'},
+         {'op': 'add_expense', 'group': 'trip', 'ref': 'dinner', 'description': 'Dinner', 'amount': '30.00', 'split_type': 'equal'},
+         {'op': 'edit_group_members', 'group': 'dinner', 'action': 'add', 'usernames': ['other']}],
+    ):
+        response = client.post(url, {'operations': operations}, content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {token}')
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        assert response.json()['results'][-1]['data'] == {'error': 'Group not found or access denied'}
+
+    for body in ({}, {'operations': []}, {'operations': ['create_group']}, {'operations': [{'op': 'drop_tables'}]},
+                 {'operations': [{'op': 'create_group', 'name': 'A', 'ref': 'x'}, {'op': 'create_group', 'name': 'B', 'ref': 'x'}]}):
+        response = client.post(url, body, content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {token}')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert ExpenseGroup.objects.count() == 1
+
+@pytest.mark.django_db
+def test_sync_returns_changes_since_cursor(client, authenticated_user):
+    friend = User.objects.create_user(username='friend', password='password')
+    stranger = User.objects.create_user(username='stranger', password='password')
+    token, friend_token = get_jwt_token(authenticated_user), get_jwt_token(friend)
+    auth = {'content_type': 'application/json', 'HTTP_AUTHORIZATION': f'Bearer {token}'}
+    url = reverse('sync_changes')
+
+    def sync(cursor, token=token, **params):
+        return client.get(url, {'since': cursor, **params}, HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    # Without a cursor there is nothing to return, only where to start from
+    start = client.get(url, HTTP_AUTHORIZATION=f'Bearer {token}').json()
+    assert start['changes'] == [] and not start['has_more']
+
+    group = ExpenseGroup.objects.get(id=client.post(reverse('groups'), {'name': 'Trip'}, **auth).json()['id'])
+    client.patch(reverse('edit_group_members', kwargs={'group_id': group.id}), {'action': 'add', 'usernames': ['friend']}, **auth)
+    expenses_url = reverse('manage_expenses', kwargs={'group_id': group.id})
+    dinner = client.post(expenses_url, {'description': 'Dinner', 'amount': '30.00', 'split_type': 'equal'}, **auth).json()['id']
+    taxi = client.post(expenses_url, {'description': 'Taxi', 'amount': '10.00', 'split_type': 'equal'}, **auth).json()['id']
+    client.patch(reverse('edit_or_delete_expense', kwargs={'group_id': group.id, 'expense_id': dinner}), {'amount': '40.00'}, **auth)
+    client.delete(reverse('edit_or_delete_expense', kwargs={'group_id': group.id, 'expense_id': taxi}), **auth)
+    client.patch(reverse('edit_or_delete_group', kwargs={'group_id': group.id}), {'name': 'Road Trip'}, **auth)
+    # Changes to groups the user isn't in stay out of their sync
+    other_group = ExpenseGroup.objects.create(name='Elsewhere')
+    other_group.members.add(stranger)
+    client.post(reverse('manage_expenses', kwargs={'group_id': other_group.id}), {'description': 'Lunch', 'amount': '5.00', 'split_type': 'equal'},
+                content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {get_jwt_token(stranger)}')
+
+    response = sync(start['cursor'])
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()
+    # One entry per object, with its latest data, in the order of its latest change
+    assert [(c['kind'], c['id'], c['action']) for c in data['changes']] == [
+        ('expense', dinner, 'upsert'), ('expense', taxi, 'delete'), ('group', group.id, 'upsert'),
+    ]
+    assert data['changes'][0]['data']['amount'] == '40.00'
+    assert data['changes'][2]['data'] == {'id': group.id, 'name': 'Road Trip', 'members': ['testuser', 'friend']}
+    assert data['balances'] == {str(group.id): {'testuser': 20.0, 'friend': -20.0}}
+    assert not data['has_more']
+    assert sync(data['cursor']).json()['changes'] == []
+
+    # Pages follow each other through the cursor
+    first = sync(start['cursor'], limit=4).json()
+    assert first['has_more'] and len(first['changes']) == 3
+    assert [(c['kind'], c['id']) for c in sync(first['cursor']).json()['changes']] == [('expense', dinner), ('expense', taxi), ('group', group.id)]
+
+    # A removed member gets a tombstone for the group; deleting the group leaves one for everyone else
+    friend_cursor = sync(start['cursor'], friend_token).json()['cursor']
+    client.patch(reverse('edit_group_members', kwargs={'group_id': group.id}), {'action': 'remove', 'usernames': ['friend']}, **auth)
+    assert sync(friend_cursor, friend_token).json()['changes'] == [{'kind': 'group', 'id': group.id, 'group': group.id, 'action': 'delete'}]
+    cursor = data['cursor']
+    client.delete(reverse('edit_or_delete_group', kwargs={'group_id': group.id}), **auth)
+    assert sync(cursor).json()['changes'] == [{'kind': 'group', 'id': group.id, 'group': group.id, 'action': 'delete'}]
+
+    # Batches and imports are logged too
+    cursor = sync(cursor).json()['cursor']
+    operations = [{'op': 'create_group', 'ref': 'home', 'name': 'Home'},
+                  {'op': 'add_expense', 'group': 'home', 'description': 'Rent', 'amount': '900.00', 'split_type': 'equal'}]
+    client.post(reverse('batch'), {'operations': operations}, **auth)
+    home = ExpenseGroup.objects.get(name='Home')
+    upload = SimpleUploadedFile('expenses.csv', b'description,amount,split_type\nPower,60.00,equal\n', content_type='text/csv')
+    client.post(reverse('bulk_import_expenses', kwargs={'group_id': home.id}), {'file': upload}, HTTP_AUTHORIZATION=f'Bearer {token}')
+    changes = sync(cursor).json()['changes']
+    assert [(c['kind'], c['data']['description'] if c['kind'] == 'expense' else c['data']['name']) for c in changes] == [
+        ('group', 'Home'), ('expense', 'Rent'), ('expense', 'Power'),
+    ]
+    assert list(Change.objects.values_list('id', flat=True).order_by('id')) == list(range(1, Change.objects.count() + 1))
+
+    # Purged history can't be synced from; invalid cursors are rejected
+    call_command('purge_changes', older_than=-1)
+    assert not Change.objects.exists()
+    assert sync(cursor).status_code == status.HTTP_410_GONE
+    assert sync('not-a-cursor').status_code == status.HTTP_400_BAD_REQUEST
+    fresh = client.get(url, HTTP_AUTHORIZATION=f'Bearer {token}').json()['cursor']
+    assert sync(fresh).json()['changes'] == []
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('how', ['edit_group_members', 'join_group', 'batch'])
+def test_sync_tells_added_members_to_resync_the_group(client, authenticated_user, how):
+    friend = User.objects.create_user(username='friend', password='password')
+    token, friend_token = get_jwt_token(authenticated_user), get_jwt_token(friend)
+    auth = {'content_type': 'application/json', 'HTTP_AUTHORIZATION': f'Bearer {token}'}
+    url = reverse('sync_changes')
+
+    group = ExpenseGroup.objects.get(id=client.post(reverse('groups'), {'name': 'Trip'}, **auth).json()['id'])
+    client.post(reverse('manage_expenses', kwargs={'group_id': group.id}), {'description': 'Dinner', 'amount': '30.00', 'split_type': 'equal'}, **auth)
+    cursor = client.get(url, HTTP_AUTHORIZATION=f'Bearer {token}').json()['cursor']
+    friend_cursor = client.get(url, HTTP_AUTHORIZATION=f'Bearer {friend_token}').json()['cursor']
+
+    if how == 'edit_group_members':
+        client.patch(reverse(how, kwargs={'group_id': group.id}), {'action': 'add', 'usernames': ['friend']}, **auth)
+    elif how == 'join_group':
+        client.post(reverse(how, kwargs={'group_id': group.id}), {'usernames': ['friend']}, **auth)
+    else:
+        operations = [{'op': 'edit_group_members', 'group': group.id, 'action': 'add', 'usernames': ['friend']}]
+        client.post(reverse('batch'), {'operations': operations}, **auth)
+    # A later change to the group doesn't replace the resync
+    client.patch(reverse('edit_or_delete_group', kwargs={'group_id': group.id}), {'name': 'Road Trip'}, **auth)
+
+    # The added member has none of the group's earlier expenses, so they are told to load it in full
+    changes = client.get(url, {'since': friend_cursor}, HTTP_AUTHORIZATION=f'Bearer {friend_token}').json()['changes']
+    assert changes == [{'kind': 'group', 'id': group.id, 'group': group.id, 'action': 'resync',
+                        'data': {'id': group.id, 'name': 'Road Trip', 'members': ['testuser', 'friend']}}]
+    # Everyone else only sees the group change
+    changes = client.get(url, {'since': cursor}, HTTP_AUTHORIZATION=f'Bearer {token}').json()['changes']
+    assert [(c['kind'], c['id'], c['action']) for c in changes] == [('group', group.id, 'upsert')]
+
+    # Removed again before syncing, the member only gets the tombstone
+    client.patch(reverse('edit_group_members', kwargs={'group_id': group.id}), {'action': 'remove', 'usernames': ['friend']}, **auth)
+    changes = client.get(url, {'since': friend_cursor}, HTTP_AUTHORIZATION=f'Bearer {friend_token}').json()['changes']
+    assert changes == [{'kind': 'group', 'id': group.id, 'group': group.id, 'action': 'delete'}]
+
 
 @pytest.fixture
 def authenticated_user():
@@ -292,4 +1510,3 @@ def authenticated_user():
 def get_jwt_token(user):
     refresh = RefreshToken.for_user(user)
     return str(refresh.access_token)
-
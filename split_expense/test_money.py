@@ -0,0 +1,22 @@
+from decimal import Decimal
+from .money import allocate, split_evenly, to_cents, to_decimal
+
+
+def test_amounts_round_trip_through_cents():
+    assert to_cents(Decimal('12.34')) == 1234
+    assert to_cents('0.29') == 29
+    assert to_cents(Decimal('-0.005')) == 0  # Half-even below a cent
+    assert to_decimal(1234) == Decimal('12.34')
+    assert str(to_decimal(-5)) == '-0.05'
+
+
+def test_splits_hand_out_leftover_cents_deterministically():
+    assert split_evenly(10000, 3) == [3334, 3333, 3333]
+    assert split_evenly(-100, 3) == [-33, -33, -34]
+
+    # Largest remainders get the leftover cents, ties go to the earlier share
+    assert allocate(100, [1, 1, 1]) == [34, 33, 33]
+    assert allocate(1000, [3333, 3333, 3334]) == [333, 333, 334]
+    assert allocate(7, [0, 0]) == [0, 0]
+    for total, weights in [(99999, [7, 13, 1, 0, 42]), (1, [5, 5]), (-250, [1, 2])]:
+        assert sum(allocate(total, weights)) == total
@@ -0,0 +1,50 @@
+import random
+from collections import defaultdict
+from decimal import Decimal
+from .settlement import settle_up
+
+
+def apply_transfers(balances, transfers):
+    remaining = defaultdict(Decimal, {name: Decimal(amount) for name, amount in balances.items()})
+    for payer, payee, amount in transfers:
+        assert amount > 0
+        remaining[payer] += amount
+        remaining[payee] -= amount
+    return remaining
+
+
+def test_greedy_plan_settles_every_balance():
+    balances = {'alice': Decimal('30.00'), 'bob': Decimal('-10.00'), 'carol': Decimal('-20.00'), 'dave': Decimal('0')}
+    transfers = settle_up(balances)
+
+    assert len(transfers) == 2
+    assert all(amount == 0 for amount in apply_transfers(balances, transfers).values())
+
+
+def test_rounding_residue_is_absorbed():
+    # Thirds of a cent never net to exactly zero once rounded
+    balances = {'alice': Decimal('20') / 3, 'bob': Decimal('-10') / 3, 'carol': Decimal('-10') / 3}
+    transfers = settle_up(balances)
+
+    assert sum(amount for _, payee, amount in transfers if payee == 'alice') == Decimal('6.66')
+
+
+def test_exact_plan_uses_zero_sum_groups():
+    balances = {'a': -9, 'b': 7, 'c': -2, 'd': 5, 'e': 6, 'f': -7}
+
+    assert len(settle_up(balances)) == 5
+    transfers = settle_up(balances, exact=True)
+    assert len(transfers) == 4
+    assert all(amount == 0 for amount in apply_transfers(balances, transfers).values())
+
+
+def test_greedy_plan_for_thousands_of_members():
+    # Timing is left to benchmarks/settlement.py
+    rng = random.Random(0)
+    cents = [rng.randint(-50_000, 50_000) for _ in range(4999)]
+    cents.append(-sum(cents))
+    balances = {f'user{i}': Decimal(amount) / 100 for i, amount in enumerate(cents)}
+    transfers = settle_up(balances)
+
+    assert len(transfers) <= len(balances) - 1
+    assert all(amount == 0 for amount in apply_transfers(balances, transfers).values())
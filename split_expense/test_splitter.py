@@ -0,0 +1,28 @@
+from decimal import Decimal
+import pytest
+from .splitter import SplitError, split
+
+
+def test_every_split_type_adds_up_to_the_total():
+    assert split('equal', 10000, [None] * 3) == [3334, 3333, 3333]
+    assert split('exact', 10000, ['60.00', Decimal('39.99'), '0.01']) == [6000, 3999, 1]
+    assert split('percentage', 10000, ['33.33', '33.33', '33.34']) == [3333, 3333, 3334]
+    assert split('percentage', 1, ['50', '50']) == [1, 0]  # Ties go to the earlier participant
+    assert split('shares', 10000, [2, 1, '1.5']) == [4445, 2222, 3333]
+    assert split('shares', 999, [1, 0]) == [999, 0]
+
+
+def test_invalid_splits_are_rejected():
+    with pytest.raises(SplitError, match='do not match'):
+        split('exact', 10000, ['60.00', '30.00'])
+    with pytest.raises(SplitError, match='add up to 100'):
+        split('percentage', 10000, ['50', '49.99'])
+    with pytest.raises(SplitError, match='must have a share'):
+        split('shares', 10000, [0, 0])
+    for values in (['-1'], ['0.001'], ['abc'], ['NaN']):
+        with pytest.raises(SplitError, match='Invalid split value'):
+            split('shares', 100, values)
+    with pytest.raises(SplitError):
+        split('equal', 100, [])
+    with pytest.raises(SplitError):
+        split('custom', 100, [1])
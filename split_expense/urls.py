@@ -1,5 +1,6 @@
 from django.urls import path
-from .views import register, groups, join_group, manage_expenses, group_summary, fetch_users, group_members,edit_group_members,edit_or_delete_group,edit_or_delete_expense,overall_balance_summary
+from .views import register, groups, join_group, manage_expenses, group_summary, fetch_users, group_members,edit_group_members,edit_or_delete_group,edit_or_delete_expense,overall_balance_summary,settle_plan,group_stats,bulk_import_expenses,export_expenses,sync_changes,cache_statistics,metrics
+from .batch import batch
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
 urlpatterns = [
@@ -9,12 +10,20 @@ urlpatterns = [
     path('groups/', groups, name='groups'),
     path('groups/<int:group_id>/join/', join_group, name='join_group'),
     path('groups/<int:group_id>/expenses/', manage_expenses, name='manage_expenses'),
+    path('groups/<int:group_id>/expenses/bulk/', bulk_import_expenses, name='bulk_import_expenses'),
+    path('groups/<int:group_id>/export/', export_expenses, name='export_expenses'),
     path('groups/<int:group_id>/summary/', group_summary, name='group_summary'),
+    path('groups/<int:group_id>/settle-plan/', settle_plan, name='settle_plan'),
+    path('groups/<int:group_id>/stats/', group_stats, name='group_stats'),
     path('users/', fetch_users, name='fetch_users'),
     path('groups/<int:group_id>/members/', group_members, name='group_members'),
     path('groups/<int:group_id>/update/', edit_group_members, name='edit_group_members'),
     path('groups/<int:group_id>/edit/', edit_or_delete_group, name='edit_or_delete_group'),
     path('groups/<int:group_id>/expenses/<int:expense_id>/', edit_or_delete_expense, name='edit_or_delete_expense'),
+    path('batch/', batch, name='batch'),
+    path('sync/', sync_changes, name='sync_changes'),
     path('summary/', overall_balance_summary, name='overall_balance_summary'),
+    path('cache/stats/', cache_statistics, name='cache_statistics'),
+    path('metrics/', metrics, name='metrics'),
 
 ]
@@ -1,12 +1,30 @@
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated , AllowAny
+from rest_framework.permissions import IsAuthenticated , AllowAny, IsAdminUser
 from rest_framework.response import Response
 from rest_framework import status
 from django.contrib.auth.models import User
-from .models import ExpenseGroup, Expense, Contribution
-from .serializers import UserSerializer, ExpenseGroupSerializer, ExpenseSerializer
+from .models import ExpenseGroup, Expense, Contribution, Share, MemberBalance, Change, ChangeSequence, spend_day
+from .balances import member_balances, member_balances_for_user
+from .analytics import INTERVALS as SPEND_INTERVALS, spend_series
+from .settlement import settle_up_cents, EXACT_MAX_MEMBERS
+from .money import allocate, to_cents, to_decimal
+from .splitter import SPLIT_FIELDS, SplitError, split
+from .importer import FORMATS as IMPORT_FORMATS, detect_format, iter_rows, import_expenses
+from .exporter import FORMATS as EXPORT_FORMATS, iter_expenses, render as render_export
+from .serializers import UserSerializer, ExpenseGroupSerializer, ExpenseSerializer, ExpenseListSerializer
+from .pagination import InvalidCursor, decode_cursor, encode_cursor, paginate, parse_limit, next_page_headers
+from .caching import cached, user_groups_key, versions_digest, etag, not_modified, stats as cache_stats, count_lookup
+from .directory import DEFAULT_LIMIT as DIRECTORY_LIMIT, MAX_LIMIT as DIRECTORY_MAX_LIMIT, entries_matching, hot_prefixes, normalise
+from .metrics import render_prometheus
+from .routers import replica_reads
+from .idempotency import idempotent
 from decimal import Decimal
-from django.db.models import Sum
+from collections import defaultdict
+from datetime import date
+import csv
+from django.db import router, transaction
+from django.db.models import Prefetch
+from django.http import HttpResponse, StreamingHttpResponse
 
 #User Registration
 @api_view(['POST'])
@@ -27,12 +45,18 @@ def register(request):
 #Expense Groups Management
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
+@replica_reads
 def groups(request):
     if request.method == 'GET':
         #Get all groups the user belongs to
-        user_groups = request.user.expense_groups.all()
+        versions = dict(request.user.expense_groups.values_list('id', 'version'))
+        current_etag = etag('groups', request.user.id, versions_digest(versions))
+        if not_modified(request, current_etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': current_etag})
+
+        user_groups = ExpenseGroup.objects.filter(id__in=versions).prefetch_related('members')
         serializer = ExpenseGroupSerializer(user_groups, many=True)
-        return Response(serializer.data)
+        return Response(serializer.data, headers={'ETag': current_etag})
 
     if request.method == 'POST':
         #Create a new expense group
@@ -44,8 +68,10 @@ def groups(request):
         if ExpenseGroup.objects.filter(name=name, members=request.user).exists():
             return Response({'error': 'Group name must be unique to your account'}, status=status.HTTP_400_BAD_REQUEST)
 
-        group = ExpenseGroup.objects.create(name=name)
-        group.members.add(request.user)
+        with transaction.atomic():
+            group = ExpenseGroup.objects.create(name=name)
+            group.members.add(request.user)
+            Change.objects.record(group.id, 'group', [group.id])
         return Response(ExpenseGroupSerializer(group).data, status=status.HTTP_201_CREATED)
 
 #Joining an expense group
@@ -83,7 +109,10 @@ def join_group(request, group_id):
             return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
 
         # Add the users to the group's members
-        group.members.add(*users_to_add)
+        with transaction.atomic():
+            group.members.add(*users_to_add)
+            ExpenseGroup.objects.bump(group.id)
+            _record_members_changed(group.id, added_ids=[user.id for user in users_to_add])
 
         # Prepare success message
         added_users = [user.username for user in users_to_add]
@@ -98,6 +127,8 @@ def join_group(request, group_id):
 #Managing expenses in a group
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
+@replica_reads
+@idempotent
 def manage_expenses(request, group_id):
     """Handle GET and POST for expenses in a group"""
     group = ExpenseGroup.objects.filter(id=group_id, members__in=[request.user]).first()
@@ -105,124 +136,379 @@ def manage_expenses(request, group_id):
         return Response({'error': 'Group not found or access denied'}, status=status.HTTP_404_NOT_FOUND)
 
     if request.method == 'GET':
-        # Fetch all expenses for the group
-        expenses = Expense.objects.filter(group=group)
-        serializer = ExpenseSerializer(expenses, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        # The page only changes when the group does, so revalidation never touches the expenses
+        current_etag = etag('expenses', group.id, group.version, request.query_params.get('cursor'), request.query_params.get('limit'))
+        if not_modified(request, current_etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': current_etag})
+
+        # Fetch one page of the group's expenses, oldest first
+        expenses = Expense.objects.filter(group=group).prefetch_related(
+            Prefetch('contributions', queryset=Contribution.objects.select_related('user')),
+            Prefetch('shares', queryset=Share.objects.select_related('user')),
+        )
+        try:
+            page, next_cursor = paginate(request, expenses, ['created_at', 'id'])
+        except InvalidCursor as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = ExpenseListSerializer(page, many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK, headers={'ETag': current_etag, **next_page_headers(request, next_cursor)})
 
     if request.method == 'POST':
         # Handle adding an expense
-        description = request.data.get('description')
-        amount = request.data.get('amount')
-        split_type = request.data.get('split_type')
-        contributions = request.data.get('contributions', [])
+        # Storing the split bumps the group's version through the balance ledger
+        expense, error = _add_expense(group, request.user, request.data)
+        if error:
+            return error
+        return Response(ExpenseSerializer(_with_contributions(expense)).data, status=status.HTTP_201_CREATED)
 
-        if not description or not amount or not split_type:
-            return Response({'error': 'Description, amount, and split type are required'}, status=status.HTTP_400_BAD_REQUEST)
+#Helpers for writing expenses, shared with the batch endpoint (see batch.py)
+def _expense_fields(data, expense=None):
+    """Validate an expense's description, amount and split type, defaulting to the expense's when editing.
 
-        if split_type not in ['equal', 'custom']:
-            return Response({'error': 'Invalid split type'}, status=status.HTTP_400_BAD_REQUEST)
+    Returns (description, amount as Decimal, split_type, error response).
+    """
+    description = data.get('description', expense.description if expense else None)
+    amount = data.get('amount', expense.amount if expense else None)
+    split_type = data.get('split_type', expense.split_type if expense else None)
 
-        # Convert amount to Decimal
-        try:
-            amount = Decimal(amount)
-        except Exception:
-            return Response({'error': 'Invalid amount format'}, status=status.HTTP_400_BAD_REQUEST)
+    if not description or not amount or not split_type:
+        return None, None, None, Response({'error': 'Description, amount, and split type are required'}, status=status.HTTP_400_BAD_REQUEST)
+
+    if split_type not in dict(Expense.SPLIT_TYPE_CHOICES):
+        return None, None, None, Response({'error': 'Invalid split type'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Create the expense
+    # Convert amount to Decimal
+    try:
+        amount = Decimal(amount)
+    except Exception:
+        return None, None, None, Response({'error': 'Invalid amount format'}, status=status.HTTP_400_BAD_REQUEST)
+    return description, amount, split_type, None
+
+def _add_expense(group, payer, data, members=None):
+    """Validate and create an expense with its contributions and shares, returning (expense, error response)"""
+    description, amount, split_type, error = _expense_fields(data)
+    if error:
+        return None, error
+
+    # Work out who paid and who owes what before writing anything
+    paid, owed, error = _resolve_split(group, payer, split_type, amount, data, members)
+    if error:
+        return None, error
+
+    with transaction.atomic():
         expense = Expense.objects.create(group=group, description=description, amount=amount, split_type=split_type)
+        _store_split(expense, paid, owed)
+        Change.objects.record(group.id, 'expense', [expense.id])
+    return expense, None
 
-        # Logic for splitting
-        if split_type == 'equal':
-            # Distribute the expense equally among members
-            for member in group.members.all():
-                if member == request.user:
-                    Contribution.objects.create(expense=expense, user=member, amount=amount)
-                else:
-                    Contribution.objects.create(expense=expense, user=member, amount=0)
-
-        elif split_type == 'custom':
-            # Contributions are mandatory for custom splits
-            if not contributions:
-                return Response({'error': 'Contributions are required for custom split'}, status=status.HTTP_400_BAD_REQUEST)
-            #Check if contributions sum up to total expense
-            total_contribution = sum(Decimal(c['amount']) for c in contributions)
-            if total_contribution != amount:
-                return Response({'error': 'Contributions do not match the total amount'}, status=status.HTTP_400_BAD_REQUEST)
-
-            # Store the contributions
-            errors = []
-            for c in contributions:
-                username = c.get('username')
-                amount = Decimal(c.get('amount'))
-                if not username or amount is None:
-                    errors.append(f"Invalid contribution data: {c}")
-                    continue
-
-                try:
-                    user = User.objects.get(username=username)
-                    if user not in group.members.all():
-                        errors.append(f"User {username} is not a member of the group")
-                        continue
-                    Contribution.objects.create(expense=expense, user=user, amount=amount)
-                except User.DoesNotExist:
-                    errors.append(f"User {username} not found")
-
-            # If there are errors, delete the expense and return the errors
-            if errors:
-                expense.delete()
-                return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
-
-        return Response(ExpenseSerializer(expense).data, status=status.HTTP_201_CREATED)
+def _edit_expense(group, expense, payer, data, members=None):
+    """Validate and apply an edit, replacing the expense's contributions and shares; returns an error response or None"""
+    description, amount, split_type, error = _expense_fields(data, expense)
+    if error:
+        return error
+
+    paid, owed, error = _resolve_split(group, payer, split_type, amount, data, members)
+    if error:
+        return error
+
+    with transaction.atomic():
+        expense.description = description
+        expense.amount = amount
+        expense.split_type = split_type
+        expense.save()
+
+        # Replace the old contributions and shares
+        MemberBalance.objects.reverse_expense(expense)
+        Contribution.objects.filter(expense=expense).delete()
+        Share.objects.filter(expense=expense).delete()
+        _store_split(expense, paid, owed)
+        Change.objects.record(group.id, 'expense', [expense.id])
+    return None
+
+def _delete_expense(expense):
+    """Delete an expense and leave a tombstone for it in the change log"""
+    expense_id = expense.id
+    with transaction.atomic():
+        expense.delete()
+        Change.objects.record(expense.group_id, 'expense', [expense_id], 'delete')
+
+def _record_members_changed(group_id, added_ids=(), removed_ids=()):
+    """Log a membership change: the group for its members, a resync of it for each added user, whose clients
+    have none of its earlier expenses, and a tombstone of it for each removed user"""
+    with Change.objects.deferred():
+        Change.objects.record(group_id, 'group', [group_id])
+        Change.objects.record(group_id, 'group', [group_id], 'resync', user_ids=added_ids)
+        Change.objects.record(group_id, 'group', [group_id], 'delete', user_ids=removed_ids)
+
+def _member_ids(group):
+    """{username: user id} of a group's members, in user id order"""
+    return dict(group.members.order_by('id').values_list('username', 'id'))
+
+#Helpers for writing contributions and shares with a fixed number of queries
+def _resolve_split(group, payer, split_type, amount, data, members=None):
+    """Resolve an expense's split to (paid, owed, error response), with paid and owed as (user_id, amount) pairs.
+
+    Custom splits say who paid through contributions and owe nothing individually: their cost is shared by the
+    current members (see balances.py). Every other split type is paid by the payer and split into shares by
+    splitter.py, between all members unless participants or splits name some of them.
+    members is the group's _member_ids(), looked up when not given.
+    """
+    if members is None:
+        members = _member_ids(group)
+    if split_type == 'custom':
+        contributions = data.get('contributions', [])
+        # Contributions are mandatory for custom splits
+        if not contributions:
+            return None, None, Response({'error': 'Contributions are required for custom split'}, status=status.HTTP_400_BAD_REQUEST)
+        #Check if contributions sum up to total expense
+        total_contribution = sum(Decimal(c['amount']) for c in contributions)
+        if total_contribution != amount:
+            return None, None, Response({'error': 'Contributions do not match the total amount'}, status=status.HTTP_400_BAD_REQUEST)
+        paid, errors = _resolve_contributions(contributions, members)
+        if errors:
+            return None, None, Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+        return paid, [], None
+
+    if split_type == 'equal':
+        splits = [{'username': username} for username in data.get('participants') or []]
+    else:
+        splits = data.get('splits') or []
+        if not splits:
+            return None, None, Response({'error': f'Splits are required for {split_type} split'}, status=status.HTTP_400_BAD_REQUEST)
+
+    participants, errors = _resolve_splits(members, splits, SPLIT_FIELDS[split_type])
+    if errors:
+        return None, None, Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        shares = split(split_type, to_cents(amount), [value for _, value in participants])
+    except SplitError as e:
+        return None, None, Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    owed = [(user_id, to_decimal(cents)) for (user_id, _), cents in zip(participants, shares)]
+    return [(payer.id, amount)], owed, None
+
+def _resolve_splits(member_ids, splits, field):
+    """Resolve split entries to (user_id, value of field) pairs, or every member in id order when there are none"""
+    if not splits:
+        return [(member_id, None) for member_id in member_ids.values()], []
+
+    participants = []
+    errors = []
+    seen = set()
+    for s in splits:
+        username = s.get('username') if isinstance(s, dict) else None
+        value = s.get(field) if field and username else None
+        if not username or (field and value is None):
+            errors.append(f"Invalid split data: {s}")
+        elif username not in member_ids:
+            errors.append(f"User {username} is not a member of the group")
+        elif username in seen:
+            errors.append(f"User {username} appears more than once")
+        else:
+            seen.add(username)
+            participants.append((member_ids[username], value))
+    return participants, errors
+
+def _resolve_contributions(contributions, member_ids):
+    """Resolve custom split contributions to (user_id, amount) pairs, collecting errors"""
+    # Only usernames outside the group need a lookup, to tell unknown users from non-members
+    outsiders = {c.get('username') for c in contributions if c.get('username') and c.get('username') not in member_ids}
+    known = set(User.objects.filter(username__in=outsiders).values_list('username', flat=True)) if outsiders else set()
+
+    paid = []
+    errors = []
+    for c in contributions:
+        username = c.get('username')
+        amount = Decimal(c.get('amount'))
+        if not username or amount is None:
+            errors.append(f"Invalid contribution data: {c}")
+        elif username not in member_ids and username not in known:
+            errors.append(f"User {username} not found")
+        elif username not in member_ids:
+            errors.append(f"User {username} is not a member of the group")
+        elif amount < 0:
+            errors.append(f"Contribution amount for {username} must not be negative")
+        else:
+            paid.append((member_ids[username], amount))
+    return paid, errors
+
+def _store_split(expense, paid, owed):
+    """Insert all contributions and shares at once and apply them to the balance ledger"""
+    Contribution.objects.bulk_create([
+        Contribution(expense=expense, group_id=expense.group_id, user_id=user_id, amount=amount) for user_id, amount in paid
+    ])
+    if owed:
+        Share.objects.bulk_create([
+            Share(expense=expense, group_id=expense.group_id, user_id=user_id, amount=amount) for user_id, amount in owed
+        ])
+    paid_deltas = defaultdict(Decimal)
+    for user_id, amount in paid:
+        paid_deltas[user_id] += amount
+    MemberBalance.objects.apply_deltas(expense.group_id, paid_deltas, spend_day(expense.created_at), owed=dict(owed))
+
+def _with_contributions(expense):
+    """Reload an expense with everything ExpenseSerializer needs"""
+    return Expense.objects.select_related('group').prefetch_related('group__members', 'contributions__user', 'shares__user').get(pk=expense.pk)
+
+#Importing many expenses at once
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def bulk_import_expenses(request, group_id):
+    """Import expenses into a group from a CSV or NDJSON upload"""
+    group = ExpenseGroup.objects.filter(id=group_id, members__in=[request.user]).first()
+    if not group:
+        return Response({'error': 'Group not found or access denied'}, status=status.HTTP_404_NOT_FOUND)
+
+    upload = request.FILES.get('file')
+    if not upload:
+        return Response({'error': 'A CSV or NDJSON file is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+    file_format = request.query_params.get('file_format') or detect_format(upload)
+    if file_format not in IMPORT_FORMATS:
+        return Response({'error': 'Unsupported file format. Use "csv" or "ndjson"'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        created, errors = import_expenses(group, iter_rows(upload, file_format), request.user.username)
+    except (UnicodeDecodeError, csv.Error) as e:
+        return Response({'error': f'Could not read the uploaded file: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+
+    response_status = status.HTTP_201_CREATED if created or not errors else status.HTTP_400_BAD_REQUEST
+    return Response({'created': created, 'errors': errors}, status=response_status)
+
+#Exporting a group's expenses
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@replica_reads
+def export_expenses(request, group_id):
+    """Stream every expense of a group with its contributions as CSV or NDJSON"""
+    group = ExpenseGroup.objects.filter(id=group_id, members__in=[request.user]).first()
+    if not group:
+        return Response({'error': 'Group not found or access denied'}, status=status.HTTP_404_NOT_FOUND)
+
+    file_format = request.query_params.get('file_format', 'csv')
+    if file_format not in EXPORT_FORMATS:
+        return Response({'error': 'Unsupported file format. Use "csv" or "ndjson"'}, status=status.HTTP_400_BAD_REQUEST)
+
+    # The rows are read while the response streams, after @replica_reads has reset, so pick the database now
+    expenses = iter_expenses(group, using=router.db_for_read(Expense))
+    response = StreamingHttpResponse(render_export(expenses, file_format), content_type=EXPORT_FORMATS[file_format])
+    response['Content-Disposition'] = f'attachment; filename="group-{group.id}-expenses.{file_format}"'
+    return response
 
 #Fetching group summary
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@replica_reads
 def group_summary(request, group_id):
     """Get a summary of balances for a group"""
     group = ExpenseGroup.objects.filter(id=group_id, members__in=[request.user]).first()
     if not group:
         return Response({'error': 'Group not found or access denied'}, status=status.HTTP_404_NOT_FOUND)
 
-    # Calculate total contributions and balances
-    contributions = Contribution.objects.filter(expense__group=group)
-    total_expense = contributions.aggregate(Sum('amount'))['amount__sum'] or Decimal(0)
-    equal_share = total_expense / group.members.count()
+    current_etag = etag('group_summary', group.id, group.version)
+    if not_modified(request, current_etag):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': current_etag})
+
+    owes = cached('group_summary', f'group_summary:{group.id}:{group.version}', lambda: _group_summary(group))
+    return Response({'balances': owes}, status=status.HTTP_200_OK, headers={'ETag': current_etag})
 
-    balances = {}
-    for member in group.members.all():
-        paid = contributions.filter(user=member).aggregate(Sum('amount'))['amount__sum'] or Decimal(0)
-        balances[member.username] = round(paid - equal_share, 2)
+def _group_summary(group):
+    # Calculate every member's balance with a fixed number of queries
+    return _owes(member_balances(group))
 
-    # Convert balances into "who owes whom" format
+def _owes(member_balances):
+    # Convert balances in cents into "who owes whom" format
     owes = []
-    for user, balance in balances.items():
+    for user, balance in member_balances.items():
         if balance > 0:
-            owes.append({'owed_to': user, 'amount': balance})
+            owes.append({'owed_to': user, 'amount': to_decimal(balance)})
         elif balance < 0:
-            owes.append({'owed_by': user, 'amount': abs(balance)})
+            owes.append({'owed_by': user, 'amount': to_decimal(-balance)})
+    return owes
 
-    return Response({'balances': owes}, status=status.HTTP_200_OK)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@replica_reads
+def settle_plan(request, group_id):
+    """Suggest a short list of payments that settles every balance in a group"""
+    group = ExpenseGroup.objects.filter(id=group_id, members__in=[request.user]).first()
+    if not group:
+        return Response({'error': 'Group not found or access denied'}, status=status.HTTP_404_NOT_FOUND)
+
+    mode = request.query_params.get('mode', 'greedy')
+    if mode not in ['greedy', 'exact']:
+        return Response({'error': 'Invalid mode. Use "greedy" or "exact"'}, status=status.HTTP_400_BAD_REQUEST)
+
+    balances = member_balances(group)
+    # The exact planner is exponential, so large groups always get the greedy plan
+    if mode == 'exact' and len(balances) > EXACT_MAX_MEMBERS:
+        mode = 'greedy'
+
+    transfers = settle_up_cents(balances, exact=mode == 'exact')
+    return Response({
+        'mode': mode,
+        'transfers': [{'from': payer, 'to': payee, 'amount': to_decimal(amount)} for payer, payee, amount in transfers]
+    }, status=status.HTTP_200_OK)
+
+#Spending over time
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@replica_reads
+def group_stats(request, group_id):
+    """Amounts paid per day, week or month in a group, in total and per member"""
+    group = ExpenseGroup.objects.filter(id=group_id, members__in=[request.user]).first()
+    if not group:
+        return Response({'error': 'Group not found or access denied'}, status=status.HTTP_404_NOT_FOUND)
+
+    interval = request.query_params.get('interval', 'day')
+    if interval not in SPEND_INTERVALS:
+        return Response({'error': 'Invalid interval. Use "day", "week" or "month"'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        start, end = (date.fromisoformat(value) if value else None for value in (request.query_params.get('start'), request.query_params.get('end')))
+    except ValueError:
+        return Response({'error': 'Invalid date. Use YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+
+    current_etag = etag('group_stats', group.id, group.version, interval, start, end)
+    if not_modified(request, current_etag):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': current_etag})
+
+    series = cached('group_stats', f'group_stats:{group.id}:{group.version}:{interval}:{start}:{end}', lambda: spend_series(group, interval, start, end))
+    return Response(series, status=status.HTTP_200_OK, headers={'ETag': current_etag})
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@replica_reads
 def fetch_users(request):
-    """Fetch all registered users"""
-    users = User.objects.all()
-    serializer = UserSerializer(users, many=True)
-    return Response(serializer.data, status=200)
+    """Search users by username prefix, or by email prefix when ?q= contains an @, a page at a time"""
+    query = normalise(request.query_params.get('q', ''))
+    key = (query, request.query_params.get('cursor'), request.query_params.get('limit'))
+    page = hot_prefixes.get(key)
+    count_lookup('fetch_users', page)
+    if page is None:
+        entries, ordering = entries_matching(query)
+        try:
+            entries, next_cursor = paginate(request, entries, ordering, DIRECTORY_LIMIT, DIRECTORY_MAX_LIMIT)
+        except InvalidCursor as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        page = (list(UserSerializer([entry.user for entry in entries], many=True).data), next_cursor)
+        hot_prefixes.set(key, page)
+    users, next_cursor = page
+    return Response(users, status=200, headers=next_page_headers(request, next_cursor))
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@replica_reads
 def group_members(request, group_id):
     """Fetch members of a group"""
     group = ExpenseGroup.objects.filter(id=group_id, members__in=[request.user]).first()
     if not group:
         return Response({'error': 'Group not found or access denied'}, status=status.HTTP_404_NOT_FOUND)
 
-    members = group.members.all()
-    serializer = UserSerializer(members, many=True)
-    return Response({'members': serializer.data}, status=status.HTTP_200_OK)
+    current_etag = etag('group_members', group.id, group.version)
+    if not_modified(request, current_etag):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': current_etag})
+
+    members = cached('group_members', f'group_members:{group.id}:{group.version}', lambda: UserSerializer(group.members.all(), many=True).data)
+    return Response({'members': members}, status=status.HTTP_200_OK, headers={'ETag': current_etag})
 
 @api_view(['PATCH', 'DELETE'])
 @permission_classes([IsAuthenticated])
@@ -239,12 +525,18 @@ def edit_or_delete_group(request, group_id):
         if not new_name:
             return Response({'error': 'Group name is required'}, status=status.HTTP_400_BAD_REQUEST)
         group.name = new_name
-        group.save()
+        with transaction.atomic():
+            group.save()
+            ExpenseGroup.objects.bump(group.id)
+            Change.objects.record(group.id, 'group', [group.id])
         return Response(ExpenseGroupSerializer(group).data, status=status.HTTP_200_OK)
 
     elif request.method == 'DELETE':
-        # Delete the group
-        group.delete()
+        # Delete the group, leaving each member a tombstone as the group's own changes stop being visible to them
+        member_ids = list(group.members.values_list('id', flat=True))
+        with transaction.atomic():
+            group.delete()
+            Change.objects.record(group_id, 'group', [group_id], 'delete', user_ids=member_ids)
         return Response({'message': 'Group deleted successfully'}, status=status.HTTP_200_OK)
 
 @api_view(['PATCH', 'DELETE'])
@@ -262,62 +554,14 @@ def edit_or_delete_expense(request, group_id, expense_id):
 
     if request.method == 'PATCH':
         # Edit expense details
-        description = request.data.get('description', expense.description)
-        amount = request.data.get('amount', expense.amount)
-        split_type = request.data.get('split_type', expense.split_type)
-
-        if not description or not amount or not split_type:
-            return Response({'error': 'Description, amount, and split type are required'}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Validate split type
-        if split_type not in ['equal', 'custom']:
-            return Response({'error': 'Invalid split type'}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Convert amount to Decimal
-        try:
-            amount = Decimal(amount)
-        except Exception:
-            return Response({'error': 'Invalid amount format'}, status=status.HTTP_400_BAD_REQUEST)
-
-        expense.description = description
-        expense.amount = amount
-        expense.split_type = split_type
-        expense.save()
-
-        # Update contributions if necessary
-        if split_type == 'equal':
-            Contribution.objects.filter(expense=expense).delete()
-            for member in group.members.all():
-                if member == request.user:
-                    Contribution.objects.create(expense=expense, user=member, amount=amount)
-                else:
-                    Contribution.objects.create(expense=expense, user=member, amount=0)
-
-        elif split_type == 'custom':
-            contributions = request.data.get('contributions', [])
-            if not contributions:
-                return Response({'error': 'Contributions are required for custom split'}, status=status.HTTP_400_BAD_REQUEST)
-
-            total_contribution = sum(Decimal(c['amount']) for c in contributions)
-            if total_contribution != amount:
-                return Response({'error': 'Contributions do not match the total amount'}, status=status.HTTP_400_BAD_REQUEST)
-
-            Contribution.objects.filter(expense=expense).delete()
-            for c in contributions:
-                username = c.get('username')
-                user_amount = Decimal(c.get('amount'))
-                try:
-                    user = User.objects.get(username=username)
-                    if user in group.members.all():
-                        Contribution.objects.create(expense=expense, user=user, amount=user_amount)
-                except User.DoesNotExist:
-                    return Response({'error': f'User {username} not found'}, status=status.HTTP_400_BAD_REQUEST)
-
-        return Response(ExpenseSerializer(expense).data, status=status.HTTP_200_OK)
+        error = _edit_expense(group, expense, request.user, request.data)
+        if error:
+            return error
+        return Response(ExpenseSerializer(_with_contributions(expense)).data, status=status.HTTP_200_OK)
 
     elif request.method == 'DELETE':
         # Delete the expense and associated contributions
-        expense.delete()
+        _delete_expense(expense)
         return Response({'message': 'Expense deleted successfully'}, status=status.HTTP_200_OK)
 
 @api_view(['PATCH'])
@@ -358,97 +602,163 @@ def edit_group_members(request, group_id):
         return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
 
     if action == 'add':
-        group.members.add(*users_to_modify)
+        with transaction.atomic():
+            group.members.add(*users_to_modify)
+            ExpenseGroup.objects.bump(group.id)
+            _record_members_changed(group.id, added_ids=[user.id for user in users_to_modify])
         message = f'Successfully added {len(users_to_modify)} user(s) to the group'
     else:  # action == 'remove'
-        group.members.remove(*users_to_modify)
+        with transaction.atomic():
+            group.members.remove(*users_to_modify)
+            ExpenseGroup.objects.bump(group.id)
+            _record_members_changed(group.id, removed_ids=[user.id for user in users_to_modify])
         message = f'Successfully removed {len(users_to_modify)} user(s) from the group'
 
     return Response({'message': message, 'modified_users': [user.username for user in users_to_modify]}, status=status.HTTP_200_OK)
 
-from collections import defaultdict
-
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@replica_reads
 def overall_balance_summary(request):
     """Get a summary of balances for the user across all groups"""
     user = request.user
-    global_owed_by = defaultdict(Decimal)  # Tracks who owes the user
-    global_owes = defaultdict(Decimal)     # Tracks whom the user owes
-    total_owed_to_user = Decimal(0)
-    total_owed_by_user = Decimal(0)
-
-    groups = ExpenseGroup.objects.filter(members=user)
-
-    for group in groups:
-        contributions = Contribution.objects.filter(expense__group=group)
-        total_expense = contributions.aggregate(total=Sum('amount'))['total'] or Decimal(0)
-        member_count = group.members.count()
-        if member_count == 0:
+    versions = dict(user.expense_groups.values_list('id', 'version'))
+    key = user_groups_key('overall_balance_summary', user.id, versions)
+    return Response(cached('overall_balance_summary', key, lambda: _overall_balance_summary(user)))
+
+def _overall_balance_summary(user):
+    # Balances for every group the user belongs to, computed in memory from two queries
+    return _summarise_overall(user.username, member_balances_for_user(user))
+
+def _summarise_overall(username, balances_by_group):
+    global_owed_by = defaultdict(int)  # Cents each member owes the user
+    global_owes = defaultdict(int)     # Cents the user owes each member
+    total_owed_to_user = 0
+    total_owed_by_user = 0
+
+    for group_balances in balances_by_group.values():
+        user_balance = group_balances.get(username, 0)
+        if not user_balance:
             continue
-        equal_share = total_expense / member_count
-
-        # Calculate each member's balance in the group
-        member_balances = {}
-        for member in group.members.all():
-            paid = contributions.filter(user=member).aggregate(total=Sum('amount'))['total'] or Decimal(0)
-            balance = paid - equal_share
-            member_balances[member.username] = balance
-
-        user_balance = member_balances.get(user.username, Decimal(0))
-
-        if user_balance > 0:
-            # User is owed money; calculate shares from members with negative balances
-            sum_neg = Decimal(0)
-            owed_by_members = {}
-            for username, balance in member_balances.items():
-                if username == user.username:
-                    continue
-                if balance < 0:
-                    owed_by_members[username] = balance
-                    sum_neg += balance
-            sum_neg_abs = abs(sum_neg)
-            if sum_neg_abs == 0:
-                continue
-            user_owed = user_balance
-            total_owed_to_user += user_owed
-            for username, balance in owed_by_members.items():
-                share = (abs(balance) / sum_neg_abs) * user_owed
-                global_owed_by[username] += share
-
-        elif user_balance < 0:
-            # User owes money; calculate shares to members with positive balances
-            user_owes_abs = abs(user_balance)
-            sum_pos = Decimal(0)
-            owes_members = {}
-            for username, balance in member_balances.items():
-                if username == user.username:
-                    continue
-                if balance > 0:
-                    owes_members[username] = balance
-                    sum_pos += balance
-            if sum_pos == 0:
-                continue
-            total_owed_by_user += user_owes_abs
-            for username, balance in owes_members.items():
-                share = (balance / sum_pos) * user_owes_abs
-                global_owes[username] += share
+
+        # Spread the user's balance over the members on the other side, in proportion to their balances
+        owed_to_user = user_balance > 0
+        counterparts = [
+            (member, abs(balance)) for member, balance in group_balances.items()
+            if member != username and (balance < 0 if owed_to_user else balance > 0)
+        ]
+        if not counterparts:
+            continue
+        shares = allocate(abs(user_balance), [weight for _, weight in counterparts])
+        totals = global_owed_by if owed_to_user else global_owes
+        for (member, _), share in zip(counterparts, shares):
+            totals[member] += share
+        if owed_to_user:
+            total_owed_to_user += user_balance
+        else:
+            total_owed_by_user -= user_balance
 
     # Prepare the response data
     owes_list = [
-        {"owed_to": username, "amount": round(amount, 2)}
+        {"owed_to": username, "amount": to_decimal(amount)}
         for username, amount in global_owes.items()
     ]
     owed_by_list = [
-        {"owed_by": username, "amount": round(amount, 2)}
+        {"owed_by": username, "amount": to_decimal(amount)}
         for username, amount in global_owed_by.items()
     ]
 
-    return Response({
-        "total_owed_by_user": round(total_owed_by_user, 2),
-        "total_owed_to_user": round(total_owed_to_user, 2),
+    return {
+        "total_owed_by_user": to_decimal(total_owed_by_user),
+        "total_owed_to_user": to_decimal(total_owed_to_user),
         "owes": owes_list,
         "owed_by": owed_by_list
-    })
+    }
+
+#Incremental sync for offline-first clients
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@replica_reads
+def sync_changes(request):
+    """Changes to the user's groups and expenses after the since cursor, with tombstones for deletions"""
+    # Every change up to the log's position has committed, so a cursor at it can't skip one that commits later
+    last_id, purged_through = ChangeSequence.objects.position()
+    since = request.query_params.get('since')
+    if not since:
+        # Where a client starts syncing from, once it has loaded everything in full
+        return Response({'changes': [], 'balances': {}, 'cursor': encode_cursor([last_id]), 'has_more': False})
 
-   
\ No newline at end of file
+    try:
+        since = decode_cursor(since, Change, ['id'])[0]
+        limit = parse_limit(request)
+    except InvalidCursor as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    if since < purged_through:
+        return Response({'error': 'Changes after this cursor have been purged. Reload everything and sync from a new cursor'}, status=status.HTTP_410_GONE)
+
+    group_ids = list(request.user.expense_groups.values_list('id', flat=True))
+    rows = list(Change.objects.visible_to(request.user, group_ids).filter(id__gt=since, id__lte=last_id).order_by('id')[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    # Without more to come the cursor skips ahead past changes to other users' groups
+    cursor = rows[-1].id if has_more else max(since, last_id)
+
+    changes = _sync_changes(rows, group_ids)
+    changed_groups = {change['group'] for change in changes}
+    balances = {
+        group_id: {username: to_decimal(balance) for username, balance in group_balances.items()}
+        for group_id, group_balances in (member_balances_for_user(request.user) if changed_groups else {}).items()
+        if group_id in changed_groups
+    }
+    return Response({'changes': changes, 'balances': balances, 'cursor': encode_cursor([cursor]), 'has_more': has_more})
+
+def _sync_changes(rows, group_ids):
+    """The latest change to each object in rows, with the current data of those that still exist and are visible"""
+    latest = {}
+    resync = set()
+    for change in rows:
+        # Re-inserting moves the object to its latest position
+        latest.pop((change.kind, change.object_id), None)
+        latest[(change.kind, change.object_id)] = change
+        # A resync stays due through later changes to the group, until it is gone
+        if change.action == 'resync':
+            resync.add(change.object_id)
+        elif change.kind == 'group' and change.action == 'delete':
+            resync.discard(change.object_id)
+
+    upserted = defaultdict(set)
+    for change in latest.values():
+        if change.action != 'delete':
+            upserted[change.kind].add(change.object_id)
+    objects = {
+        'group': ExpenseGroup.objects.filter(id__in=upserted['group'] & set(group_ids)).prefetch_related('members').in_bulk(),
+        'expense': Expense.objects.filter(id__in=upserted['expense'], group_id__in=group_ids).prefetch_related(
+            Prefetch('contributions', queryset=Contribution.objects.select_related('user')),
+            Prefetch('shares', queryset=Share.objects.select_related('user')),
+        ).in_bulk(),
+    }
+    serializers = {'group': ExpenseGroupSerializer, 'expense': ExpenseListSerializer}
+
+    changes = []
+    for change in latest.values():
+        obj = objects[change.kind].get(change.object_id) if change.action != 'delete' else None
+        entry = {'kind': change.kind, 'id': change.object_id, 'group': change.group_id}
+        if obj is None:
+            # Deleted, or no longer visible to the user, since the change was made
+            changes.append({**entry, 'action': 'delete'})
+        else:
+            action = 'resync' if change.kind == 'group' and change.object_id in resync else 'upsert'
+            changes.append({**entry, 'action': action, 'data': serializers[change.kind](obj).data})
+    return changes
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def cache_statistics(request):
+    """Hit/miss counters of the response cache, per endpoint, for this worker process"""
+    return Response(cache_stats(), status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def metrics(request):
+    """Per-endpoint latency, database time and query-count histograms for this worker process, in Prometheus format"""
+    return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')